@@ -0,0 +1,318 @@
+"""
+Local BMC answering RMCP+ session setup and IPMI commands for tests.
+Commands are functions in 'commands' keyed by (netfn, cmd), they
+take request data and return (completion code, data)
+"""
+
+import hashlib
+import hmac
+import os
+import socket
+import struct
+import threading
+
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+DIGESTS = {1: (hashlib.sha1, 12), 3: (hashlib.sha256, 16)}
+
+
+def full_sensor_record(record_id, number, name, m=1, b=0, k1=0, k2=0,
+                       unit=1, analog=0, owner=0x20):
+    body = struct.pack('BBB', owner, 0, number) + '\x07\x01\x7f\x68' + \
+        '\x01\x01' + '\x00' * 6 + chr(analog << 6) + chr(unit) + '\x00' + \
+        '\x00' + chr(m & 0xff) + chr((m >> 2) & 0xc0) + chr(b & 0xff) + \
+        chr((b >> 2) & 0xc0) + '\x00' + chr((k2 & 0x0f) << 4 | k1 & 0x0f) + \
+        '\x00' * 17 + chr(0xc0 | len(name)) + name
+    return struct.pack('<HBBB', record_id, 0x51, 0x01, len(body)) + body
+
+
+def sel_entry(record_id, timestamp, sensor_type, number, data1,
+              event_type=0x6f, deassertion=False):
+    return struct.pack(
+        '<HBIHBBBBBBB', record_id, 0x02, timestamp, 0x0020, 0x04,
+        sensor_type, number, event_type | (0x80 if deassertion else 0),
+        data1, 0xff, 0xff)
+
+
+class FakeSession(object):
+    pass
+
+
+class FakeBMC(object):
+
+    def __init__(self, username='admin', password='secret', power=True,
+                 addr='127.0.0.1', port=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((addr, port))
+        self.port = self.sock.getsockname()[1]
+        self.username = username
+        self.password = password
+        self.power = power
+        self.guid = os.urandom(16)
+        self.sessions = {}
+        self.opened = 0
+        self.closed = 0
+        self.received = []
+        # number of the next packets to ignore
+        self.drop = 0
+        self.silent = False
+        # SDR repository, its (addition, erase) timestamps and
+        # sensor number: (reading, threshold status)
+        self.sdr = []
+        self.sdr_stamp = (1, 0)
+        self.readings = {}
+        self.reservation = 0
+        # System Event Log and its (addition, erase) timestamps
+        self.sel = []
+        self.sel_stamp = (0, 0)
+        self.commands = {
+            (0x00, 0x01): self.chassis_status,
+            (0x06, 0x3c): self.close_session,
+            (0x0a, 0x20): self.sdr_info,
+            (0x0a, 0x22): self.reserve_sdr,
+            (0x0a, 0x23): self.get_sdr,
+            (0x04, 0x2d): self.sensor_reading,
+            (0x0a, 0x40): self.sel_info,
+            (0x0a, 0x43): self.get_sel_entry,
+        }
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def chassis_status(self, data):
+        return 0, chr(0x01 if self.power else 0x00) + '\x00\x40\x00'
+
+    def close_session(self, data):
+        bmc_id, = struct.unpack('<I', data)
+        self.closed += 1
+        self.sessions.pop(bmc_id, None)
+        return 0, ''
+
+    def sdr_info(self, data):
+        return 0, struct.pack(
+            '<BHHIIB', 0x51, len(self.sdr), 0xffff,
+            self.sdr_stamp[0], self.sdr_stamp[1], 0x02)
+
+    def reserve_sdr(self, data):
+        self.reservation += 1
+        return 0, struct.pack('<H', self.reservation)
+
+    def get_sdr(self, data):
+        reservation, record_id, offset, count = struct.unpack(
+            '<HHBB', data)
+        if offset and reservation != self.reservation:
+            return 0xc5, ''
+        ids = [struct.unpack('<H', record[:2])[0] for record in self.sdr]
+        if record_id == 0 and ids:
+            record_id = ids[0]
+        if record_id not in ids:
+            return 0xcb, ''
+        i = ids.index(record_id)
+        next_id = ids[i + 1] if i + 1 < len(ids) else 0xffff
+        record = self.sdr[i]
+        return 0, struct.pack('<H', next_id) + record[offset:offset + count]
+
+    def sensor_reading(self, data):
+        number = ord(data[0])
+        if number not in self.readings:
+            return 0xcb, ''
+        reading, status = self.readings[number]
+        return 0, struct.pack('BBBB', reading, 0xc0, status, 0x80)
+
+    def add_sel(self, *entries):
+        self.sel.extend(entries)
+        self.sel_stamp = (self.sel_stamp[0] + 1, self.sel_stamp[1])
+
+    def clear_sel(self):
+        self.sel = []
+        self.sel_stamp = (self.sel_stamp[0], self.sel_stamp[1] + 1)
+
+    def sel_info(self, data):
+        return 0, struct.pack(
+            '<BHHIIB', 0x51, len(self.sel), 0xffff,
+            self.sel_stamp[0], self.sel_stamp[1], 0x02)
+
+    def get_sel_entry(self, data):
+        reservation, record_id, offset, count = struct.unpack(
+            '<HHBB', data)
+        ids = [struct.unpack('<H', entry[:2])[0] for entry in self.sel]
+        if not ids:
+            return 0xcb, ''
+        if record_id == 0:
+            record_id = ids[0]
+        elif record_id == 0xffff:
+            record_id = ids[-1]
+        if record_id not in ids:
+            return 0xcb, ''
+        i = ids.index(record_id)
+        next_id = ids[i + 1] if i + 1 < len(ids) else 0xffff
+        return 0, struct.pack('<H', next_id) + self.sel[i]
+
+    def serve(self):
+        while True:
+            try:
+                packet, peer = self.sock.recvfrom(4096)
+            except socket.error:
+                return
+            if self.silent:
+                continue
+            if self.drop:
+                self.drop -= 1
+                continue
+            answer = self.handle(packet)
+            if answer is None:
+                continue
+            try:
+                self.sock.sendto(answer, peer)
+            except socket.error:
+                return
+
+    def close(self):
+        self.sock.close()
+
+    def packet(self, payload_type, session_id, payload, seq=0):
+        return '\x06\x00\xff\x07' + struct.pack(
+            '<BBIIH', 6, payload_type, session_id, seq, len(payload)
+        ) + payload
+
+    def handle(self, packet):
+        payload_type = ord(packet[5])
+        session_id, seq, length = struct.unpack('<IIH', packet[6:16])
+        payload = packet[16:16 + length]
+        bare = payload_type & 0x3f
+        if bare == 0x10:
+            return self.open_session(payload)
+        if bare == 0x12:
+            return self.rakp2(payload)
+        if bare == 0x14:
+            return self.rakp4(payload)
+        if bare == 0x00:
+            return self.ipmi(packet, payload_type, session_id, payload)
+
+    def open_session(self, payload):
+        tag, privilege, console_id = struct.unpack('<BBxxI', payload[:8])
+        algs = [ord(payload[i]) for i in (12, 20, 28)]
+        session = FakeSession()
+        session.console_id = console_id
+        session.bmc_id = struct.unpack('<I', os.urandom(4))[0] | 1
+        session.auth, session.integrity, session.conf = algs
+        session.active = False
+        session.seq = 0
+        supported = (
+            session.auth in DIGESTS and session.integrity in (0, 1, 4)
+            and (session.conf == 0 or (session.conf == 1 and AES)))
+        status = 0 if supported else 0x11
+        if supported:
+            self.sessions[session.bmc_id] = session
+        answer = struct.pack(
+            '<BBBxII', tag, status, privilege, console_id, session.bmc_id
+        ) + payload[8:32]
+        return self.packet(0x11, 0, answer)
+
+    def rakp2(self, payload):
+        tag, bmc_id = struct.unpack('<BxxxI', payload[:8])
+        session = self.sessions.get(bmc_id)
+        if session is None:
+            return self.packet(0x13, 0, struct.pack('<BBxxI', tag, 2, 0))
+        session.rm = payload[8:24]
+        session.role = ord(payload[24])
+        username = payload[28:28 + ord(payload[27])]
+        if username != self.username:
+            return self.packet(0x13, 0, struct.pack(
+                '<BBxxI', tag, 0x0d, session.console_id))
+        digest, session.icv = DIGESTS[session.auth]
+        session.digest = digest
+        session.rc = os.urandom(16)
+        user = chr(session.role) + chr(len(username)) + username
+        code = hmac.new(
+            self.password,
+            struct.pack('<II', session.console_id, bmc_id) + session.rm +
+            session.rc + self.guid + user,
+            digest
+        ).digest()
+        session.sik = hmac.new(
+            self.password, session.rm + session.rc + user, digest).digest()
+        session.user = user
+        return self.packet(0x13, 0, struct.pack(
+            '<BBxxI', tag, 0, session.console_id
+        ) + session.rc + self.guid + code)
+
+    def rakp4(self, payload):
+        tag, bmc_id = struct.unpack('<BxxxI', payload[:8])
+        session = self.sessions.get(bmc_id)
+        expected = hmac.new(
+            self.password,
+            session.rc + struct.pack('<I', session.console_id) +
+            session.user,
+            session.digest
+        ).digest()
+        if payload[8:] != expected:
+            return self.packet(0x15, 0, struct.pack(
+                '<BBxxI', tag, 0x0f, session.console_id))
+        session.active = True
+        self.opened += 1
+        session.k1 = hmac.new(
+            session.sik, '\x01' * 20, session.digest).digest()
+        session.k2 = hmac.new(
+            session.sik, '\x02' * 20, session.digest).digest()
+        icv = hmac.new(
+            session.sik,
+            session.rm + struct.pack('<I', bmc_id) + self.guid,
+            session.digest
+        ).digest()[:session.icv]
+        return self.packet(0x15, 0, struct.pack(
+            '<BBxxI', tag, 0, session.console_id) + icv)
+
+    def ipmi(self, packet, payload_type, bmc_id, payload):
+        session = self.sessions.get(bmc_id)
+        if session is None or not session.active:
+            return None
+        if session.integrity:
+            code = hmac.new(
+                session.k1, packet[4:-session.icv], session.digest
+            ).digest()[:session.icv]
+            if code != packet[-session.icv:]:
+                return None
+        if payload_type & 0x80:
+            payload = AES.new(
+                session.k2[:16], AES.MODE_CBC, payload[:16]
+            ).decrypt(payload[16:])
+            payload = payload[:-(ord(payload[-1]) + 1)]
+        netfn = ord(payload[1]) >> 2
+        rq_seq = ord(payload[4])
+        cmd = ord(payload[5])
+        data = payload[6:-1]
+        self.received.append((netfn, cmd, data))
+        handler = self.commands.get((netfn, cmd))
+        if handler is None:
+            code, answer = 0xc1, ''
+        else:
+            code, answer = handler(data)
+        header = chr(0x81) + chr((netfn | 1) << 2)
+        body = chr(0x20) + chr(rq_seq) + chr(cmd) + chr(code) + answer
+        reply = header + chr(-sum(bytearray(header)) & 0xff) + body + \
+            chr(-sum(bytearray(body)) & 0xff)
+        reply_type = 0x00
+        if session.conf:
+            iv = os.urandom(16)
+            pad = -(len(reply) + 1) % 16
+            reply += ''.join(chr(i) for i in range(1, pad + 1)) + chr(pad)
+            reply = iv + AES.new(
+                session.k2[:16], AES.MODE_CBC, iv).encrypt(reply)
+            reply_type |= 0x80
+        if session.integrity:
+            reply_type |= 0x40
+        session.seq += 1
+        answer = self.packet(
+            reply_type, session.console_id, reply, session.seq)
+        if session.integrity:
+            pad = -(len(answer) - 2) % 4
+            answer += '\xff' * pad + chr(pad) + '\x07'
+            answer += hmac.new(
+                session.k1, answer[4:], session.digest
+            ).digest()[:session.icv]
+        return answer
@@ -0,0 +1,125 @@
+"""
+Local Redfish service with one computer system for tests. It speaks
+plain HTTP/1.1 with keep-alive and counts connections and sessions
+"""
+
+import BaseHTTPServer
+import SocketServer
+import json
+import os
+import threading
+import time
+
+SYSTEM = '/redfish/v1/Systems/1'
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, status, body=None, headers=None):
+        data = json.dumps(body) if body is not None else ''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if self.server.hang_up:
+            # closed without 'Connection: close' like idle connections
+            self.close_connection = 1
+
+    def authorized(self):
+        return self.headers.getheader('x-auth-token') in self.server.tokens
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(
+            self.rfile.read(int(self.headers.getheader('content-length'))))
+        if self.path != '/redfish/v1/SessionService/Sessions':
+            return self.answer(404)
+        if (body.get('UserName'), body.get('Password')) != \
+                (server.username, server.password):
+            return self.answer(401)
+        token = os.urandom(8).encode('hex')
+        with server.lock:
+            server.logins += 1
+            server.tokens[token] = server.logins
+        self.answer(201, {}, {
+            'X-Auth-Token': token,
+            'Location': '/redfish/v1/SessionService/Sessions/{}'.format(
+                server.logins),
+        })
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+        if server.delay:
+            time.sleep(server.delay)
+        if not self.authorized():
+            return self.answer(401)
+        if self.path == '/redfish/v1/Systems':
+            return self.answer(200, {'Members': [{'@odata.id': SYSTEM}]})
+        if self.path == SYSTEM and server.system is not None:
+            return self.answer(200, server.system)
+        if self.path == SYSTEM:
+            return self.answer(200, {
+                'PowerState': server.power,
+                'Status': {'State': 'Enabled', 'Health': 'OK',
+                           'HealthRollup': server.health},
+            })
+        self.answer(404)
+
+    def do_DELETE(self):
+        server = self.server
+        if not self.authorized():
+            return self.answer(401)
+        with server.lock:
+            number = server.tokens.pop(self.headers.getheader('x-auth-token'))
+            server.deleted.append(number)
+        self.answer(204)
+
+
+class FakeRedfish(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, username='admin', password='secret', addr='127.0.0.1',
+                 port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (addr, port), Handler)
+        self.port = self.server_address[1]
+        self.username = username
+        self.password = password
+        self.power = 'On'
+        self.health = 'OK'
+        self.lock = threading.Lock()
+        # token: number of the session
+        self.tokens = {}
+        self.logins = 0
+        self.deleted = []
+        self.connections = 0
+        self.requests = []
+        # seconds GET requests take
+        self.delay = 0
+        self.hang_up = False
+        # answer for the computer system instead of the usual one
+        self.system = None
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def expire(self):
+        with self.lock:
+            self.tokens = {}
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
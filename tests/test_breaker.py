@@ -0,0 +1,52 @@
+import time
+import unittest
+
+from trix_status.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker('dns', failures=3, reset=30)
+        breaker.failure('timeout')
+        breaker.failure('timeout')
+        breaker.success()
+        breaker.failure('timeout')
+        breaker.failure('timeout')
+        self.assertTrue(breaker.allow())
+        breaker.failure('timeout')
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertIn('timeout', breaker.reason())
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = CircuitBreaker('dns', failures=1, reset=0.05)
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_opens_again(self):
+        breaker = CircuitBreaker('dns', failures=2, reset=0.05)
+        breaker.failure()
+        breaker.failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_zero_failures_disables_breaker(self):
+        breaker = CircuitBreaker('dns', failures=0)
+        for _ in range(10):
+            breaker.failure()
+        self.assertTrue(breaker.allow())
+
+
+if __name__ == '__main__':
+    unittest.main()
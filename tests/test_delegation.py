@@ -0,0 +1,97 @@
+import json
+import os
+import sys
+import unittest
+
+from trix_status.nodes.delegation import Delegate
+from trix_status.nodes.status import Status
+
+
+class FakeArgs(object):
+    checks = ['health']
+    timeout = 5
+    fanout = 10
+    engine = 'threads'
+    delegate = True
+    processes = 4
+
+
+class LocalDelegate(Delegate):
+    """
+    Runs python 'script' instead of trix-status
+    """
+
+    script = ''
+
+    def command(self):
+        return [sys.executable, '-c', self.script]
+
+
+class DelegateTest(unittest.TestCase):
+
+    def run_delegate(self, script):
+        answers = []
+        delegate = LocalDelegate(
+            'localhost', [{'node': 'node001'}, {'node': 'node002'}],
+            FakeArgs(), on_answer=lambda *a: answers.append(a)
+        )
+        delegate.script = script
+        delegate.start()
+        delegate.join()
+        return delegate, answers
+
+    def test_answers_are_streamed(self):
+        delegate, answers = self.run_delegate(
+            "import json, sys\n"
+            "for n in json.load(sys.stdin):\n"
+            "    print(json.dumps({'node': n['node'], 'answers': [1]}))\n"
+            "print('garbage')\n"
+        )
+        self.assertEqual(answers, [('node001', [1]), ('node002', [1])])
+        self.assertEqual(delegate.error, '')
+
+    def test_failed_delegate(self):
+        delegate, answers = self.run_delegate(
+            "import sys\n"
+            "sys.stderr.write('no luck\\n')\n"
+            "sys.exit(3)\n"
+        )
+        self.assertEqual(answers, [])
+        self.assertEqual(delegate.error, 'rc = 3: no luck')
+        answer = delegate.missing_answer('health')
+        self.assertEqual(answer['status'], 'UNKN')
+        self.assertIn('no luck', answer['details'])
+
+    def test_delegates_do_not_delegate(self):
+        delegate = Delegate(
+            'localhost', [], FakeArgs(), on_answer=None,
+            command=['trix-status'])
+        cmd = delegate.command()
+        self.assertIn('--no-delegate', cmd)
+        self.assertEqual(cmd[cmd.index('--processes') + 1], '1')
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_shards_do_not_shard(self):
+        status = Status.__new__(Status)
+        status.args = FakeArgs()
+        status.delegates = []
+        start = Delegate.start
+        Delegate.start = lambda self: None
+        try:
+            status.start_shards([{'node': 'node00{}'.format(i)}
+                                 for i in range(8)])
+        finally:
+            Delegate.start = start
+        self.assertEqual(len(status.delegates), 4)
+        for delegate in status.delegates:
+            cmd = delegate.command()
+            self.assertEqual(cmd[:3], [
+                sys.executable, os.path.abspath(sys.argv[0]), '--shard'])
+            self.assertIn('--no-delegate', cmd)
+            self.assertEqual(cmd[cmd.index('--processes') + 1], '1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import time
+import unittest
+
+from trix_status import scheduler, supervisor, deadline
+from trix_status.engine import (
+    ThreadEngine, EventEngine, Command, Gather, Sleep, Speculate, Return,
+    run_sync
+)
+from trix_status.fanout import AIMD
+from trix_status.reactor import Reactor, Cancelled
+
+
+def echo(word):
+    rc, stdout, stderr, exc = yield Command(['echo', word])
+    raise Return((rc, stdout.strip()))
+
+
+def echo_all(words):
+    results = yield Gather([echo(word) for word in words], kind='echo')
+    raise Return(results)
+
+
+def answer_after(seconds, value):
+    yield Sleep(seconds)
+    raise Return(value)
+
+
+def speculate(items):
+    results = yield Speculate(
+        [answer_after(seconds, value) for seconds, value in items])
+    raise Return(results)
+
+
+def slow(timeout=0.2):
+    rc, stdout, stderr, exc = yield Command(['sleep', '10'], timeout=timeout)
+    raise Return(rc)
+
+
+class ReactorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor()
+
+    def test_timers_fire_in_order(self):
+        fired = []
+        self.reactor.call_later(0.05, fired.append, 2)
+        self.reactor.call_later(0.01, fired.append, 1)
+        self.reactor.call_later(0.02, fired.append, 3).cancel()
+        self.reactor.call_later(0.1, self.reactor.stop)
+        self.reactor.run_forever()
+        self.assertEqual(fired, [1, 2])
+
+    def test_run_process(self):
+        future = self.reactor.run_process(['cat'], input='hello')
+        self.reactor.run_until_complete(future)
+        result = future.result
+        self.assertEqual((result.rc, result.stdout), (0, 'hello'))
+        self.assertFalse(result.timed_out)
+
+    def test_run_process_timeout(self):
+        started = time.time()
+        future = self.reactor.run_process(['sleep', '10'], timeout=0.2)
+        self.reactor.run_until_complete(future)
+        self.assertTrue(future.result.timed_out)
+        self.assertLess(time.time() - started, 5)
+
+    def test_cancel_kills_process(self):
+        future = self.reactor.run_process(['sleep', '10'])
+        self.reactor.call_later(0.1, future.cancel)
+        self.reactor.run_until_complete(future)
+        self.assertTrue(isinstance(future.exception, Cancelled))
+
+
+class EngineTestMixin(object):
+
+    def tearDown(self):
+        deadline.set_deadline(None)
+        supervisor.shutdown()
+        scheduler.shutdown()
+
+    def test_command(self):
+        self.assertEqual(
+            self.engine.run_all([('echo', echo, ('a', ))]), [(0, 'a')])
+
+    def test_gather(self):
+        self.assertEqual(
+            self.engine.map('echo_all', echo_all, [['a', 'b'], ['c']]),
+            [[(0, 'a'), (0, 'b')], [(0, 'c')]]
+        )
+
+    def test_command_timeout(self):
+        started = time.time()
+        self.assertNotEqual(self.engine.run_all([('slow', slow, ())]), [0])
+        self.assertLess(time.time() - started, 5)
+
+    def test_speculate_waits_for_earlier_items(self):
+        # the failure comes first, but the earlier item decides
+        self.assertEqual(
+            self.engine.run_all([
+                ('spec', speculate, ([(0.2, False), (0.01, False)], )),
+            ]),
+            [[False]]
+        )
+
+    def test_speculate_stops_at_first_failure(self):
+        started = time.time()
+        self.assertEqual(
+            self.engine.run_all([
+                ('spec', speculate, ([(0.01, True), (0.05, 0), (3, True)], )),
+            ]),
+            [[True, 0]]
+        )
+        if isinstance(self.engine, EventEngine):
+            self.assertLess(time.time() - started, 1)
+
+    def test_speculate_all_succeed(self):
+        self.assertEqual(
+            self.engine.run_all([
+                ('spec', speculate, ([(0.05, 1), (0.01, 2)], )),
+            ]),
+            [[1, 2]]
+        )
+
+    def test_deadline_cancels_unfinished_jobs(self):
+        deadline.set_deadline(0.5)
+        started = time.time()
+        results = self.engine.run_all([
+            ('echo', echo, ('a', )),
+            ('slow', slow, (10, )),
+        ])
+        self.assertEqual(results, [(0, 'a'), None])
+        self.assertLess(time.time() - started, 3)
+
+
+class ThreadEngineTest(EngineTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.engine = ThreadEngine(fanout=4)
+
+    def test_run_sync(self):
+        self.assertEqual(run_sync(echo('x')), (0, 'x'))
+
+
+class EventEngineTest(EngineTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.engine = EventEngine(fanout=2, limits={'echo': 1})
+
+    def test_cancelled_gather_cancels_children(self):
+
+        def sleeper():
+            yield Gather([Sleep(10), Sleep(10)])
+
+        future = self.engine.spawn('sleep', sleeper, ())
+        self.engine.reactor.call_later(0.05, future.cancel)
+        started = time.time()
+        self.engine.reactor.run_until_complete(future)
+        self.assertTrue(isinstance(future.exception, Cancelled))
+        self.assertLess(time.time() - started, 2)
+        self.assertFalse(
+            [t for t in self.engine.reactor.timers if not t[2].cancelled])
+
+
+def fail_fast():
+    results = yield Speculate(
+        [Command(['false']), Command(['sleep', '10'])],
+        decisive=lambda result: result.rc != 0)
+    raise Return(len(results))
+
+
+class AIMDCancelTest(unittest.TestCase):
+
+    def tearDown(self):
+        supervisor.shutdown()
+
+    def test_cancelled_operations_are_not_overload(self):
+        aimd = AIMD(initial=8, minimum=1, maximum=64)
+        observed = []
+        observe = aimd.observe
+
+        def record(kind, latency, failed):
+            observed.append(failed)
+            return observe(kind, latency, failed)
+
+        aimd.observe = record
+        engine = EventEngine(aimd=aimd)
+        started = time.time()
+        self.assertEqual(
+            engine.run_all([('spec', fail_fast, ())] * 4), [1] * 4)
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(len(observed), 8)
+        self.assertFalse(any(observed))
+        self.assertGreaterEqual(aimd.limit, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from trix_status.fanout import AIMD, fd_limit
+from trix_status.scheduler import Scheduler
+
+
+class AIMDTest(unittest.TestCase):
+
+    def feed(self, aimd, n, latency=0.1, failed=False):
+        changes = []
+        for _ in range(n):
+            changed = aimd.observe('ping', latency, failed)
+            if changed is not None:
+                changes.append(changed)
+        return changes
+
+    def test_slow_start_doubles_up_to_maximum(self):
+        aimd = AIMD(initial=2, minimum=1, maximum=16)
+        self.assertEqual(self.feed(aimd, 100), [4, 8, 16])
+        self.assertEqual(aimd.limit, 16)
+
+    def test_failures_halve_and_stop_slow_start(self):
+        aimd = AIMD(initial=8, minimum=2, maximum=64)
+        self.feed(aimd, 10)
+        self.assertEqual(aimd.limit, 16)
+        self.assertEqual(self.feed(aimd, 16, failed=True), [8])
+        self.assertEqual(self.feed(aimd, 10), [9])
+
+    def test_limit_does_not_go_below_minimum(self):
+        aimd = AIMD(initial=4, minimum=3, maximum=64)
+        self.feed(aimd, 10)
+        self.feed(aimd, 100, failed=True)
+        self.assertEqual(aimd.limit, 3)
+
+    def test_slow_operations_keep_limit(self):
+        aimd = AIMD(initial=4, minimum=1, maximum=64)
+        aimd.observe('ping', 0.01, False)
+        self.assertEqual(self.feed(aimd, 30, latency=1.0), [])
+        self.assertEqual(aimd.limit, 4)
+
+    def test_maximum_is_clamped_by_open_files(self):
+        self.assertEqual(AIMD(1, 1, 10 ** 9).maximum, fd_limit(10 ** 9))
+
+
+class SchedulerGrowTest(unittest.TestCase):
+
+    def test_grow_adds_workers(self):
+        scheduler = Scheduler(fanout=2)
+        try:
+            scheduler.grow(5)
+            self.assertEqual(len(scheduler.workers), 5)
+            scheduler.grow(3)
+            self.assertEqual(len(scheduler.workers), 5)
+            self.assertEqual(
+                scheduler.map('test', lambda x: x + 1, range(10)),
+                range(1, 11)
+            )
+        finally:
+            scheduler.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+
+from trix_status import config, resolver, scheduler
+from trix_status.config import category
+from trix_status.engine import EventEngine, ThreadEngine, Call, Sleep, Return
+from trix_status.reactor import CommandResult
+from trix_status.nodes import healthstatus
+from trix_status.nodes.healthstatus import HealthStatus, health_config
+
+
+class FakeHealth(HealthStatus):
+    """
+    resolve, ping and ssh port checks answer (delay, ok) from 'probes'
+    """
+
+    probes = {}
+
+    def _fake(self, name, details):
+        self.answer['history'].append(name)
+        delay, ok = self.probes[name]
+        yield Sleep(delay)
+        if not ok:
+            self.answer['details'] = details
+        raise Return(ok)
+
+    def check_resolv(self):
+        return self._fake('resolve', 'not found')
+
+    def check_ping(self):
+        return self._fake('ping', '100% packet loss')
+
+    def check_ssh_port(self):
+        return self._fake('ssh port', 'Port 22 is closed')
+
+
+def reachable(probes):
+    check = FakeHealth('node001', timeout=5)
+    check.probes = probes
+    check.answer = {
+        'status': 'UNKN', 'history': [], 'info': '', 'details': ''}
+    ok = yield check.check_reachable()
+    raise Return((ok, check.answer))
+
+
+class ReachableTestMixin(object):
+
+    def tearDown(self):
+        scheduler.shutdown()
+
+    def run_probes(self, probes):
+        return self.engine.run_all([('health', reachable, (probes, ))])[0]
+
+    def test_all_succeed(self):
+        ok, answer = self.run_probes({
+            'resolve': (0.02, True),
+            'ping': (0.01, True),
+            'ssh port': (0, True),
+        })
+        self.assertTrue(ok)
+        self.assertEqual(answer['history'], ['resolve', 'ping', 'ssh port'])
+        self.assertEqual(answer['status'], 'DOWN')
+
+    def test_first_failure_in_order_decides(self):
+        ok, answer = self.run_probes({
+            'resolve': (0.05, True),
+            'ping': (0.1, False),
+            'ssh port': (0, False),
+        })
+        self.assertFalse(ok)
+        self.assertEqual(answer['history'], ['resolve', 'ping'])
+        self.assertEqual(answer['info'], 'ping')
+        self.assertEqual(answer['details'], '100% packet loss')
+        self.assertEqual(answer['status'], 'DOWN')
+
+    def test_resolve_failure_keeps_unknown(self):
+        started = time.time()
+        ok, answer = self.run_probes({
+            'resolve': (0, False),
+            'ping': (3, True),
+            'ssh port': (3, True),
+        })
+        self.assertFalse(ok)
+        self.assertEqual(answer['history'], ['resolve'])
+        self.assertEqual(answer['status'], 'UNKN')
+        self.assertEqual(answer['details'], 'not found')
+        if isinstance(self.engine, EventEngine):
+            self.assertLess(time.time() - started, 1)
+
+
+class ThreadReachableTest(ReachableTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.engine = ThreadEngine(fanout=4)
+
+
+class EventReachableTest(ReachableTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.engine = EventEngine(fanout=4)
+
+
+class InventoryIPTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.conf = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'health': {'inventory_ip': True}}, f)
+        self.config_file = config.config_file
+        config.config_file = self.conf
+        self.gethostbyname = socket.gethostbyname
+        socket.gethostbyname = lambda host: '10.0.0.1'
+        self.engine = ThreadEngine(fanout=4)
+
+    def tearDown(self):
+        config.config_file = self.config_file
+        socket.gethostbyname = self.gethostbyname
+        os.unlink(self.conf)
+        resolver.reset()
+        scheduler.shutdown()
+
+    def run_coro(self, coro):
+        return self.engine.run_all([('health', lambda: coro, ())])[0]
+
+    def test_address_is_pinned(self):
+        check = HealthStatus('node001', ip='10.0.0.2')
+        self.assertTrue(check.use_inventory_ip())
+        self.assertEqual(resolver.cached('node001'), '10.0.0.2')
+        self.assertFalse(HealthStatus('node002').use_inventory_ip())
+
+    def test_config_is_read_once(self):
+        conf = health_config()
+        reads = []
+        get_config = healthstatus.get_config
+        healthstatus.get_config = lambda *args: reads.append(args)
+        try:
+            checks = [
+                HealthStatus('node00{}'.format(i), ip='10.0.0.2', conf=conf)
+                for i in range(3)
+            ]
+            self.assertEqual(
+                [check.use_inventory_ip() for check in checks], [True] * 3)
+        finally:
+            healthstatus.get_config = get_config
+        self.assertEqual(reads, [])
+
+    def check_dns(self, ip, rc, stdout):
+        """
+        check_dns of the node with 'host' answering rc and stdout
+        """
+        check = HealthStatus('node001', ip=ip)
+        commands = []
+
+        def cmd(argv, timeout=30, probe=None, hedge=False, input=None):
+            commands.append(argv[0])
+            return Call(lambda: CommandResult(rc, stdout, '', ''))
+
+        check.cmd = cmd
+        mismatch = self.run_coro(check.check_dns())
+        self.assertEqual(commands, ['host'])
+        return mismatch
+
+    def test_dns_is_compared_with_luna(self):
+        answer = 'node001 has address 10.0.0.1\n'
+        self.assertEqual(self.check_dns('10.0.0.1', 0, answer), '')
+        self.assertEqual(
+            self.check_dns('10.0.0.2', 0, answer),
+            'DNS: node001 resolves to 10.0.0.1, Luna has 10.0.0.2'
+        )
+        self.assertEqual(
+            self.check_dns(
+                '10.0.0.2', 1, 'Host node001 not found: 3(NXDOMAIN)\n'),
+            'DNS: Host node001 not found: 3(NXDOMAIN)'
+        )
+
+    def test_mismatch_warns_only_healthy_nodes(self):
+        check = HealthStatus('node001', ip='10.0.0.2')
+        check.new_answer()
+        check.answer.update({'status': 'DOWN', 'info': 'ping'})
+        check.dns_mismatch('DNS: mismatch')
+        self.assertEqual(check.answer['info'], 'ping')
+
+        check.answer.update({'status': 'OK', 'category': category.GOOD})
+        check.dns_mismatch('')
+        self.assertEqual(check.answer['category'], category.GOOD)
+        check.dns_mismatch('DNS: mismatch')
+        self.assertEqual(
+            (check.answer['category'], check.answer['info']),
+            (category.WARN, 'dns')
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
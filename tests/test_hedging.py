@@ -0,0 +1,94 @@
+import time
+import unittest
+
+from trix_status import hedging
+from trix_status.reactor import Reactor
+
+
+class HedgeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor()
+        self.commands = []
+        hedging.reset()
+        hedging.set_enabled(True)
+        tracker = hedging.get_tracker('test')
+        for _ in range(hedging.MIN_SAMPLES):
+            tracker.record(0.1)
+        # budget is a share of the probes started
+        tracker.started = 100
+
+    def tearDown(self):
+        hedging.set_enabled(False)
+        hedging.reset()
+
+    def start(self, seconds):
+        """
+        Returns start() for hedge, n-th call sleeps seconds[n]
+        """
+        def start(timeout):
+            cmd = ['sh', '-c', 'sleep {}; echo {}'.format(
+                seconds[len(self.commands)], len(self.commands))]
+            self.commands.append(cmd)
+            return self.reactor.run_process(cmd, timeout)
+        return start
+
+    def test_slow_probe_is_hedged(self):
+        started = time.time()
+        future = hedging.hedge(
+            self.reactor, self.start([10, 0]), 20, 'test')
+        self.reactor.run_until_complete(future)
+        self.assertEqual(future.result.stdout.strip(), '1')
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(hedging.get_tracker('test').won, 1)
+
+    def test_fast_probe_is_not_hedged(self):
+        future = hedging.hedge(self.reactor, self.start([0]), 20, 'test')
+        self.reactor.run_until_complete(future)
+        self.assertEqual(future.result.stdout.strip(), '0')
+        self.assertEqual(len(self.commands), 1)
+
+    def test_disabled(self):
+        hedging.set_enabled(False)
+        future = hedging.hedge(
+            self.reactor, self.start([0.5, 0]), 20, 'test')
+        self.reactor.run_until_complete(future)
+        self.assertEqual(future.result.stdout.strip(), '0')
+        self.assertEqual(len(self.commands), 1)
+
+    def test_only_answers_are_recorded(self):
+        tracker = hedging.get_tracker('test')
+        samples = len(tracker.samples)
+        future = hedging.hedge(
+            self.reactor, lambda timeout: self.reactor.run_process(
+                ['sh', '-c', 'exit 255'], timeout), 20, 'test')
+        self.reactor.run_until_complete(future)
+        self.assertEqual(future.result.rc, 255)
+        future = hedging.hedge(
+            self.reactor, lambda timeout: self.reactor.run_process(
+                ['sleep', '10'], timeout), 0.3, 'test')
+        self.reactor.run_until_complete(future)
+        self.assertTrue(future.result.timed_out)
+        self.assertEqual(len(tracker.samples), samples)
+
+    def test_loser_is_not_recorded(self):
+        future = hedging.hedge(
+            self.reactor, self.start([10, 0]), 20, 'test')
+        self.reactor.run_until_complete(future)
+        self.commands = []
+        self.reactor.run_until_complete(hedging.hedge(
+            self.reactor, self.start([0]), 20, 'test'))
+        # the winner and the next probe, not the killed one
+        self.assertLess(max(hedging.get_tracker('test').samples), 5)
+
+    def test_percentile_needs_samples(self):
+        tracker = hedging.get_tracker('other')
+        for i in range(hedging.MIN_SAMPLES - 1):
+            tracker.record(i)
+        self.assertEqual(tracker.percentile(), None)
+        tracker.record(100)
+        self.assertEqual(tracker.percentile(), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
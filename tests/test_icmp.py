@@ -0,0 +1,147 @@
+import socket
+import struct
+import time
+import unittest
+
+from trix_status import icmp, scheduler
+from trix_status.engine import EventEngine, ThreadEngine, Ping, Return
+from trix_status.nodes.nodestatus import NodeStatus
+
+
+def icmp_permitted():
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP).close()
+            return True
+        except socket.error:
+            pass
+    return False
+
+
+class PacketTest(unittest.TestCase):
+
+    def test_checksum_of_request_is_valid(self):
+        packet = icmp.echo_request(0x1234, 7, 'payload')
+        self.assertEqual(icmp.checksum(packet), 0)
+
+    def test_parse_reply(self):
+        reply = struct.pack('!BBHHH', icmp.ECHO_REPLY, 0, 0, 1, 2) + 'x'
+        self.assertEqual(icmp.parse_reply(reply, raw=False), (1, 2))
+        ip_header = '\x45' + '\0' * 19
+        self.assertEqual(icmp.parse_reply(ip_header + reply, raw=True), (1, 2))
+        request = icmp.echo_request(1, 2, 'x')
+        self.assertEqual(icmp.parse_reply(request, raw=False), None)
+
+
+@unittest.skipUnless(icmp_permitted(), "ICMP sockets are not permitted")
+class PingerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pinger = icmp.Pinger()
+
+    def tearDown(self):
+        self.pinger.close()
+
+    def test_reply_from_localhost(self):
+        rtt = self.pinger.ping_sync('127.0.0.1', 2)
+        self.assertNotEqual(rtt, None)
+        self.assertLess(rtt, 1)
+
+    def test_many_targets_at_once(self):
+        results = {}
+        for i in range(1, 51):
+            self.pinger.ping(
+                '127.0.0.{}'.format(i), 2,
+                lambda rtt, i=i: results.__setitem__(i, rtt))
+        until = time.time() + 3
+        while len(results) < 50 and time.time() < until:
+            time.sleep(0.01)
+        self.assertEqual(len(results), 50)
+        self.assertFalse([i for i, rtt in results.items() if rtt is None])
+
+    def test_no_reply(self):
+        # request is lost
+        self.pinger.sock.sendto = lambda packet, addr: len(packet)
+        started = time.time()
+        self.assertEqual(self.pinger.ping_sync('127.0.0.1', 0.3), None)
+        self.assertLess(time.time() - started, 2)
+
+    def test_lost_echo_is_sent_again(self):
+        icmp.RESEND, resend = 0.2, icmp.RESEND
+        sendto = self.pinger.sock.sendto
+        sent = []
+
+        def lose_first(packet, addr):
+            sent.append(struct.unpack('!H', packet[6:8])[0])
+            if len(sent) == 1:
+                return len(packet)
+            return sendto(packet, addr)
+
+        self.pinger.sock.sendto = lose_first
+        try:
+            rtt = self.pinger.ping_sync('127.0.0.1', 2)
+        finally:
+            icmp.RESEND = resend
+        self.assertNotEqual(rtt, None)
+        self.assertLess(rtt, 0.2)
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sent[1], (sent[0] + 1) & 0xffff)
+        self.assertEqual(self.pinger.pending, {})
+
+
+class FakeCheck(NodeStatus):
+
+    def status_coro(self):
+        result = yield self.ping(self.node, 'ping')
+        raise Return(result)
+
+
+def ping_job(node):
+    result = yield FakeCheck(node, timeout=1).status_coro()
+    raise Return(result)
+
+
+class CheckPingTestMixin(object):
+
+    def tearDown(self):
+        icmp.shutdown()
+        scheduler.shutdown()
+
+    @unittest.skipUnless(icmp_permitted(), "ICMP sockets are not permitted")
+    def test_native(self):
+        self.assertNotEqual(icmp.get_pinger(), None)
+        self.assertEqual(
+            self.engine.run_all([('ping', ping_job, ('127.0.0.1', ))]),
+            [(True, '')]
+        )
+
+    def test_unresolvable_is_down(self):
+        if icmp.get_pinger() is None:
+            return
+        ok, details = self.engine.run_all(
+            [('ping', ping_job, ('no-such-host.invalid', ))])[0]
+        self.assertFalse(ok)
+
+    def test_fallback_to_ping_command(self):
+        icmp._unavailable = True
+        self.assertEqual(icmp.get_pinger(), None)
+        ok, details = self.engine.run_all(
+            [('ping', ping_job, ('127.0.0.1', ))])[0]
+        # 'ping' may be missing in the test environment
+        self.assertEqual(type(ok), bool)
+
+
+class ThreadCheckPingTest(CheckPingTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.engine = ThreadEngine(fanout=4)
+
+
+class EventCheckPingTest(CheckPingTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.engine = EventEngine(fanout=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import time
+import unittest
+
+from tests.fakebmc import FakeBMC
+from trix_status import lanplus, scheduler
+from trix_status.engine import EventEngine, ThreadEngine
+from trix_status.nodes.ipmistatus import IPMIStatus
+
+
+class PacketTest(unittest.TestCase):
+
+    def test_ipmi_request(self):
+        request = lanplus.ipmi_request(
+            lanplus.NETFN_CHASSIS, lanplus.GET_CHASSIS_STATUS, 5)
+        self.assertEqual(request.encode('hex'), '2000e08114016a')
+        self.assertEqual(lanplus.checksum(request[:3]), 0)
+        self.assertEqual(lanplus.checksum(request[3:]), 0)
+
+    def test_parse_ipmi_response(self):
+        response = '\x81\x04\x7b\x20\x14\x01\x00\x01\x00\x40\x00\x2a'
+        self.assertEqual(
+            lanplus.parse_ipmi_response(response),
+            (1, 5, 1, 0, '\x01\x00\x40\x00')
+        )
+
+    def test_power_state(self):
+        self.assertEqual(lanplus.power_state('\x21\x00'), 'ON')
+        self.assertEqual(lanplus.power_state('\x20\x00'), 'OFF')
+
+
+class ClientTestMixin(object):
+
+    def setUp(self):
+        self.bmc = FakeBMC()
+        self.client = lanplus.Client(self.suite, 4, port=self.bmc.port)
+
+    def tearDown(self):
+        self.client.close()
+        self.bmc.close()
+
+    def chassis_status(self, password='secret', timeout=2):
+        return self.client.request_sync(
+            '127.0.0.1', 'admin', password, lanplus.NETFN_CHASSIS,
+            lanplus.GET_CHASSIS_STATUS, timeout=timeout)
+
+    def test_chassis_status(self):
+        response = self.chassis_status()
+        self.assertEqual(response.error, None)
+        self.assertEqual(response.code, 0)
+        self.assertEqual(lanplus.power_state(response.data), 'ON')
+
+    def test_session_is_reused(self):
+        self.chassis_status()
+        self.bmc.power = False
+        response = self.chassis_status()
+        self.assertEqual(lanplus.power_state(response.data), 'OFF')
+        self.assertEqual(self.bmc.opened, 1)
+        self.assertEqual(len(self.bmc.received), 2)
+
+    def test_wrong_password(self):
+        response = self.chassis_status(password='wrong')
+        self.assertEqual(response.error, 'Wrong password')
+
+    def test_unknown_command(self):
+        response = self.client.request_sync(
+            '127.0.0.1', 'admin', 'secret', 0x30, 0x01, timeout=2)
+        self.assertEqual((response.error, response.code), (None, 0xc1))
+
+    def test_lost_packets_are_sent_again(self):
+        lanplus.RETRANSMIT, retransmit = 0.1, lanplus.RETRANSMIT
+        try:
+            self.bmc.drop = 2
+            self.assertEqual(self.chassis_status().code, 0)
+        finally:
+            lanplus.RETRANSMIT = retransmit
+
+    def test_no_answer(self):
+        self.bmc.silent = True
+        started = time.time()
+        response = self.chassis_status(timeout=0.3)
+        self.assertNotEqual(response.error, None)
+        self.assertLess(time.time() - started, 2)
+        # the next request opens a new session
+        self.bmc.silent = False
+        self.assertEqual(self.chassis_status().code, 0)
+
+    def test_many_bmcs_at_once(self):
+        bmcs = [
+            FakeBMC(addr='127.0.0.{}'.format(i), port=self.bmc.port)
+            for i in range(2, 12)
+        ]
+        try:
+            results = []
+            for bmc in bmcs:
+                bmc.power = False
+                self.client.request(
+                    bmc.sock.getsockname()[0], 'admin', 'secret',
+                    lanplus.NETFN_CHASSIS, lanplus.GET_CHASSIS_STATUS,
+                    timeout=2, callback=results.append)
+            until = time.time() + 3
+            while len(results) < len(bmcs) and time.time() < until:
+                time.sleep(0.01)
+            self.assertEqual(
+                [lanplus.power_state(r.data) for r in results],
+                ['OFF'] * len(bmcs)
+            )
+            self.assertEqual([bmc.opened for bmc in bmcs], [1] * len(bmcs))
+        finally:
+            for bmc in bmcs:
+                bmc.close()
+
+    def test_close_session_at_exit(self):
+        self.chassis_status()
+        self.client.close()
+        until = time.time() + 2
+        while not self.bmc.closed and time.time() < until:
+            time.sleep(0.01)
+        self.assertEqual(self.bmc.closed, 1)
+
+
+class Suite2Test(ClientTestMixin, unittest.TestCase):
+    suite = 2
+
+
+class Suite1Test(ClientTestMixin, unittest.TestCase):
+    suite = 1
+
+
+@unittest.skipIf(lanplus.AES is None, "python-crypto is not installed")
+class Suite3Test(ClientTestMixin, unittest.TestCase):
+    suite = 3
+
+
+@unittest.skipIf(lanplus.AES is None, "python-crypto is not installed")
+class Suite17Test(ClientTestMixin, unittest.TestCase):
+    suite = 17
+
+
+class PowerCheckTestMixin(object):
+
+    def setUp(self):
+        self.bmc = FakeBMC()
+        lanplus._client = lanplus.Client(2, 4, port=self.bmc.port)
+        self.engine = self.make_engine()
+
+    def tearDown(self):
+        lanplus.shutdown()
+        scheduler.shutdown()
+        self.bmc.close()
+
+    def test_power(self):
+        check = IPMIStatus(
+            'node001', '127.0.0.1', 'admin', 'secret', timeout=2)
+        check.answer = {'status': 'UNKN', 'history': [], 'details': ''}
+        self.assertEqual(self.engine.run_all([
+            ('ipmi', check.check_power, ()),
+            ('ipmi', check.check_power, ()),
+        ]), [True, True])
+        self.assertEqual(check.answer['status'], 'ON')
+        self.assertEqual(self.bmc.opened, 1)
+
+    def test_wrong_password(self):
+        check = IPMIStatus(
+            'node001', '127.0.0.1', 'admin', 'wrong', timeout=2)
+        check.answer = {'status': 'UNKN', 'history': [], 'details': ''}
+        self.assertEqual(
+            self.engine.run_all([('ipmi', check.check_power, ())]), [False])
+        self.assertEqual(check.answer['details'], 'Wrong password')
+
+
+class ThreadPowerCheckTest(PowerCheckTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return ThreadEngine(fanout=4)
+
+
+class EventPowerCheckTest(PowerCheckTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return EventEngine(fanout=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from trix_status.latency import LatencyStore, MIN_SAMPLES
+
+
+class LatencyStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sub', 'latency.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_default_timeout_without_history(self):
+        store = LatencyStore(self.path)
+        for _ in range(MIN_SAMPLES - 1):
+            store.record('node001', 'ping', 0.1)
+        self.assertEqual(store.timeout('node001', 'ping', 10), 10)
+        self.assertEqual(store.timeout('node002', 'ping', 10), 10)
+
+    def test_timeout_is_learned_and_clamped(self):
+        store = LatencyStore(self.path, factor=3)
+        for latency in [0.5] * 20 + [1.5]:
+            store.record('node001', 'ssh', latency)
+        # p99 is 1.5s
+        self.assertEqual(store.timeout('node001', 'ssh', 10), 5)
+        self.assertEqual(store.timeout('node001', 'ssh', 4), 4)
+        for _ in range(20):
+            store.record('node002', 'ssh', 0.001)
+        self.assertEqual(store.timeout('node002', 'ssh', 10), 1)
+
+    def test_timeout_widens_if_latency_rises(self):
+        store = LatencyStore(self.path, factor=3)
+        for _ in range(20):
+            store.record('node001', 'ssh', 0.1)
+        self.assertEqual(store.timeout('node001', 'ssh', 10), 1)
+        # the node now answers in 5s, probes under 1s get no answer
+        for expected in [3, 9, 10]:
+            store.save()
+            store = LatencyStore(self.path, factor=3)
+            store.load()
+            self.assertEqual(store.timeout('node001', 'ssh', 10), expected)
+        store.record('node001', 'ssh', 5)
+        store.save()
+        self.assertEqual(store.timeout('node001', 'ssh', 10), 10)
+
+    def test_answered_probes_are_not_widened(self):
+        store = LatencyStore(self.path, factor=3)
+        for _ in range(20):
+            store.record('node001', 'ssh', 0.1)
+        self.assertEqual(store.timeout('node001', 'ssh', 10), 1)
+        store.record('node001', 'ssh', 0.1)
+        store.save()
+        self.assertEqual(store.timeout('node001', 'ssh', 10), 1)
+
+    def test_only_latest_samples_are_kept(self):
+        store = LatencyStore(self.path, samples=10)
+        for i in range(25):
+            store.record('node001', 'ping', i)
+        self.assertEqual(store.stats['node001']['ping'], range(15, 25))
+
+    def test_save_and_load(self):
+        store = LatencyStore(self.path)
+        store.record('node001', 'ping', 0.1234)
+        store.save()
+        loaded = LatencyStore(self.path)
+        loaded.load()
+        self.assertEqual(loaded.stats, {'node001': {'ping': [0.123]}})
+
+    def test_save_keeps_nodes_of_other_processes(self):
+        first = LatencyStore(self.path)
+        second = LatencyStore(self.path)
+        first.record('node001', 'ping', 0.1)
+        second.record('node002', 'ping', 0.2)
+        first.save()
+        second.save()
+        loaded = LatencyStore(self.path)
+        loaded.load()
+        self.assertEqual(sorted(loaded.stats), ['node001', 'node002'])
+
+    def test_broken_file_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{broken')
+        store = LatencyStore(self.path)
+        store.load()
+        self.assertEqual(store.stats, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+from trix_status import scheduler
+from trix_status.engine import EventEngine, ThreadEngine, Sleep, Return
+from trix_status.nodes.healthstatus import HealthStatus
+from trix_status.nodes.pipeline import HealthPipeline
+
+STAGES = ['resolve', 'ping', 'ssh port', 'ssh', 'mounts']
+
+
+class StageHealth(HealthStatus):
+    """
+    Fails at stage 'fail_at', records stages it was asked for
+    """
+
+    def __init__(self, node, fail_at=None):
+        super(StageHealth, self).__init__(node, timeout=5)
+        self.fail_at = fail_at
+        self.calls = []
+
+    def _stage(self, name):
+        self.calls.append(name)
+        self.answer['history'].append(name)
+        yield Sleep(0.01)
+        raise Return(name != self.fail_at)
+
+    def check_resolv(self):
+        return self._stage('resolve')
+
+    def check_ping(self):
+        return self._stage('ping')
+
+    def check_ssh_port(self, scanned=None):
+        return self._stage('ssh port')
+
+    def run_bundle(self):
+        ok = yield self._stage('ssh')
+        raise Return((ok, {'mounts_ok': self.fail_at != 'mounts'}))
+
+    def check_bundle_mounts(self, bundle):
+        self.calls.append('mounts')
+        self.answer['history'].append('mounts')
+        return bundle['mounts_ok']
+
+
+class PipelineTestMixin(object):
+
+    def tearDown(self):
+        scheduler.shutdown()
+
+    def test_nodes_stop_at_failed_stage(self):
+        checks = [StageHealth('node{:03}'.format(i + 1), fail_at=stage)
+                  for i, stage in enumerate(STAGES + [None])]
+        reported = []
+        pipeline = HealthPipeline(checks, reported.append)
+
+        def run():
+            yield pipeline.run()
+
+        self.engine.run_all([('health pipeline', run, ())])
+
+        # every node is reported once, failed nodes before the good one
+        self.assertEqual(sorted(reported), sorted(checks))
+        self.assertIs(reported[-1], checks[-1])
+
+        statuses = [(c.answer['status'], c.answer['info']) for c in checks]
+        self.assertEqual(statuses, [
+            ('UNKN', 'resolve'),
+            ('DOWN', 'ping'),
+            ('DOWN', 'ssh port'),
+            ('DOWN', 'ssh'),
+            ('NO_FS', 'mounts'),
+            ('OK', ''),
+        ])
+        for i, check in enumerate(checks):
+            self.assertEqual(check.calls, STAGES[:i + 1])
+
+
+class ThreadPipelineTest(PipelineTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.engine = ThreadEngine(fanout=4)
+
+
+class EventPipelineTest(PipelineTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.engine = EventEngine(fanout=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
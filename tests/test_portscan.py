@@ -0,0 +1,136 @@
+import errno
+import socket
+import threading
+import time
+import unittest
+
+from trix_status import portscan, scheduler
+from trix_status.engine import EventEngine, ThreadEngine, Scan, Return
+
+
+class Server(object):
+    """
+    Listens on a local port, sends 'banner' to every client
+    """
+
+    def __init__(self, banner=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        self.banner = banner
+        self.clients = []
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            self.clients.append(conn)
+            if self.banner is not None:
+                conn.sendall(self.banner)
+
+    def close(self):
+        self.sock.close()
+        for conn in self.clients:
+            conn.close()
+
+
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class ScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scanner = portscan.Scanner(max_connections=4)
+        self.sshd = Server('SSH-2.0-OpenSSH_7.4\r\n')
+        self.silent = Server()
+
+    def tearDown(self):
+        self.scanner.close()
+        self.sshd.close()
+        self.silent.close()
+        scheduler.shutdown()
+
+    def test_open_port(self):
+        self.assertEqual(
+            self.scanner.scan('127.0.0.1', self.sshd.port, 2), (0, None))
+
+    def test_banner(self):
+        self.assertEqual(
+            self.scanner.scan('127.0.0.1', self.sshd.port, 2, banner=True),
+            (0, 'SSH-2.0-OpenSSH_7.4')
+        )
+
+    def test_no_banner_in_time(self):
+        started = time.time()
+        self.assertEqual(
+            self.scanner.scan('127.0.0.1', self.silent.port, 0.3, True),
+            (0, None)
+        )
+        self.assertLess(time.time() - started, 2)
+
+    def test_closed_port(self):
+        self.assertEqual(
+            self.scanner.scan('127.0.0.1', closed_port(), 2),
+            (errno.ECONNREFUSED, None)
+        )
+
+    def test_scan_all(self):
+        targets = [('127.0.0.1', 2)] * 20
+        results = self.scanner.scan_all(targets, self.sshd.port, banner=True)
+        self.assertEqual(results, [(0, 'SSH-2.0-OpenSSH_7.4')] * 20)
+        self.assertEqual(self.scanner.scan_all([], self.sshd.port), [])
+
+
+def scan(port, banner):
+    result = yield Scan('127.0.0.1', port, 2, banner)
+    raise Return(result)
+
+
+class ScanOpTestMixin(object):
+
+    def setUp(self):
+        self.sshd = Server('SSH-2.0-test\n')
+
+    def tearDown(self):
+        self.sshd.close()
+        portscan.shutdown()
+        scheduler.shutdown()
+
+    def test_scan(self):
+        self.assertEqual(
+            self.engine.run_all([
+                ('scan', scan, (self.sshd.port, True)),
+                ('scan', scan, (closed_port(), False)),
+            ]),
+            [(0, 'SSH-2.0-test'), (errno.ECONNREFUSED, None)]
+        )
+
+
+class ThreadScanOpTest(ScanOpTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(ThreadScanOpTest, self).setUp()
+        self.engine = ThreadEngine(fanout=4)
+
+
+class EventScanOpTest(ScanOpTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(EventScanOpTest, self).setUp()
+        self.engine = EventEngine(fanout=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import subprocess
+import sys
+import unittest
+
+from trix_status import sshpool
+from trix_status.nodes import probe
+
+
+def run_script(mounts, timeout=5):
+    args = json.dumps({
+        'mounts': mounts,
+        'timeout': timeout,
+        'standard_mounts': probe.STANDARD_MOUNTS,
+    })
+    proc = subprocess.Popen(
+        [sys.executable, '-', args],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+    stdout, _ = proc.communicate(probe.SCRIPT)
+    return proc.returncode, stdout
+
+
+class ProbeScriptTest(unittest.TestCase):
+
+    def test_script_answer(self):
+        rc, stdout = run_script(['/', '/nonexistent'])
+        self.assertEqual(rc, 0)
+        answer = probe.parse(stdout)
+        self.assertNotEqual(answer, None)
+        self.assertTrue(answer['uname'])
+        self.assertIn('/', answer['proc_mounts'])
+        self.assertEqual(
+            answer['stat'], {'/': {'rc': 0, 'timed_out': False}})
+
+    def test_probe_cmd_passes_mounts(self):
+        # no ssh masters for the fake host
+        sshpool._disabled = True
+        try:
+            cmd = probe.probe_cmd('node001', ['/my mount'], 10)
+        finally:
+            sshpool.shutdown()
+        self.assertEqual(cmd[:1] + cmd[-2:-1], ['ssh', 'node001'])
+        self.assertIn('"mounts": ["/my mount"]', cmd[-1])
+
+    def test_parse_broken_answer(self):
+        self.assertEqual(probe.parse('not json'), None)
+        self.assertEqual(probe.parse('[]'), None)
+        self.assertEqual(probe.parse('{"uname": "Linux"}'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
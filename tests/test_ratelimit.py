@@ -0,0 +1,67 @@
+import time
+import unittest
+
+from trix_status import ratelimit, scheduler
+from trix_status.engine import ThreadEngine, EventEngine, Throttle, Return
+from trix_status.ratelimit import TokenBucket
+
+
+def throttled(backend):
+    yield Throttle(backend)
+    raise Return(time.time())
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket('test', rate=10, burst=3)
+        delays = [bucket.reserve() for _ in range(5)]
+        self.assertEqual(delays[:3], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(delays[3], 0.1, delta=0.02)
+        self.assertAlmostEqual(delays[4], 0.2, delta=0.02)
+
+    def test_tokens_are_refilled(self):
+        bucket = TokenBucket('test', rate=100, burst=1)
+        bucket.reserve()
+        time.sleep(0.05)
+        self.assertEqual(bucket.reserve(), 0.0)
+
+
+class ThrottleTestMixin(object):
+
+    def setUp(self):
+        ratelimit._buckets = {'dns': TokenBucket('dns', rate=20, burst=2)}
+
+    def tearDown(self):
+        ratelimit._buckets = None
+        scheduler.shutdown()
+
+    def test_throttle_spreads_requests(self):
+        started = time.time()
+        times = self.engine.map('dns', throttled, ['dns'] * 6)
+        # 2 at once, then 4 more at 20/s
+        self.assertGreaterEqual(max(times) - started, 0.18)
+        self.assertLess(max(times) - started, 2)
+
+    def test_unknown_backend_is_not_limited(self):
+        started = time.time()
+        times = self.engine.map('other', throttled, ['other'] * 10)
+        self.assertLess(max(times) - started, 0.1)
+
+
+class ThreadEngineThrottleTest(ThrottleTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        ThrottleTestMixin.setUp(self)
+        self.engine = ThreadEngine(fanout=6)
+
+
+class EventEngineThrottleTest(ThrottleTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        ThrottleTestMixin.setUp(self)
+        self.engine = EventEngine(fanout=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from tests.fakeredfish import FakeRedfish
+from trix_status import redfish, scheduler
+from trix_status.config import category
+from trix_status.engine import EventEngine, ThreadEngine, Return
+from trix_status.nodes.ipmistatus import IPMIStatus
+
+
+class NetworkTest(unittest.TestCase):
+
+    def test_network(self):
+        self.assertEqual(redfish.network('10.141.255.7', 16), '10.141.0.0/16')
+        self.assertEqual(redfish.network('10.148.0.7', 24), '10.148.0.0/24')
+        self.assertEqual(redfish.network('fe80::1', 24), 'fe80::1')
+
+    def test_health(self):
+        self.assertEqual(redfish.health(
+            {'Status': {'Health': 'OK', 'HealthRollup': 'Critical'}}),
+            'Critical')
+        self.assertEqual(redfish.health({'Status': {'Health': 'Warning'}}),
+                         'Warning')
+        self.assertEqual(redfish.health({}), 'OK')
+
+    def test_backend(self):
+        self.assertEqual(redfish.backend('gpu', ['gpu']), 'redfish')
+        self.assertEqual(redfish.backend('compute', ['gpu']), 'ipmi')
+        self.assertEqual(redfish.backend(None, []), 'ipmi')
+
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.token_file = os.path.join(self.dir, 'redfish.json')
+        self.bmc = FakeRedfish()
+        self.pool = self.make_pool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.bmc.close()
+        shutil.rmtree(self.dir)
+
+    def make_pool(self, **kwargs):
+        kwargs.setdefault('token_file', self.token_file)
+        pool = redfish.RedfishPool(scheme='http', port=self.bmc.port, **kwargs)
+        pool.load()
+        return pool
+
+    def status(self, password='secret', pool=None):
+        return (pool or self.pool).system_status(
+            '127.0.0.1', 'admin', password, 2)
+
+    def test_system_status(self):
+        self.assertEqual(self.status(), (None, 'ON', 'OK'))
+        self.bmc.power = 'Off'
+        self.bmc.health = 'Warning'
+        self.assertEqual(self.status(), (None, 'OFF', 'Warning'))
+        # one connection and one session, Systems is read once
+        self.assertEqual(self.bmc.connections, 1)
+        self.assertEqual(self.bmc.logins, 1)
+        self.assertEqual(self.bmc.requests.count('/redfish/v1/Systems'), 1)
+
+    def test_wrong_password(self):
+        self.assertEqual(
+            self.status(password='wrong'), ('Wrong password', None, None))
+
+    def test_expired_token(self):
+        self.status()
+        self.bmc.expire()
+        self.assertEqual(self.status(), (None, 'ON', 'OK'))
+        self.assertEqual(self.bmc.logins, 2)
+
+    def test_token_is_kept_between_runs(self):
+        self.status()
+        self.pool.close()
+        self.assertEqual(self.bmc.deleted, [])
+        self.assertEqual(os.stat(self.token_file).st_mode & 0o077, 0)
+        self.pool = self.make_pool()
+        self.assertEqual(self.status(), (None, 'ON', 'OK'))
+        self.assertEqual(self.bmc.logins, 1)
+
+    def test_sessions_are_deleted_if_not_kept(self):
+        self.pool = self.make_pool(token_file='')
+        self.status()
+        self.pool.close()
+        self.assertEqual(self.bmc.deleted, [1])
+
+    def test_connection_closed_by_bmc(self):
+        self.bmc.hang_up = True
+        # login, Systems and the system, each on a new connection
+        self.assertEqual(self.status(), (None, 'ON', 'OK'))
+        self.assertEqual(self.bmc.connections, 3)
+        self.bmc.hang_up = False
+        self.assertEqual(self.status(), (None, 'ON', 'OK'))
+        self.assertEqual(self.bmc.connections, 4)
+
+    def test_unexpected_system(self):
+        for system in (['On'], 'On', {'PowerState': 'On', 'Status': 'OK'}):
+            self.bmc.system = system
+            error, power, health = self.status()
+            self.assertTrue(error.startswith('Unexpected answer'))
+            self.assertEqual((power, health), (None, None))
+
+    def test_no_service(self):
+        self.bmc.close()
+        error, power, health = self.status()
+        self.assertNotEqual(error, None)
+
+    def test_requests_per_network_are_limited(self):
+        self.pool = self.make_pool(max_per_network=1)
+        self.bmc.delay = 0.2
+        active = []
+        peak = []
+        system_status = redfish.Session.get
+
+        def counted(session, path, timeout):
+            active.append(path)
+            peak.append(len(active))
+            try:
+                return system_status(session, path, timeout)
+            finally:
+                active.pop()
+
+        redfish.Session.get = counted
+        try:
+            threads = [
+                threading.Thread(target=self.pool.system_status, args=(
+                    '127.0.0.{}'.format(i), 'admin', 'secret', 2))
+                for i in (1, 1, 2)
+            ]
+            # 127.0.0.2 is not served, it only takes the slot
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            redfish.Session.get = system_status
+        self.assertEqual(max(peak), 1)
+
+
+class RedfishCheckTestMixin(object):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.bmc = FakeRedfish()
+        redfish._pool = redfish.RedfishPool(
+            scheme='http', port=self.bmc.port,
+            token_file=os.path.join(self.dir, 'redfish.json'))
+        self.engine = self.make_engine()
+
+    def tearDown(self):
+        redfish.shutdown()
+        scheduler.shutdown()
+        self.bmc.close()
+        shutil.rmtree(self.dir)
+
+    def check(self, nodes=1):
+        checks = [
+            IPMIStatus(
+                'node00{}'.format(i), '127.0.0.1', 'admin', 'secret',
+                timeout=2, backend='redfish')
+            for i in range(nodes)
+        ]
+        for check in checks:
+            check.answer = {'status': 'UNKN', 'history': [], 'details': ''}
+        results = self.engine.run_all(
+            [('ipmi', check.check_redfish, ()) for check in checks])
+        return checks, results
+
+    def test_power_and_health(self):
+        checks, results = self.check(nodes=3)
+        self.assertEqual(results, ['OK'] * 3)
+        self.assertEqual([c.answer['status'] for c in checks], ['ON'] * 3)
+        self.assertEqual(self.bmc.logins, 1)
+
+    def test_unhealthy(self):
+        self.bmc.health = 'Critical'
+        check = IPMIStatus(
+            'node001', '127.0.0.1', 'admin', 'secret', timeout=2,
+            backend='redfish')
+        check.answer = {'status': 'UNKN', 'category': category.UNKN,
+                        'history': [], 'info': '', 'details': ''}
+
+        def check_ping():
+            raise Return(True)
+            yield
+
+        check.check_ping = check_ping
+        answer = self.engine.run_all([('ipmi', check.redfish_coro, ())])[0]
+        self.assertEqual(answer['category'], category.ERROR)
+        self.assertEqual(answer['details'], 'Health Critical')
+
+    def test_wrong_password(self):
+        check = IPMIStatus(
+            'node001', '127.0.0.1', 'admin', 'wrong', timeout=2,
+            backend='redfish')
+        check.answer = {'status': 'UNKN', 'history': [], 'details': ''}
+        self.assertEqual(
+            self.engine.run_all([('ipmi', check.check_redfish, ())]), [False])
+        self.assertEqual(check.answer['details'], 'Wrong password')
+
+
+class ThreadRedfishCheckTest(RedfishCheckTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return ThreadEngine(fanout=4)
+
+
+class EventRedfishCheckTest(RedfishCheckTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return EventEngine(fanout=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from trix_status import deadline, resolver, scheduler
+from trix_status.resolver import Resolver, is_address
+from trix_status.utils import resolved_host_options
+
+
+class FakeDNS(object):
+    """
+    Replaces socket.gethostbyname, counts lookups
+    """
+
+    def __init__(self, addresses, delay=0):
+        self.addresses = addresses
+        self.delay = delay
+        self.lookups = []
+        self.lock = threading.Lock()
+
+    def __call__(self, host):
+        with self.lock:
+            self.lookups.append(host)
+        time.sleep(self.delay)
+        if host not in self.addresses:
+            raise socket.gaierror(
+                socket.EAI_NONAME, 'Name or service not known')
+        return self.addresses[host]
+
+
+class ResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'resolver.json')
+        self.gethostbyname = socket.gethostbyname
+        self.dns = FakeDNS({'node001': '10.0.0.1', 'node002': '10.0.0.2'})
+        socket.gethostbyname = self.dns
+
+    def tearDown(self):
+        socket.gethostbyname = self.gethostbyname
+        shutil.rmtree(self.tmpdir)
+        resolver.reset()
+        scheduler.shutdown()
+
+    def test_name_is_looked_up_once(self):
+        r = Resolver()
+        self.assertEqual(r.lookup('node001'), ('10.0.0.1', None))
+        self.assertEqual(r.resolve('node001'), '10.0.0.1')
+        self.assertEqual(r.cached('node001'), '10.0.0.1')
+        self.assertEqual(self.dns.lookups, ['node001'])
+
+    def test_unknown_name(self):
+        r = Resolver()
+        addr, error = r.lookup('node003')
+        self.assertEqual(addr, None)
+        self.assertEqual(error.args[0], socket.EAI_NONAME)
+        self.assertRaises(socket.error, r.resolve, 'node003')
+        self.assertEqual(r.cached('node003'), None)
+        self.assertEqual(self.dns.lookups, ['node003'])
+
+    def test_addresses_are_not_looked_up(self):
+        self.assertTrue(is_address('10.1.2.3'))
+        self.assertFalse(is_address('10.1'))
+        self.assertFalse(is_address('node001'))
+        self.assertEqual(Resolver().lookup('10.1.2.3'), ('10.1.2.3', None))
+        self.assertEqual(self.dns.lookups, [])
+
+    def test_concurrent_lookups_wait_for_the_first(self):
+        self.dns.delay = 0.1
+        r = Resolver()
+        answers = r.lookup_all(['node001'] * 5 + ['node002'])
+        self.assertEqual(
+            [addr for addr, error in answers], ['10.0.0.1'] * 5 + ['10.0.0.2'])
+        self.assertEqual(sorted(self.dns.lookups), ['node001', 'node002'])
+
+    def test_addresses_are_kept_for_ttl(self):
+        r = Resolver(ttl=60, path=self.path)
+        r.lookup('node001')
+        r.lookup('node003')
+        r.save()
+
+        r = Resolver(ttl=60, path=self.path)
+        r.load()
+        self.assertEqual(r.cached('node001'), '10.0.0.1')
+        self.assertEqual(r.cached('node003'), None)
+        self.assertEqual(self.dns.lookups, ['node001', 'node003'])
+
+        # expired
+        r = Resolver(ttl=1, path=self.path)
+        time.sleep(1.1)
+        r.load()
+        self.assertEqual(r.cached('node001'), None)
+
+    def test_no_file_without_ttl(self):
+        r = Resolver(path=self.path)
+        r.lookup('node001')
+        r.save()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_lookup_is_bounded_by_timeout(self):
+        self.dns.delay = 2
+        r = Resolver(timeout=0.2)
+        started = time.time()
+        addr, error = r.lookup('node001')
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(addr, None)
+        self.assertEqual(error.args[0], socket.EAI_AGAIN)
+
+    def test_lookup_is_bounded_by_deadline(self):
+        self.dns.delay = 2
+        deadline.set_deadline(0.2)
+        try:
+            started = time.time()
+            addr, error = Resolver().lookup('node001')
+        finally:
+            deadline.set_deadline(0)
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(addr, None)
+
+    def test_ssh_uses_cached_address(self):
+        self.assertEqual(resolved_host_options('node001'), [])
+        resolver.get_resolver().lookup('node001')
+        self.assertEqual(resolved_host_options('node001'), [
+            '-o', 'HostName=10.0.0.1', '-o', 'HostKeyAlias=node001'])
+
+
+if __name__ == '__main__':
+    unittest.main()
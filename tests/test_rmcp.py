@@ -0,0 +1,159 @@
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from trix_status import rmcp, scheduler
+from trix_status.engine import EventEngine, ThreadEngine, RMCPPing, Return
+
+
+class FakeBMC(object):
+    """
+    Answers Presence Ping on 'addr'. 'tag' overrides tag of the pong,
+    silent BMC does not answer
+    """
+
+    def __init__(self, addr='127.0.0.1', port=0, silent=False, tag=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((addr, port))
+        self.port = self.sock.getsockname()[1]
+        self.silent = silent
+        self.tag = tag
+        self.pings = []
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                packet, peer = self.sock.recvfrom(512)
+            except socket.error:
+                return
+            self.pings.append(packet)
+            if self.silent:
+                continue
+            tag = ord(packet[9]) if self.tag is None else self.tag
+            pong = rmcp.RMCP_HEADER + struct.pack(
+                '!IBBBB', rmcp.ASF_IANA, rmcp.PRESENCE_PONG, tag, 0, 16)
+            self.sock.sendto(pong + '\0' * 16, peer)
+
+    def close(self):
+        self.sock.close()
+
+
+class PacketTest(unittest.TestCase):
+
+    def test_presence_ping(self):
+        self.assertEqual(
+            rmcp.presence_ping(7).encode('hex'),
+            '0600ff06000011be80070000'
+        )
+
+    def test_parse_pong(self):
+        pong = rmcp.RMCP_HEADER + struct.pack(
+            '!IBBBB', rmcp.ASF_IANA, rmcp.PRESENCE_PONG, 7, 0, 16)
+        self.assertEqual(rmcp.parse_pong(pong + '\0' * 16), 7)
+        self.assertEqual(rmcp.parse_pong(rmcp.presence_ping(7)), None)
+        self.assertEqual(rmcp.parse_pong(pong[:8]), None)
+
+
+class PingerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bmc = FakeBMC()
+        self.pinger = rmcp.Pinger(port=self.bmc.port)
+
+    def tearDown(self):
+        self.pinger.close()
+        self.bmc.close()
+
+    def test_answer(self):
+        rtt = self.pinger.ping_sync('127.0.0.1', 2)
+        self.assertNotEqual(rtt, None)
+        self.assertLess(rtt, 1)
+
+    def test_answer_is_shared(self):
+        self.pinger.sweep([('127.0.0.1', 2), ('bmc001', 2)])
+        first = self.pinger.ping_sync('127.0.0.1', 2)
+        self.assertEqual(self.pinger.ping_sync('127.0.0.1', 2), first)
+        self.assertEqual(len(self.bmc.pings), 1)
+        # names are left to the checks
+        self.assertEqual(self.pinger.pings.keys(), ['127.0.0.1'])
+
+    def test_sweep_of_many_bmcs(self):
+        bmcs = [
+            FakeBMC('127.0.0.{}'.format(i), self.bmc.port)
+            for i in range(2, 12)
+        ]
+        try:
+            targets = [('127.0.0.{}'.format(i), 2) for i in range(1, 12)]
+            started = time.time()
+            self.pinger.sweep(targets)
+            results = [self.pinger.ping_sync(addr, 2) for addr, _ in targets]
+            self.assertLess(time.time() - started, 2)
+            self.assertFalse([rtt for rtt in results if rtt is None])
+        finally:
+            for bmc in bmcs:
+                bmc.close()
+
+    def test_no_answer(self):
+        self.bmc.silent = True
+        started = time.time()
+        self.assertEqual(self.pinger.ping_sync('127.0.0.1', 0.3), None)
+        self.assertLess(time.time() - started, 2)
+
+    def test_wrong_tag_is_ignored(self):
+        self.bmc.tag = 255
+        self.assertEqual(self.pinger.ping_sync('127.0.0.1', 0.3), None)
+
+    def test_close_finishes_pending(self):
+        self.bmc.silent = True
+        results = []
+        self.pinger.ping('127.0.0.1', 30, results.append)
+        self.pinger.close()
+        self.assertEqual(results, [None])
+
+
+def rmcp_job(host):
+    rtt = yield RMCPPing(host, 1)
+    raise Return(rtt is not None)
+
+
+class EngineTestMixin(object):
+
+    def setUp(self):
+        self.bmc = FakeBMC()
+        rmcp._pinger = rmcp.Pinger(port=self.bmc.port)
+        self.engine = self.make_engine()
+
+    def tearDown(self):
+        rmcp.shutdown()
+        scheduler.shutdown()
+        self.bmc.close()
+
+    def test_rmcp_ping(self):
+        self.assertEqual(
+            self.engine.run_all([
+                ('ipmi', rmcp_job, ('127.0.0.1', )),
+                ('ipmi', rmcp_job, ('no-such-host.invalid', )),
+            ]),
+            [True, False]
+        )
+
+
+class ThreadEngineTest(EngineTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return ThreadEngine(fanout=4)
+
+
+class EventEngineTest(EngineTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return EventEngine(fanout=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+
+from trix_status.scheduler import Scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = None
+
+    def tearDown(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+
+    def test_map_returns_results_in_order(self):
+        self.scheduler = Scheduler(fanout=3)
+        self.assertEqual(
+            self.scheduler.map('test', lambda x: x * 2, range(10)),
+            [x * 2 for x in range(10)]
+        )
+
+    def test_exception_is_reraised(self):
+        self.scheduler = Scheduler(fanout=2)
+
+        def fail(_):
+            raise ValueError("boom")
+
+        task = self.scheduler.submit('test', fail, 1)
+        self.assertRaises(ValueError, self.scheduler.result, task)
+
+    def test_kind_limit_is_honoured(self):
+        self.scheduler = Scheduler(fanout=6, limits={'limited': 2})
+        lock = threading.Lock()
+        state = {'running': 0, 'max': 0}
+
+        def work(_):
+            with lock:
+                state['running'] += 1
+                state['max'] = max(state['max'], state['running'])
+            time.sleep(0.05)
+            with lock:
+                state['running'] -= 1
+
+        self.scheduler.map('limited', work, range(8))
+        self.assertEqual(state['max'], 2)
+
+    def test_deferred_tasks_do_not_block_other_kinds(self):
+        self.scheduler = Scheduler(fanout=2, limits={'slow': 1})
+        release = threading.Event()
+        slow = [
+            self.scheduler.submit('slow', release.wait, 5) for _ in range(3)
+        ]
+        fast = self.scheduler.submit('fast', lambda: 'done')
+        self.assertTrue(self.scheduler.wait(fast, timeout=2))
+        self.assertEqual(fast.result, 'done')
+        release.set()
+        for task in slow:
+            self.assertTrue(self.scheduler.wait(task, timeout=2))
+
+    def test_nested_map_does_not_deadlock(self):
+        # one worker only: nested tasks have to run inline
+        self.scheduler = Scheduler(fanout=1)
+
+        def outer(x):
+            return sum(self.scheduler.map('inner', lambda y: y + x, range(3)))
+
+        result = {}
+
+        def run():
+            result['value'] = self.scheduler.map('outer', outer, range(4))
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(result['value'], [3 + 3 * x for x in range(4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
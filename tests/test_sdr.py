@@ -0,0 +1,191 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from tests.fakebmc import FakeBMC, full_sensor_record
+from trix_status import lanplus, scheduler, sdr
+from trix_status.engine import EventEngine, ThreadEngine
+from trix_status.nodes.ipmistatus import IPMIStatus
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_threshold_sensor(self):
+        sensor = sdr.parse_record(full_sensor_record(
+            3, 0x30, 'CPU1 Temp', m=2, b=-5, k1=1, k2=-1))
+        self.assertEqual(sensor['number'], 0x30)
+        self.assertEqual(sensor['name'], 'CPU1 Temp')
+        self.assertEqual(sensor['unit'], 'C')
+        self.assertEqual(sdr.convert(sensor, 50), 5.0)
+
+    def test_other_records_are_skipped(self):
+        # owned by another controller
+        self.assertEqual(sdr.parse_record(
+            full_sensor_record(3, 0x30, 'PSU1', owner=0x2c)), None)
+        # no numeric reading
+        self.assertEqual(sdr.parse_record(
+            full_sensor_record(3, 0x30, 'PSU1', analog=3)), None)
+        record = full_sensor_record(3, 0x30, 'PSU1')
+        # compact sensor record
+        self.assertEqual(
+            sdr.parse_record(record[:3] + '\x02' + record[4:]), None)
+
+    def test_twos_complement(self):
+        sensor = sdr.parse_record(
+            full_sensor_record(3, 0x30, 'Inlet', analog=2))
+        self.assertEqual(sdr.convert(sensor, 0xfe), -2)
+
+    def test_check_reading(self):
+        sensor = sdr.parse_record(full_sensor_record(3, 0x30, 'CPU1 Temp'))
+        self.assertEqual(sdr.check_reading(sensor, '\x28\xc0\x00'), None)
+        self.assertEqual(
+            sdr.check_reading(sensor, '\x5f\xc0\x18'),
+            (True, 'CPU1 Temp 95 C above upper critical')
+        )
+        self.assertEqual(
+            sdr.check_reading(sensor, '\x05\xc0\x01'),
+            (False, 'CPU1 Temp 5 C below lower non-critical')
+        )
+        # reading unavailable
+        self.assertEqual(sdr.check_reading(sensor, '\x5f\xe0\x18'), None)
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache', 'sdr.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_saved_until_sdr_changes(self):
+        cache = sdr.SDRCache(self.path)
+        cache.put('10.0.0.1', [1, 0], [{'number': 1}])
+        cache.save()
+        cache = sdr.SDRCache(self.path)
+        cache.load()
+        self.assertEqual(cache.get('10.0.0.1', [1, 0]), [{'number': 1}])
+        self.assertEqual(cache.get('10.0.0.1', [2, 0]), None)
+        self.assertEqual(cache.get('10.0.0.2', [1, 0]), None)
+
+    def test_processes_do_not_lose_repositories(self):
+        first = sdr.SDRCache(self.path)
+        second = sdr.SDRCache(self.path)
+        first.put('10.0.0.1', [1, 0], [])
+        second.put('10.0.0.2', [1, 0], [])
+        first.save()
+        second.save()
+        cache = sdr.SDRCache(self.path)
+        cache.load()
+        self.assertEqual(
+            sorted(cache.repositories), ['10.0.0.1', '10.0.0.2'])
+
+
+class SensorsTestMixin(object):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        sdr._cache = sdr.SDRCache(os.path.join(self.dir, 'sdr.json'))
+        self.bmc = FakeBMC()
+        self.bmc.sdr = [
+            full_sensor_record(1, 0x30, 'CPU1 Temp'),
+            full_sensor_record(2, 0x31, 'CPU2 Temp'),
+            full_sensor_record(3, 0x40, 'FAN1', unit=18, m=100),
+            full_sensor_record(4, 0x50, 'PSU1', owner=0x2c),
+        ]
+        self.bmc.readings = {
+            0x30: (40, 0x00),
+            0x31: (95, 0x18),
+            0x40: (3, 0x01),
+        }
+        lanplus._client = lanplus.Client(2, 4, port=self.bmc.port)
+        self.engine = self.make_engine()
+
+    def tearDown(self):
+        lanplus.shutdown()
+        scheduler.shutdown()
+        sdr.reset()
+        self.bmc.close()
+        shutil.rmtree(self.dir)
+
+    def check_sensors(self, nodes=1):
+        jobs = []
+        for i in range(nodes):
+            check = IPMIStatus(
+                'node00{}'.format(i), '127.0.0.1', 'admin', 'secret',
+                timeout=2)
+            check.answer = {'status': 'ON', 'history': [], 'details': ''}
+            jobs.append(('ipmi', check.check_sensors, ()))
+        results = self.engine.run_all(jobs)
+        return results if nodes > 1 else results[0]
+
+    def get_sdr_count(self):
+        return len([r for r in self.bmc.received if r[:2] == (0x0a, 0x23)])
+
+    def test_out_of_range(self):
+        self.assertEqual(self.check_sensors(), [
+            (True, 'CPU2 Temp 95 C above upper critical'),
+            (False, 'FAN1 300 RPM below lower non-critical'),
+        ])
+        readings = [r[2] for r in self.bmc.received if r[:2] == (4, 0x2d)]
+        self.assertEqual(readings, ['\x30', '\x31', '\x40'])
+
+    def test_sdr_is_cached(self):
+        self.check_sensors()
+        downloaded = self.get_sdr_count()
+        self.assertTrue(downloaded)
+        self.check_sensors()
+        self.assertEqual(self.get_sdr_count(), downloaded)
+        # repository changed
+        self.bmc.sdr = self.bmc.sdr[:1]
+        self.bmc.sdr_stamp = (2, 0)
+        self.assertEqual(self.check_sensors(), [])
+        self.assertGreater(self.get_sdr_count(), downloaded)
+
+    def test_nodes_with_one_bmc(self):
+        self.check_sensors()
+        downloaded = self.get_sdr_count()
+        sdr._cache = sdr.SDRCache(os.path.join(self.dir, 'other.json'))
+        self.bmc.received = []
+        results = self.check_sensors(nodes=4)
+        self.assertEqual([len(alerts) for alerts in results], [2] * 4)
+        self.assertEqual(self.get_sdr_count(), downloaded)
+
+    def test_reservation_cancelled(self):
+        get_sdr = self.bmc.get_sdr
+        state = {'cancelled': False}
+
+        def cancel_once(data):
+            reservation, record_id, offset, count = struct.unpack(
+                '<HHBB', data)
+            if record_id == 2 and offset and not state['cancelled']:
+                state['cancelled'] = True
+                self.bmc.reservation += 1
+            return get_sdr(data)
+
+        self.bmc.commands[(0x0a, 0x23)] = cancel_once
+        self.assertEqual(len(self.check_sensors()), 2)
+        self.assertTrue(state['cancelled'])
+
+    def test_no_sdr(self):
+        del self.bmc.commands[(0x0a, 0x20)]
+        self.assertEqual(self.check_sensors(), None)
+
+
+class ThreadSensorsTest(SensorsTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return ThreadEngine(fanout=4)
+
+
+class EventSensorsTest(SensorsTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return EventEngine(fanout=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
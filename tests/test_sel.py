@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from tests.fakebmc import FakeBMC, sel_entry
+from trix_status import lanplus, scheduler, sel
+from trix_status.engine import EventEngine, ThreadEngine
+from trix_status.nodes.ipmistatus import IPMIStatus
+
+
+class EntryTest(unittest.TestCase):
+
+    def test_parse_entry(self):
+        entry = sel_entry(0x12, 1500000000, 0x0c, 0x60, 0x01)
+        self.assertEqual(sel.parse_entry(entry), (0x12, 1500000000))
+
+    def test_classify(self):
+        self.assertEqual(
+            sel.classify(sel_entry(1, 1, 0x0c, 0x60, 0x01)),
+            (True, 'Memory 0x60 uncorrectable ECC'))
+        self.assertEqual(
+            sel.classify(sel_entry(1, 1, 0x01, 0x30, 0x57, event_type=1)),
+            (False, 'Temperature 0x30 upper non-critical going high'))
+        # informational
+        self.assertEqual(
+            sel.classify(sel_entry(1, 1, 0x08, 0x70, 0x00)), None)
+        self.assertEqual(
+            sel.classify(sel_entry(1, 1, 0x0c, 0x60, 0x01, deassertion=True)),
+            None)
+        # OEM record
+        entry = sel_entry(1, 1, 0x0c, 0x60, 0x01)
+        self.assertEqual(sel.classify(entry[:2] + '\xc0' + entry[3:]), None)
+
+
+class SELTestMixin(object):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        sel._log = sel.SELLog(os.path.join(self.dir, 'sel.json'))
+        self.bmc = FakeBMC()
+        self.bmc.add_sel(
+            sel_entry(1, 1000, 0x0c, 0x60, 0x01),
+            sel_entry(2, 1001, 0x08, 0x70, 0x00),
+        )
+        lanplus._client = lanplus.Client(2, 4, port=self.bmc.port)
+        self.engine = self.make_engine()
+
+    def tearDown(self):
+        lanplus.shutdown()
+        scheduler.shutdown()
+        sel.reset()
+        self.bmc.close()
+        shutil.rmtree(self.dir)
+
+    def check_sel(self, nodes=1):
+        jobs = []
+        for i in range(nodes):
+            check = IPMIStatus(
+                'node00{}'.format(i), '127.0.0.1', 'admin', 'secret',
+                timeout=2)
+            check.answer = {'status': 'ON', 'history': [], 'details': ''}
+            jobs.append(('ipmi', check.check_sel, ()))
+        results = self.engine.run_all(jobs)
+        return results if nodes > 1 else results[0]
+
+    def entries_read(self):
+        read = [r[2][2:4] for r in self.bmc.received if r[:2] == (0x0a, 0x43)]
+        self.bmc.received = []
+        return read
+
+    def test_old_events_are_not_reported(self):
+        self.assertEqual(self.check_sel(), [])
+        # only the last entry is read
+        self.assertEqual(self.entries_read(), ['\xff\xff'])
+
+    def test_only_new_entries_are_read(self):
+        self.check_sel()
+        self.entries_read()
+        self.assertEqual(self.check_sel(), [])
+        # SEL did not change
+        self.assertEqual(self.entries_read(), [])
+        self.bmc.add_sel(
+            sel_entry(3, 1002, 0x07, 0x80, 0x01),
+            sel_entry(4, 1003, 0x01, 0x30, 0x57, event_type=1),
+        )
+        self.assertEqual(self.check_sel(), [
+            (True, 'Processor 0x80 thermal trip'),
+            (False, 'Temperature 0x30 upper non-critical going high'),
+        ])
+        self.assertEqual(
+            self.entries_read(), ['\x02\x00', '\x03\x00', '\x04\x00'])
+        # events are shown until they expire
+        self.assertEqual(len(self.check_sel()), 2)
+        sel._log.hold = 0
+        self.assertEqual(self.check_sel(), [])
+
+    def test_cleared_log(self):
+        self.check_sel()
+        self.bmc.clear_sel()
+        self.bmc.add_sel(sel_entry(1, 2000, 0x08, 0x70, 0x01))
+        self.assertEqual(
+            self.check_sel(), [(True, 'Power Supply 0x70 failure')])
+
+    def test_wrapped_log(self):
+        self.check_sel()
+        # the last entry seen was overwritten
+        self.bmc.sel = [
+            sel_entry(5, 999, 0x0c, 0x61, 0x01),
+            sel_entry(6, 1002, 0x0c, 0x62, 0x01),
+        ]
+        self.bmc.add_sel()
+        self.assertEqual(
+            self.check_sel(), [(True, 'Memory 0x62 uncorrectable ECC')])
+
+    def test_watermarks_are_kept_between_runs(self):
+        self.check_sel()
+        sel._log.save()
+        sel._log = sel.SELLog(sel._log.path)
+        sel._log.load()
+        self.entries_read()
+        self.bmc.add_sel(sel_entry(3, 1002, 0x0c, 0x60, 0x00))
+        self.assertEqual(
+            self.check_sel(), [(False, 'Memory 0x60 correctable ECC')])
+        self.assertEqual(self.entries_read(), ['\x02\x00', '\x03\x00'])
+
+    def test_nodes_with_one_bmc(self):
+        self.check_sel()
+        self.bmc.add_sel(sel_entry(3, 1002, 0x0c, 0x60, 0x01))
+        self.entries_read()
+        self.assertEqual(
+            [len(events) for events in self.check_sel(nodes=4)], [1] * 4)
+        self.assertEqual(self.entries_read(), ['\x02\x00', '\x03\x00'])
+
+    def test_no_sel(self):
+        del self.bmc.commands[(0x0a, 0x40)]
+        self.assertEqual(self.check_sel(), None)
+
+
+class ThreadSELTest(SELTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return ThreadEngine(fanout=4)
+
+
+class EventSELTest(SELTestMixin, unittest.TestCase):
+
+    def make_engine(self):
+        return EventEngine(fanout=4)
+
+
+class HoldTest(unittest.TestCase):
+
+    def test_held(self):
+        sel_log = sel.SELLog('/nonexistent', hold=60)
+        now = time.time()
+        watermark = {'events': [
+            [now - 120, True, 'old'],
+            [now - 30, False, 'recent'],
+        ]}
+        self.assertEqual(sel_log.held(watermark, now), [(False, 'recent')])
+        self.assertEqual(sel_log.held(None, now), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
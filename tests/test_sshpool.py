@@ -0,0 +1,90 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from trix_status.sshpool import SSHPool, MAX_SOCKET_PATH
+
+
+class SSHPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        # ssh which behaves like a master: waits until it is stopped
+        self.bindir = tempfile.mkdtemp()
+        ssh = os.path.join(self.bindir, 'ssh')
+        with open(ssh, 'w') as f:
+            f.write("#!/bin/sh\nexec sleep 100\n")
+        os.chmod(ssh, stat.S_IRWXU)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.bindir + os.pathsep + self.path
+        self.pool = SSHPool(max_masters=2)
+
+    def tearDown(self):
+        self.pool.close()
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.bindir)
+
+    def test_one_master_per_host(self):
+        options = self.pool.options('node001', 10)
+        self.assertEqual(options, self.pool.options('node001', 10))
+        self.assertIn(
+            'ControlPath={}'.format(self.pool.control_path('node001')),
+            options
+        )
+        self.assertEqual(len(self.pool.masters), 1)
+
+    def test_max_masters(self):
+        self.pool.options('node001', 10)
+        self.pool.options('node002', 10)
+        self.assertEqual(self.pool.options('node003', 10), [])
+        self.assertNotEqual(self.pool.options('node002', 10), [])
+
+    def test_close_stops_masters(self):
+        self.pool.options('node001', 10)
+        master = self.pool.masters['node001']
+        self.pool.close()
+        self.assertNotEqual(master.poll(), None)
+        self.assertFalse(os.path.exists(self.pool.control_dir))
+        self.assertEqual(self.pool.options('node001', 10), [])
+
+    def test_long_host_name(self):
+        path = self.pool.control_path('n' * 200)
+        self.assertLessEqual(len(path), MAX_SOCKET_PATH)
+
+
+class ControlDirTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'control')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_private_dir_is_used(self):
+        pool = SSHPool(persist=60, control_dir=self.path)
+        self.assertEqual(pool.control_dir, self.path)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o700)
+        # the next run finds it
+        self.assertEqual(
+            SSHPool(persist=60, control_dir=self.path).control_dir, self.path)
+
+    def test_open_dir_is_not_used(self):
+        os.mkdir(self.path, 0o755)
+        os.chmod(self.path, 0o755)
+        pool = SSHPool(persist=60, control_dir=self.path)
+        self.assertNotEqual(pool.control_dir, self.path)
+        shutil.rmtree(pool.control_dir)
+
+    def test_symlink_is_not_used(self):
+        target = os.path.join(self.tmpdir, 'target')
+        os.mkdir(target, 0o700)
+        os.symlink(target, self.path)
+        pool = SSHPool(persist=60, control_dir=self.path)
+        self.assertNotEqual(pool.control_dir, self.path)
+        shutil.rmtree(pool.control_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
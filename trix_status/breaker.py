@@ -0,0 +1,127 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Circuit breakers for cluster-wide dependencies (Zabbix API, DNS).
+Once a dependency failed 'failures' times in a row, checks using it
+fail immediately instead of waiting for their own timeouts.
+After 'reset' seconds one check is let through to probe for recovery.
+
+    breaker:
+      failures: 5   # 0 disables breakers
+      reset: 30
+'''
+
+
+import logging
+import threading
+import time
+
+from trix_status import utils
+
+log = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, name, failures=5, reset=30):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.name = name
+        self.max_failures = int(failures)
+        self.reset = float(reset)
+        self.state = CLOSED
+        self.failures = 0
+        self.last_error = ''
+        self.opened = None
+        self.probe_started = None
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        True if the dependency can be used.
+        In half-open state only one caller gets True
+        """
+        if self.max_failures <= 0:
+            return True
+        with self.lock:
+            now = time.time()
+            if self.state == OPEN and now - self.opened >= self.reset:
+                self._set_state(HALF_OPEN)
+                self.probe_started = None
+            if self.state == HALF_OPEN:
+                # probe which did not report back does not hold it forever
+                if (self.probe_started is None
+                        or now - self.probe_started >= self.reset):
+                    self.probe_started = now
+                    return True
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def failure(self, error=''):
+        with self.lock:
+            self.failures += 1
+            self.last_error = error
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED
+                    and 0 < self.max_failures <= self.failures):
+                self.opened = time.time()
+                self._set_state(OPEN)
+
+    def reason(self):
+        """
+        Explanation for the checks which were not allowed to run
+        """
+        msg = "{} is failing, circuit is open".format(self.name)
+        if self.last_error:
+            msg += " (last error: {})".format(self.last_error)
+        return msg
+
+    def _set_state(self, state):
+        # should be called with self.lock acquired
+        self.log.debug(
+            "{}: {} -> {} after {} failures".format(
+                self.name, self.state, state, self.failures)
+        )
+        self.state = state
+
+
+def get_breaker(name):
+    """
+    Returns process-wide breaker for dependency 'name'
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            conf = utils.get_config('breaker', {'failures': 5, 'reset': 30})
+            _breakers[name] = CircuitBreaker(
+                name, conf['failures'] or 0, conf['reset'])
+        return _breakers[name]
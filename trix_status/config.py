@@ -23,6 +23,8 @@ available_checks = {
     "zabbix":   "Zabbix",
 }
 
+available_engines = ['threads', 'events']
+
 config_file = "/etc/trinity/trix-status.conf"
 
 default_service_list = [
@@ -1,12 +1,13 @@
-from trix_status.utils import run_cmd, get_config
+from trix_status.utils import run_cmd, ssh_cmd, get_config
 from trix_status.config import category
 from trix_status.controllers.systemdchecks import SystemdChecks
 import os
 import logging
 import xml.etree.ElementTree as ET
-from multiprocessing.pool import ThreadPool
 from multiprocessing import Lock
+from trix_status.engine import get_engine, Command, Hedged, Return
 from trix_status.config import default_service_list
+from trix_status import deadline
 
 
 class HAStatus(SystemdChecks):
@@ -17,6 +18,7 @@ class HAStatus(SystemdChecks):
         self.hosts = [os.uname()[1]]
         self.downed_hosts = set([])
         self.services = []
+        self.expired = False
         self.ha_status = ha_status
         self.out = out
         self.args = args
@@ -39,7 +41,7 @@ class HAStatus(SystemdChecks):
         return res
 
     def if_ha(self):
-        rc, stdout, stderr, exc = run_cmd("crm_mon -r -1 -X")
+        rc, stdout, stderr, exc = run_cmd(['crm_mon', '-r', '-1', '-X'])
         if rc == 127:  # command not found
             return False
         if rc == 107:  # stopped?
@@ -159,27 +161,27 @@ class HAStatus(SystemdChecks):
         return answer
 
     def check_drbd(self, answer, res, host):
-        cmd = 'ssh -o ConnectTimeout={} -o StrictHostKeyChecking=no {} '
-        cmd = cmd.format(self.args.timeout, host)
-        cmd += 'drbd-overview | grep trinity'
-        rc, stdout, stderr, exc = run_cmd(cmd)
+        cmd = ssh_cmd(host, ['drbd-overview'], self.args.timeout)
+        rc, stdout, stderr, exc = yield Command(cmd)
+        stdout = [line for line in stdout.split('\n') if 'trinity' in line]
 
-        if rc:
+        if rc or not stdout:
             answer['status'] = 'ERR'
             answer['category'] = category.ERROR
-            answer['details'] = "{} returned non-zero exit code".format(cmd)
-            return answer
+            answer['details'] = "{} returned non-zero exit code".format(
+                " ".join(cmd))
+            raise Return(answer)
 
-        stdout = stdout.strip()
+        stdout = stdout[0].strip()
         stdout = stdout.split()
 
         if len(stdout) < 4 or stdout[3] < 7 or stdout[3][:6] != 'UpToDa':
             answer['status'] = 'ERR'
             answer['category'] = category.ERROR
             answer['details'] = 'DRBD status is not UpToDate'
-            return answer
+            raise Return(answer)
 
-        return answer
+        raise Return(answer)
 
     def check_zfs(self, answer, res, host):
         running_on = [e['name'] for e in res['running_on']]
@@ -187,37 +189,39 @@ class HAStatus(SystemdChecks):
             answer['status'] = 'ERR'
             answer['category'] = category.ERROR
             answer['details'] = "ZFS is not running anywhere"
-            return answer
+            raise Return(answer)
 
         if len(running_on) > 1:
             answer['status'] = 'ERR'
             answer['category'] = category.ERROR
             answer['details'] = "pcs reported ZFS is mounted on 2 nodes"
-            return answer
+            raise Return(answer)
 
         running_on = running_on[0]
 
-        cmd = 'ssh -o ConnectTimeout={} -o StrictHostKeyChecking=no {} '
-        cmd = cmd.format(self.args.timeout, host)
-        cmd += 'zpool list -H -o name,health'
-        rc, stdout, stderr, exc = run_cmd(cmd)
+        cmd = ssh_cmd(
+            host, ['zpool', 'list', '-H', '-o', 'name,health'],
+            self.args.timeout
+        )
+        rc, stdout, stderr, exc = yield Command(cmd)
 
         if rc:
             answer['status'] = 'ERR'
             answer['category'] = category.ERROR
-            answer['details'] = "'{}' returned non-zero exit code".format(cmd)
-            return answer
+            answer['details'] = "'{}' returned non-zero exit code".format(
+                " ".join(cmd))
+            raise Return(answer)
 
         if stdout and host != running_on:
             answer['status'] = 'ERR'
             answer['category'] = category.ERROR
             answer['details'] = (
                 "'{}' returned some output on passive node"
-            ).format(cmd)
-            return answer
+            ).format(" ".join(cmd))
+            raise Return(answer)
 
         if host != running_on:
-            return answer
+            raise Return(answer)
 
         stdout = stdout.strip().split('\n')
         for line in stdout:
@@ -229,57 +233,66 @@ class HAStatus(SystemdChecks):
                     "Status of '{}' is '{}'"
                 ).format(name, status)
         if answer['category'] != category.GOOD:
-            return answer
+            raise Return(answer)
 
         answer['status'] = 'ONLINE'
-        return answer
+        raise Return(answer)
 
     def get_downed_hosts(self, hosts):
         if self.out is None:
             return
-        downed = []
-        answers = []
-        for host in hosts:
-            answer = {
-                'column': host,
-                'status': 'UNKN',
-                'category': category.UNKN,
-                'history': [],
-                'info': '',
-                'details': ''
-            }
-            cmd = (
-                "ssh -o ConnectTimeout={} -o StrictHostKeyChecking=no {} uname"
-            ).format(self.args.timeout, host)
-            rc, stdout, stderr, exc = run_cmd(cmd)
-            if rc:
-                answer['status'] = 'DOWN'
-                answer['category'] = category.BAD
-                downed.append(host)
-            if rc == 0:
-                answer['status'] = 'OK'
-                answer['category'] = category.GOOD
-            answers.append(answer)
+        answers = get_engine(self.args).map('ssh', self.ssh_worker, hosts)
+        answers = [
+            answer if answer is not None else deadline.timeout_answer(host)
+            for host, answer in zip(hosts, answers)
+        ]
+        downed = [
+            answer['column'] for answer in answers
+            if answer['status'] == 'DOWN'
+        ]
         self.log.debug("Hosts: '{}' are down".format(str(downed)))
         self.out.line('ssh', answers)
         return set(downed)
 
+    def ssh_worker(self, host):
+        answer = {
+            'column': host,
+            'status': 'UNKN',
+            'category': category.UNKN,
+            'history': [],
+            'info': '',
+            'details': ''
+        }
+        cmd = ssh_cmd(host, ['uname'], self.args.timeout)
+        rc, stdout, stderr, exc = yield Hedged(Command(cmd), 'ssh')
+        if rc:
+            answer['status'] = 'DOWN'
+            answer['category'] = category.BAD
+        if rc == 0:
+            answer['status'] = 'OK'
+            answer['category'] = category.GOOD
+        raise Return(answer)
+
     def process_ha_resources(self):
         self.downed_hosts = self.get_downed_hosts(self.hosts)
-        self.log.debug('Start thread pool')
-        thread_pool = ThreadPool(processes=self.args.fanout)
+        self.log.debug('Get engine')
+        engine = get_engine(self.args)
         self.lock = Lock()
-        self.log.debug('Map main workers to threads')
+        self.log.debug('Map main workers to engine')
 
-        workers_return = thread_pool.map(
-            self.ha_resources_worker, self.ha_status['resources']
+        workers_return = engine.map(
+            'resource', self.ha_resources_worker, self.ha_status['resources']
+        )
+        self.out_expired(
+            [res['id'] for res in self.ha_status['resources']],
+            workers_return, self.node_ids.values()
         )
 
         return workers_return
 
     def ha_resources_worker(self, res):
         if self.out is None:
-            return
+            raise Return(None)
         self.log.debug('Resource dic: {}'.format(res))
         service = "{}({})".format(res['id'], res['role'])
         service = res['id']
@@ -302,26 +315,29 @@ class HAStatus(SystemdChecks):
                 service = res['resource_agent'].split(':')[-1]
                 host = self.node_ids[node_id]
                 need_started = host in [e['name'] for e in res['running_on']]
-                answer = self.check_systemd_unit(
+                answer = yield self.check_systemd_unit(
                     answer, service, host,
                     need_enabled=False, need_started=need_started
                 )
 
             if res['resource_agent'].split(':')[-1] == 'drbd':
-                answer = self.check_drbd(
+                answer = yield self.check_drbd(
                     answer, res, self.node_ids[node_id]
                 )
 
             if res['resource_agent'].split(':')[-1] == 'ZFS':
-                answer = self.check_zfs(
+                answer = yield self.check_zfs(
                     answer, res, self.node_ids[node_id]
                 )
 
             answers.append(answer)
 
         with self.lock:
-            self.out.line(service, answers)
-            self.out.statusbar()
+            if not self.expired:
+                self.out.line(service, answers)
+                self.out.statusbar()
+
+        raise Return(answers)
 
     def process_default_services(self):
         services = get_config(
@@ -335,13 +351,15 @@ class HAStatus(SystemdChecks):
         # nfs is special
         services = [e for e in services if e not in ha_services and e != 'nfs']
 
-        thread_pool = ThreadPool(processes=self.args.fanout)
+        self.log.debug('Get engine')
+        engine = get_engine(self.args)
         self.lock = Lock()
-        self.log.debug('Map main workers to threads')
+        self.log.debug('Map main workers to engine')
 
-        workers_return = thread_pool.map(
-            self.default_services_worker, services
+        workers_return = engine.map(
+            'service', self.default_services_worker, services
         )
+        self.out_expired(services, workers_return, self.node_ids.values())
 
         return workers_return
 
@@ -356,19 +374,20 @@ class HAStatus(SystemdChecks):
                 'info': '',
                 'details': ''
             }
-            answer = self.check_systemd_unit(
+            answer = yield self.check_systemd_unit(
                 answer, service, host=host,
             )
             answers.append(answer)
 
         with self.lock:
-            self.out.line(service, answers)
+            if not self.expired:
+                self.out.line(service, answers)
 
-        return answers
+        raise Return(answers)
 
     def check_fencing(self):
         stonith_conf = []
-        rc, stdout, stderr, exc = run_cmd("pcs property")
+        rc, stdout, stderr, exc = run_cmd(['pcs', 'property'])
         stonith_enabled = 'false'
         if rc == 0:
             stdout = stdout.split('\n')
@@ -1,9 +1,9 @@
 import os
 import logging
 from trix_status.controllers.systemdchecks import SystemdChecks
-from multiprocessing.pool import ThreadPool
 from multiprocessing import Lock
-from trix_status.utils import get_config, run_cmd
+from trix_status.engine import get_engine, Return
+from trix_status.utils import get_config
 from trix_status.config import category
 import importlib
 from trix_status.config import default_service_list
@@ -17,6 +17,7 @@ class NonHAStatus(SystemdChecks):
         self.out = out
         self.args = args
         self.host = os.uname()[1]
+        self.expired = False
         self.services = get_config(
             'controllers', {'services': default_service_list}
         )['services']
@@ -30,17 +31,19 @@ class NonHAStatus(SystemdChecks):
 			'info': '',
 			'details': ''
         }
-        answer = self.check_systemd_unit(answer, service)
+        answer = yield self.check_systemd_unit(answer, service)
         with self.lock:
-            self.out.line(service, [answer])
-        return [answer]
+            if not self.expired:
+                self.out.line(service, [answer])
+        raise Return([answer])
 
     def get(self):
-        self.log.debug('Start thread pool')
-        thread_pool = ThreadPool(processes=self.args.fanout)
+        self.log.debug('Get engine')
+        engine = get_engine(self.args)
         self.lock = Lock()
-        self.log.debug('Map main workers to threads')
-        workers_return = thread_pool.map(
-            self.systemd_worker, self.services
+        self.log.debug('Map main workers to engine')
+        workers_return = engine.map(
+            'service', self.systemd_worker, self.services
         )
+        self.out_expired(self.services, workers_return, [self.host])
 
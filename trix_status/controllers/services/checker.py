@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+from trix_status.utils import ssh_cmd
 import logging
 
 
@@ -8,15 +9,18 @@ class Checker(object):
 
     def __init__(self, args, host=None):
         self.timeout = args.timeout
-        if host is None:
-            self.cmd_prefix = ""
-        else:
-            self.cmd_prefix = (
-                "ssh -o ConnectTimeout={} -o StrictHostKeyChecking=no {} "
-            ).format(self.timeout, host)
+        self.host = host
         module_name = self.__module__ + "." + type(self).__name__
         self.log = logging.getLogger(module_name)
 
+    def remote(self, argv):
+        """
+        Returns arguments to run 'argv' on the checked host
+        """
+        if self.host is None:
+            return argv
+        return ssh_cmd(self.host, argv, self.timeout)
+
     @abstractmethod
     def status(self):
         res, comment = True, ""
@@ -7,20 +7,19 @@ class Chronyd(Checker):
     def status(self):
         res, comment = True, ''
 
-        cmd = self.cmd_prefix
-        cmd += 'chronyc tracking'
+        cmd = self.remote(['chronyc', 'tracking'])
         rc, stdout, stderr, exc = run_cmd(cmd)
 
         if rc != 0:
             res = False
-            comment = "'{}' exit code is not 0".cormat(cmd)
+            comment = "'{}' exit code is not 0".format(" ".join(cmd))
             return res, comment
 
         stdout = stdout.split('\n')
 
         if len(stdout) < 1:
             res = False
-            comment = "'{}' returned no output".format(cmd)
+            comment = "'{}' returned no output".format(" ".join(cmd))
             return res, comment
 
         line1 = stdout[0]
@@ -32,19 +31,18 @@ class Chronyd(Checker):
             comment = 'Computer is not synchronised to any external source.'
             return res, comment
 
-        cmd = self.cmd_prefix
-        cmd += 'chronyc sources'
+        cmd = self.remote(['chronyc', 'sources'])
         rc, stdout, stderr, exc = run_cmd(cmd)
 
         if rc != 0:
             res = False
-            comment = "'{}' exit code is not 0".cormat(cmd)
+            comment = "'{}' exit code is not 0".format(" ".join(cmd))
             return res, comment
 
         stdout = stdout.strip().split('\n')
         if len(stdout) < 1:
             res = False
-            comment = "'{}' returned no output".format(cmd)
+            comment = "'{}' returned no output".format(" ".join(cmd))
             return res, comment
 
         try:
@@ -54,7 +52,8 @@ class Chronyd(Checker):
 
         if n_sources < 1:
             res = False
-            comment = "'{}' did not return numnber of sources".format(cmd)
+            comment = "'{}' did not return numnber of sources".format(
+                " ".join(cmd))
             return res, comment
 
         try:
@@ -66,7 +65,8 @@ class Chronyd(Checker):
 
         if not is_current_synced:
             res = False
-            comment = "'{}' returned no currenly synced servers".format(cmd)
+            comment = "'{}' returned no currenly synced servers".format(
+                " ".join(cmd))
             return res, comment
 
         return res, comment
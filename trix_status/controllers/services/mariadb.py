@@ -8,17 +8,12 @@ class Mariadb(Checker):
         res, comment = True, ""
 
         num = "123"
-        cmd = self.cmd_prefix
-        if self.cmd_prefix:
-            cmd += '"'
-        cmd += "mysql -e 'select " + num + ";' -s -r"
-        if self.cmd_prefix:
-            cmd += '"'
+        cmd = self.remote(['mysql', '-e', 'select ' + num + ';', '-s', '-r'])
         rc, stdout, srderr, exc = run_cmd(cmd)
         stdout = stdout.strip()
         if rc or stdout != num:
             res = False
-            comment = '{} returned unexpected result'.format(cmd)
+            comment = '{} returned unexpected result'.format(" ".join(cmd))
             return res, comment
 
         return res, comment
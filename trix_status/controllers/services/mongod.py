@@ -8,19 +8,14 @@ class Mongod(Checker):
         res, comment = True, ""
 
         ping = "111222333"
-        cmd = self.cmd_prefix
-        if self.cmd_prefix:
-            cmd += '"'
-        cmd += "mongo --eval '{ping: " + ping + "}'"
-        if self.cmd_prefix:
-            cmd += '"'
+        cmd = self.remote(['mongo', '--eval', '{ping: ' + ping + '}'])
         rc, stdout, stderr, exc = run_cmd(cmd)
 
         stdout = stdout.strip().split('\n')
 
         if rc or len(stdout) < 1 or stdout[-1] != ping:
             res = False
-            comment = "'{}' returned no ping".format(cmd)
+            comment = "'{}' returned no ping".format(" ".join(cmd))
             return res, comment
 
         return res, comment
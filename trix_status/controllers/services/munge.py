@@ -7,21 +7,28 @@ class Munge(Checker):
     def status(self):
         res, comment = True, ""
 
-        cmd = self.cmd_prefix
-        cmd += 'munge -n | unmunge'
+        # credential is created on the checked host, but decoded locally
+        cmd = self.remote(['munge', '-n'])
         rc, stdout, stderr, exc = run_cmd(cmd)
+        if rc:
+            res = False
+            comment = "'{}' returned error".format(" ".join(cmd))
+            return res, comment
+
+        cmd = ['unmunge']
+        rc, stdout, stderr, exc = run_cmd(cmd, input=stdout)
 
         stdout = stdout.strip().split('\n')
 
         if len(stdout) < 1 or len(stdout[0].split()) < 2:
             res = False
-            comment = "'{}' returned no status".format(cmd)
+            comment = "'{}' returned no status".format(" ".join(cmd))
             return res, comment
 
         status = stdout[0].split()[1]
         if rc or status != 'Success':
             res = False
-            comment = "'{}' returned error".format(cmd)
+            comment = "'{}' returned error".format(" ".join(cmd))
             return res, comment
 
         return res, comment
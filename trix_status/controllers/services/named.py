@@ -6,15 +6,15 @@ class Named(Checker):
 
     def status(self):
         res, comment = True, ""
-        cmd = self.cmd_prefix
-        cmd += (
-            "dig +tries=1 +time={} +short @localhost localhost"
-        ).format(self.timeout)
+        cmd = self.remote([
+            'dig', '+tries=1', '+time={}'.format(self.timeout),
+            '+short', '@localhost', 'localhost'
+        ])
         expected = "127.0.0.1"
         rc, stdout, stderr, exc = run_cmd(cmd)
         if rc or stdout.strip() != "127.0.0.1":
             comment = "'{}' did not return '{}'".format(
-                cmd, expected
+                " ".join(cmd), expected
             )
             res = False
         return res, comment
@@ -1,4 +1,5 @@
 from trix_status.utils import run_cmd
+from trix_status import ratelimit
 from trix_status.controllers.services.checker import Checker
 
 
@@ -7,18 +8,16 @@ class Slurmctld(Checker):
     def status(self):
         res, comment = True, ''
 
-        cmd = self.cmd_prefix
-        cmd += (
-            'scontrol ping'
-        )
+        cmd = self.remote(['scontrol', 'ping'])
 
+        ratelimit.wait('slurmctld')
         rc, stdout, stderr, exc = run_cmd(cmd, timeout=self.timeout)
         expected1 = 'Slurmctld(primary/backup) at '
         expected2 = ' are UP/DOWN'
 
         if rc != 0:
             res = False
-            comment = "'{}' exit code is not 0".cormat(cmd)
+            comment = "'{}' exit code is not 0".format(" ".join(cmd))
             return res, comment
 
         stdout = stdout.strip()
@@ -30,7 +29,7 @@ class Slurmctld(Checker):
             res = False
 
             comment = "Stdout of '{}' is not matching '{}...{}'".format(
-                cmd, expected1, expected2
+                " ".join(cmd), expected1, expected2
             )
 
             return res, comment
@@ -7,15 +7,15 @@ class Slurmdbd(Checker):
     def status(self):
         res, comment = True, ""
 
-        cmd = self.cmd_prefix
-        cmd += 'sacctmgr -n list cluster'
+        cmd = self.remote(['sacctmgr', '-n', 'list', 'cluster'])
         rc, stdout, stderr, exc = run_cmd(cmd)
 
         stdout = stdout.strip().split('\n')
 
         if rc or len(stdout) < 1 or len(stdout[0].split()) < 2:
             res = False
-            comment = "'{}' returned no clusters configured".format(cmd)
+            comment = "'{}' returned no clusters configured".format(
+                " ".join(cmd))
             return res, comment
 
         return res, comment
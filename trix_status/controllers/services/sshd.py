@@ -7,13 +7,13 @@ class Sshd(Checker):
     def status(self):
         res, comment = True, ""
 
-        cmd = self.cmd_prefix
-        cmd += 'ssh localhost uptime'
+        cmd = self.remote(['ssh', 'localhost', 'uptime'])
         rc, stdout, stderr, exc = run_cmd(cmd)
 
         if rc or len(stdout.strip().split('\n')) < 1:
             res = False
-            comment = "'{}' returned unexpected result".format(cmd)
+            comment = "'{}' returned unexpected result".format(
+                " ".join(cmd))
             return res, comment
 
         return res, comment
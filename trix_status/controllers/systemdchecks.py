@@ -1,4 +1,6 @@
-from trix_status.utils import run_cmd
+from trix_status.engine import Command, Call, Return
+from trix_status.utils import ssh_cmd
+from trix_status import deadline
 from trix_status.config import category
 import importlib
 
@@ -7,17 +9,13 @@ class SystemdChecks(object):
     def check_systemd_unit(self, answer, service, host=None,
                            need_started=True, need_enabled=True):
 
-        if host is not None:
-            cmd_prefix = (
-                "ssh -o ConnectTimeout={} -o StrictHostKeyChecking=no {} "
-            ).format(self.args.timeout, host)
+        def remote(argv):
+            if host is None:
+                return argv
+            return ssh_cmd(host, argv, self.args.timeout)
 
-        else:
-            cmd_prefix = ""
-
-        cmd = cmd_prefix
-        cmd += "systemctl is-enabled " + service
-        rc, stdout, stderr, exc = run_cmd(cmd)
+        cmd = remote(['systemctl', 'is-enabled', service])
+        rc, stdout, stderr, exc = yield Command(cmd)
 
         is_enabled = stdout.strip()
 
@@ -33,9 +31,8 @@ class SystemdChecks(object):
             answer['info'] = 'systemd'
             answer['details'] = 'Autostart is enabled for the unit.'
 
-        cmd = cmd_prefix
-        cmd += "systemctl status {}".format(service)
-        rc, stdout, stderr, exc = run_cmd(cmd)
+        cmd = remote(['systemctl', 'status', service])
+        rc, stdout, stderr, exc = yield Command(cmd)
 
         if rc:
             is_started = False
@@ -47,24 +44,38 @@ class SystemdChecks(object):
             answer['category'] = category.ERROR
             answer['info'] = 'systemd'
             answer['details'] = 'Unit should run on this host.'
-            return answer
+            raise Return(answer)
 
         if not need_started and is_started:
             answer['status'] = 'ERR'
             answer['category'] = category.ERROR
             answer['info'] = 'systemd'
             answer['details'] = 'Unit should not run on this host.'
-            return answer
+            raise Return(answer)
 
         if not is_started:
-            return answer
+            raise Return(answer)
 
         answer['status'] = 'UP'
         answer['category'] = category.GOOD
         answer['info'] = ''
 
-        answer = self.service_checker(answer, service, host)
-        return answer
+        answer = yield Call(self.service_checker, answer, service, host)
+        raise Return(answer)
+
+    def out_expired(self, names, results, columns):
+        """
+        Print TIMEOUT lines for the workers interrupted by deadline.
+        Workers finishing later should check self.expired before printing
+        """
+        with self.lock:
+            for name, result in zip(names, results):
+                if result is not None:
+                    continue
+                self.expired = True
+                self.out.line(
+                    name, [deadline.timeout_answer(e) for e in columns]
+                )
 
     def service_checker(self, answer, service, host=None):
         class_path = "trix_status.controllers.services." + service
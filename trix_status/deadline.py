@@ -0,0 +1,79 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Process-wide wall-clock budget set by '--deadline'.
+Every timeout is clamped to the time left, so nothing outlives it
+'''
+
+
+import time
+
+from trix_status.config import category
+
+_deadline = None
+_seconds = None
+
+
+def set_deadline(seconds):
+    """
+    Start the budget of 'seconds' from now. 0 or None disables it
+    """
+    global _deadline, _seconds
+    if not seconds:
+        _deadline, _seconds = None, None
+        return
+    _seconds = seconds
+    _deadline = time.time() + seconds
+
+
+def remaining():
+    """
+    Seconds left or None if there is no deadline
+    """
+    if _deadline is None:
+        return None
+    return max(0, _deadline - time.time())
+
+
+def exceeded():
+    return _deadline is not None and time.time() >= _deadline
+
+
+def clamp(timeout):
+    left = remaining()
+    if left is None:
+        return timeout
+    if timeout is None:
+        return left
+    return min(timeout, left)
+
+
+def timeout_answer(column, partial=None):
+    """
+    Answer for the check which did not finish in time.
+    'partial' is unfinished answer, its last history step
+    is shown as info
+    """
+    history = list((partial or {}).get('history', []))
+    return {
+        'column': column,
+        'status': 'TIMEOUT',
+        'category': category.UNKN,
+        'history': history,
+        'info': history[-1] if history else '',
+        'details': 'Deadline of {}s exceeded'.format(_seconds),
+    }
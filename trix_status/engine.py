@@ -0,0 +1,1093 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Checks are written as generators (coroutines) which yield operations
+defined below and get the result of the operation back:
+
+    def check_port(self):
+        rc = yield Connect(self.node, 22, self.timeout)
+        raise Return(rc == 0)
+
+Sub-coroutines can be yielded directly. Python 2 generators can not
+return a value, so Return exception is used for it.
+
+Two engines can drive the coroutines:
+'threads'   every coroutine occupies a scheduler worker and operations
+            are blocking calls
+'events'    all coroutines run in one thread on top of the reactor and
+            operations are non-blocking
+
+Once the deadline (see trix_status.deadline) is exceeded, unfinished
+jobs are cancelled and their result is None.
+'''
+
+
+import errno
+import logging
+import socket
+import threading
+import time
+import types
+import urllib2
+from collections import deque
+
+from trix_status import utils
+from trix_status import supervisor
+from trix_status import deadline
+from trix_status import ratelimit
+from trix_status import hedging
+from trix_status import icmp
+from trix_status import resolver
+from trix_status import portscan
+from trix_status import rmcp
+from trix_status import lanplus
+from trix_status.fanout import AIMD, BlockingLimiter, fd_limit
+from trix_status.reactor import Reactor, Future, Cancelled
+from trix_status.scheduler import get_scheduler
+
+_engine = None
+_engine_lock = threading.Lock()
+# set by ThreadEngine in adaptive fanout mode
+_limiter = None
+
+
+class Return(Exception):
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+class Command(object):
+    """
+    Result is 'rc', 'stdout', 'stderr', 'exception' like utils.run_cmd.
+    'cmd' should be a list of arguments, 'input' is passed to stdin
+    """
+
+    def __init__(self, cmd, timeout=30, input=None):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.input = input
+
+
+class Hedged(object):
+    """
+    Command which is a probe of 'probe' type (ssh, ping).
+    With '--hedge' a second identical command is started if the first
+    is slower than usual, see trix_status.hedging
+    """
+
+    def __init__(self, command, probe):
+        self.command = command
+        self.probe = probe
+
+
+class Connect(object):
+    """
+    Result is 0 if TCP connection is established or errno
+    """
+
+    def __init__(self, host, port, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+
+class Scan(object):
+    """
+    TCP connect with optional read of the banner (see Reactor.scan).
+    Result is (rc, banner line)
+    """
+
+    def __init__(self, host, port, timeout=10, banner=False):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.banner = banner
+
+
+class Datagram(object):
+    """
+    Send UDP payload and wait for reply. Result is reply or None
+    """
+
+    def __init__(self, host, port, payload, timeout=10):
+        self.host = host
+        self.port = port
+        self.payload = payload
+        self.timeout = timeout
+
+
+class Ping(object):
+    """
+    ICMP echo from the in-process pinger (see trix_status.icmp).
+    Result is RTT in seconds or None if there was no reply.
+    Should be used only if icmp.get_pinger() is not None
+    """
+
+    def __init__(self, host, timeout=10):
+        self.host = host
+        self.timeout = timeout
+
+
+class RMCPPing(object):
+    """
+    RMCP presence ping of BMC (see trix_status.rmcp). Result is RTT
+    in seconds or None. Answer of the sweep is used if it was pinged
+    """
+
+    def __init__(self, host, timeout=10):
+        self.host = host
+        self.timeout = timeout
+
+
+class IPMIRequest(object):
+    """
+    IPMI command over RMCP+ session (see trix_status.lanplus).
+    Result is lanplus.Response. Should be used only
+    if lanplus.get_client() is not None
+    """
+
+    def __init__(self, host, username, password, netfn, cmd, data='',
+                 timeout=10):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.netfn = netfn
+        self.cmd = cmd
+        self.data = data
+        self.timeout = timeout
+
+
+class IPMIBatch(object):
+    """
+    (netfn, cmd, data) IPMI requests queued to the session of BMC
+    at once. Result is list of lanplus.Response in the same order
+    """
+
+    def __init__(self, host, username, password, requests, timeout=10):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.requests = requests
+        self.timeout = timeout
+
+
+class HTTPPost(object):
+    """
+    Result is body of the answer. Raises IOError on failures
+    """
+
+    def __init__(self, url, body, headers=None, timeout=10):
+        self.url = url
+        self.body = body
+        self.headers = headers or {}
+        self.timeout = timeout
+
+
+class Call(object):
+    """
+    Blocking fn(*args) which will be executed in a worker thread
+    """
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+
+class Sleep(object):
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class Throttle(object):
+    """
+    Wait until rate limit of the backend allows to use it
+    (see trix_status.ratelimit)
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+
+class Gather(object):
+    """
+    Run operations and/or coroutines in parallel.
+    Result is list of their results in the same order
+    """
+
+    def __init__(self, items, kind='gather'):
+        self.items = list(items)
+        self.kind = kind
+
+
+class Speculate(object):
+    """
+    Run operations and/or coroutines in parallel, but use their results
+    in order: result is the list of results up to and including the
+    first one 'decisive' returns True for. The rest are cancelled
+    (in 'threads' engine the running ones are left to finish),
+    so the list can be shorter than items
+    """
+
+    def __init__(self, items, decisive=None, kind='speculate'):
+        self.items = list(items)
+        self.decisive = decisive or (lambda result: not result)
+        self.kind = kind
+
+
+def is_coroutine(obj):
+    return isinstance(obj, types.GeneratorType)
+
+
+def _step(gen, value, exc):
+    """
+    Resume coroutine. Returns (done, op_or_result)
+    """
+    try:
+        if exc is not None:
+            op = gen.throw(exc)
+        else:
+            op = gen.send(value)
+    except Return as ret:
+        return True, ret.value
+    except StopIteration:
+        return True, None
+    return False, op
+
+
+def run_sync(item):
+    """
+    Run coroutine or operation in the calling thread
+    and return the result
+    """
+    if not is_coroutine(item):
+        return _execute_limited(item)
+    value, exc = None, None
+    while True:
+        if deadline.exceeded():
+            item.close()
+            raise Cancelled("Deadline exceeded")
+        done, op = _step(item, value, exc)
+        if done:
+            return op
+        try:
+            value, exc = run_sync(op), None
+        except Cancelled:
+            item.close()
+            raise
+        except Exception as e:
+            value, exc = None, e
+
+
+def _op_failed(op, result, exc):
+    """
+    True if the operation failed in a way overload can cause
+    """
+    # hedge losers, speculative probes and deadline are cancelled
+    # because of other answers, not overload
+    if isinstance(exc, Cancelled):
+        return False
+    if exc is not None:
+        return True
+    if isinstance(op, Hedged):
+        op = op.command
+    if isinstance(op, Command):
+        ssh_failed = result.rc == 255 and op.cmd[:1] == ['ssh']
+        return result.timed_out or ssh_failed
+    if isinstance(op, Scan):
+        result = result[0]
+    if isinstance(op, (Connect, Scan)):
+        return result in (errno.ETIMEDOUT, errno.ECONNREFUSED, errno.EAGAIN)
+    if isinstance(op, (Datagram, Ping)):
+        return result is None
+    if isinstance(op, IPMIRequest):
+        return result.error is not None
+    if isinstance(op, IPMIBatch):
+        return any(response.error is not None for response in result)
+    return False
+
+
+def _execute_limited(op):
+    limiter = _limiter
+    if limiter is None or not isinstance(
+            op, (Command, Hedged, Connect, Scan, Datagram, Ping,
+                 IPMIRequest, IPMIBatch, HTTPPost)):
+        return _execute_sync(op)
+    limiter.acquire()
+    started = time.time()
+    result, exc = None, None
+    try:
+        result = _execute_sync(op)
+        return result
+    except Exception as e:
+        exc = e
+        raise
+    finally:
+        limiter.release(
+            type(op).__name__, time.time() - started,
+            _op_failed(op, result, exc)
+        )
+
+
+def _execute_sync(op):
+
+    if isinstance(op, Command):
+        return utils.run_cmd(op.cmd, timeout=op.timeout, input=op.input)
+
+    if isinstance(op, Hedged):
+        return utils.run_cmd(
+            op.command.cmd, timeout=op.command.timeout,
+            input=op.command.input, probe=op.probe
+        )
+
+    if isinstance(op, Connect):
+        addr, error = resolver.get_resolver().lookup(op.host)
+        if addr is None:
+            return errno.EHOSTUNREACH
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(deadline.clamp(op.timeout))
+            return sock.connect_ex((addr, op.port))
+        except socket.timeout:
+            return errno.ETIMEDOUT
+        except socket.error as exc:
+            return exc.args[0] or errno.EHOSTUNREACH
+        finally:
+            sock.close()
+
+    if isinstance(op, Scan):
+        return portscan.get_scanner().scan(
+            op.host, op.port, deadline.clamp(op.timeout), op.banner)
+
+    if isinstance(op, Datagram):
+        addr, error = resolver.get_resolver().lookup(op.host)
+        if addr is None:
+            return None
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.settimeout(deadline.clamp(op.timeout))
+            sock.sendto(op.payload, (addr, op.port))
+            data, addr = sock.recvfrom(65536)
+            return data
+        except (socket.timeout, socket.error):
+            return None
+        finally:
+            sock.close()
+
+    if isinstance(op, Ping):
+        addr, error = resolver.get_resolver().lookup(op.host)
+        if addr is None:
+            return None
+        return icmp.get_pinger().ping_sync(addr, deadline.clamp(op.timeout))
+
+    if isinstance(op, RMCPPing):
+        addr, error = resolver.get_resolver().lookup(op.host)
+        if addr is None:
+            return None
+        return rmcp.get_pinger().ping_sync(addr, deadline.clamp(op.timeout))
+
+    if isinstance(op, IPMIRequest):
+        addr, error = resolver.get_resolver().lookup(op.host)
+        if addr is None:
+            return lanplus.Response(
+                "Unable to resolve {}".format(op.host), None, '')
+        return lanplus.get_client().request_sync(
+            addr, op.username, op.password, op.netfn, op.cmd, op.data,
+            deadline.clamp(op.timeout)
+        )
+
+    if isinstance(op, IPMIBatch):
+        addr, error = resolver.get_resolver().lookup(op.host)
+        if addr is None:
+            return [lanplus.Response(
+                "Unable to resolve {}".format(op.host), None, '')
+            ] * len(op.requests)
+        return lanplus.get_client().request_batch_sync(
+            addr, op.username, op.password, op.requests,
+            deadline.clamp(op.timeout)
+        )
+
+    if isinstance(op, HTTPPost):
+        req = urllib2.Request(op.url)
+        for k, v in op.headers.items():
+            req.add_header(k, v)
+        return urllib2.urlopen(
+            req, op.body, timeout=deadline.clamp(op.timeout)).read()
+
+    if isinstance(op, Call):
+        return op.fn(*op.args)
+
+    if isinstance(op, Sleep):
+        time.sleep(deadline.clamp(op.seconds))
+        return None
+
+    if isinstance(op, Throttle):
+        ratelimit.wait(op.backend)
+        return None
+
+    if isinstance(op, Gather):
+        return get_scheduler().map(op.kind, run_sync, op.items)
+
+    if isinstance(op, Speculate):
+        scheduler = get_scheduler()
+        tasks = [scheduler.submit(op.kind, run_sync, i) for i in op.items]
+        results = []
+        for task in tasks:
+            # workers can not be interrupted, tasks left behind
+            # are bounded by their timeouts and the deadline
+            result = scheduler.result(task)
+            results.append(result)
+            if op.decisive(result):
+                break
+        for task in tasks[len(results):]:
+            scheduler.cancel(task)
+        return results
+
+    raise TypeError("Unknown operation: {}".format(op))
+
+
+class ThreadEngine(object):
+    """
+    Every job is executed in a scheduler worker thread.
+    With 'aimd' number of operations running at the same time
+    is controlled by it, workers are added when its limit grows
+    """
+
+    def __init__(self, fanout=10, aimd=None):
+        global _limiter
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.scheduler = get_scheduler(fanout)
+        self.aimd = aimd
+        if aimd is not None:
+            _limiter = BlockingLimiter(aimd, on_change=self.scheduler.grow)
+
+    def run_all(self, jobs):
+        """
+        jobs is the list of (kind, coroutine function, args)
+        Returns list of the results
+        """
+        tasks = [
+            self.scheduler.submit(kind, run_sync, fn(*args))
+            for kind, fn, args in jobs
+        ]
+        results = []
+        for task in tasks:
+            # workers can not be interrupted, but every operation
+            # they run is bounded by the deadline
+            if not self.scheduler.wait(task, timeout=deadline.remaining()):
+                results.append(None)
+            elif isinstance(task.exception, Cancelled):
+                results.append(None)
+            else:
+                results.append(self.scheduler.result(task))
+        if self.aimd is not None:
+            self.log.debug(self.aimd.summary())
+        return results
+
+    def map(self, kind, fn, items):
+        return self.run_all([(kind, fn, (item, )) for item in items])
+
+
+class Semaphore(object):
+    """
+    Reactor-side semaphore. acquire() returns future
+    """
+
+    def __init__(self, value):
+        self.limit = value
+        self.value = value
+        self.waiters = deque()
+
+    def acquire(self):
+        future = Future()
+        if self.value > 0:
+            self.value -= 1
+            future.set_result(True)
+        else:
+            self.waiters.append(future)
+        return future
+
+    def resize(self, limit):
+        self.value += limit - self.limit
+        self.limit = limit
+        while self.value > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done:
+                self.value -= 1
+                waiter.set_result(True)
+
+    def release(self):
+        if self.value < 0:
+            # limit was decreased, slot is gone
+            self.value += 1
+            return
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done:
+                waiter.set_result(True)
+                return
+        self.value += 1
+
+
+class Task(Future):
+    """
+    Drives coroutine on the reactor
+    """
+
+    def __init__(self, engine, gen):
+        super(Task, self).__init__()
+        self.engine = engine
+        self.gen = gen
+        self.waiting_for = None
+        self.add_cancel_callback(self._cancel_child)
+        engine.reactor.call_soon(self._resume, None, None)
+
+    def _cancel_child(self):
+        if self.waiting_for is not None:
+            self.waiting_for.cancel()
+        self.gen.close()
+
+    def _resume(self, value, exc):
+        if self.done:
+            return
+        try:
+            done, op = _step(self.gen, value, exc)
+        except Exception as e:
+            self.set_exception(e)
+            return
+        if done:
+            self.set_result(op)
+            return
+        try:
+            future = self.engine.execute(op)
+        except Exception as e:
+            self.engine.reactor.call_soon(self._resume, None, e)
+            return
+        self.waiting_for = future
+        future.add_done_callback(self._wakeup)
+
+    def _wakeup(self, future):
+        self.waiting_for = None
+        if future.exception is not None:
+            self.engine.reactor.call_soon(
+                self._resume, None, future.exception)
+        else:
+            self.engine.reactor.call_soon(
+                self._resume, future.result, None)
+
+
+class EventEngine(object):
+    """
+    Runs all coroutines in one thread. 'fanout' is the max number of
+    operations in flight, 'limits' are per-kind limits of coroutines
+    running at the same time.
+    Blocking Call operations and name resolution are executed
+    by the scheduler workers.
+    With 'aimd' the number of operations in flight follows it
+    """
+
+    def __init__(self, fanout=10, limits=None, aimd=None):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.reactor = Reactor()
+        self.fanout = max(1, int(fanout))
+        self.scheduler = get_scheduler(fanout)
+        self.aimd = aimd
+        if aimd is not None:
+            self.fanout = aimd.limit
+        self.ops = Semaphore(self.fanout)
+        self.limits = {
+            k: Semaphore(v) for k, v in (limits or {}).items() if v
+        }
+        self.addresses = {}
+        self.run_process = self.reactor.run_process
+        if supervisor.forkserver_started():
+            self.run_process = self._supervised
+
+    def _supervised(self, cmd, timeout, input, probe=None):
+        # commands spawned by the fork server are served by the reaper
+        future = Future()
+        process = supervisor.get_supervisor().submit(
+            cmd, timeout, input,
+            callback=lambda p: self.reactor.call_soon_threadsafe(
+                future.set_result, p.result),
+            probe=probe
+        )
+        future.add_cancel_callback(
+            lambda: supervisor.get_supervisor().cancel(process))
+        return future
+
+    def run_in_thread(self, fn, *args):
+        future = Future()
+
+        def finished(task):
+            if task.exception is not None:
+                self.reactor.call_soon_threadsafe(
+                    future.set_exception, task.exception)
+            else:
+                self.reactor.call_soon_threadsafe(
+                    future.set_result, task.result)
+
+        self.scheduler.submit('call', fn, *args, callback=finished)
+        return future
+
+    def resolve(self, host):
+        """
+        Returns future with IPv4 address of the host
+        (see trix_status.resolver)
+        """
+        if host in self.addresses:
+            return self.addresses[host]
+        addr = resolver.get_resolver().cached(host)
+        if addr is not None:
+            future = Future()
+            future.set_result(addr)
+            return future
+        future = self.run_in_thread(resolver.get_resolver().resolve, host)
+        self.addresses[host] = future
+        return future
+
+    def _chain(self, first, then):
+        """
+        Returns future which is resolved by then(first.result)
+        """
+        future = Future()
+
+        def step(f):
+            if f.exception is not None:
+                future.set_exception(f.exception)
+                return
+            try:
+                second = then(f.result)
+            except Exception as exc:
+                future.set_exception(exc)
+                return
+            future.add_cancel_callback(second.cancel)
+            second.add_done_callback(
+                lambda s: future.set_exception(s.exception)
+                if s.exception is not None else future.set_result(s.result)
+            )
+
+        first.add_done_callback(step)
+        return future
+
+    def _limited(self, start, op=None):
+        """
+        Run start() once operation slot is available.
+        'op' is reported to aimd
+        """
+        future = Future()
+
+        def slot(_):
+            if future.done:
+                self.ops.release()
+                return
+            started = time.time()
+            try:
+                op_future = start()
+            except Exception as exc:
+                self.ops.release()
+                future.set_exception(exc)
+                return
+
+            def finished(f):
+                self.ops.release()
+                if self.aimd is not None and op is not None:
+                    changed = self.aimd.observe(
+                        type(op).__name__, time.time() - started,
+                        _op_failed(op, f.result, f.exception)
+                    )
+                    if changed is not None:
+                        self.ops.resize(changed)
+                if f.exception is not None:
+                    future.set_exception(f.exception)
+                else:
+                    future.set_result(f.result)
+
+            future.add_cancel_callback(op_future.cancel)
+            op_future.add_done_callback(finished)
+
+        self.ops.acquire().add_done_callback(slot)
+        return future
+
+    def _guard_resolve(self, future):
+        # unresolvable names behave like with blocking sockets
+        guarded = Future()
+
+        def check(f):
+            if f.exception is not None:
+                guarded.set_result(None)
+            else:
+                guarded.set_result(f.result)
+
+        future.add_done_callback(check)
+        return guarded
+
+    def execute(self, op):
+        """
+        Returns future for the operation
+        """
+        if is_coroutine(op):
+            return Task(self, op)
+
+        if isinstance(op, Command):
+            return self._limited(
+                lambda: self.run_process(op.cmd, op.timeout, op.input), op)
+
+        if isinstance(op, Hedged):
+            command = op.command
+            if self.run_process == self._supervised:
+                start = lambda: self._supervised(
+                    command.cmd, command.timeout, command.input, op.probe)
+            else:
+                start = lambda: hedging.hedge(
+                    self.reactor,
+                    lambda t: self.run_process(command.cmd, t, command.input),
+                    command.timeout, op.probe
+                )
+            return self._limited(start, op)
+
+        if isinstance(op, Connect):
+
+            def resolved(addr):
+                if addr is None:
+                    future = Future()
+                    future.set_result(errno.EHOSTUNREACH)
+                    return future
+                return self._chain(
+                    self._limited(lambda: self.reactor.connect(
+                        op.host, op.port, op.timeout, addr=(addr, op.port)
+                    ), op),
+                    self._socket_to_rc
+                )
+
+            return self._chain(
+                self._guard_resolve(self.resolve(op.host)), resolved)
+
+        if isinstance(op, Scan):
+
+            def resolved(addr):
+                if addr is None:
+                    future = Future()
+                    future.set_result((errno.EHOSTUNREACH, None))
+                    return future
+                return self._limited(lambda: self.reactor.scan(
+                    op.host, op.port, op.timeout, op.banner,
+                    addr=(addr, op.port)
+                ), op)
+
+            return self._chain(
+                self._guard_resolve(self.resolve(op.host)), resolved)
+
+        if isinstance(op, Datagram):
+
+            def resolved(addr):
+                if addr is None:
+                    future = Future()
+                    future.set_result(None)
+                    return future
+                return self._limited(lambda: self.reactor.datagram(
+                    op.host, op.port, op.payload, op.timeout,
+                    addr=(addr, op.port)
+                ), op)
+
+            return self._chain(
+                self._guard_resolve(self.resolve(op.host)), resolved)
+
+        if isinstance(op, Ping):
+
+            def resolved(addr):
+                future = Future()
+                if addr is None:
+                    future.set_result(None)
+                    return future
+                echo = icmp.get_pinger().ping(
+                    addr, op.timeout,
+                    lambda rtt: self.reactor.call_soon_threadsafe(
+                        future.set_result, rtt)
+                )
+                future.add_cancel_callback(
+                    lambda: icmp.get_pinger().cancel(echo))
+                return future
+
+            return self._chain(
+                self._guard_resolve(self.resolve(op.host)),
+                lambda addr: self._limited(lambda: resolved(addr), op)
+            )
+
+        if isinstance(op, RMCPPing):
+
+            def resolved(addr):
+                future = Future()
+                if addr is None:
+                    future.set_result(None)
+                    return future
+                rmcp.get_pinger().ping(
+                    addr, op.timeout,
+                    lambda rtt: self.reactor.call_soon_threadsafe(
+                        future.set_result, rtt)
+                )
+                return future
+
+            return self._chain(
+                self._guard_resolve(self.resolve(op.host)), resolved)
+
+        if isinstance(op, IPMIRequest):
+
+            def resolved(addr):
+                future = Future()
+                if addr is None:
+                    future.set_result(lanplus.Response(
+                        "Unable to resolve {}".format(op.host), None, ''))
+                    return future
+                lanplus.get_client().request(
+                    addr, op.username, op.password, op.netfn, op.cmd,
+                    op.data, op.timeout,
+                    lambda response: self.reactor.call_soon_threadsafe(
+                        future.set_result, response)
+                )
+                return future
+
+            return self._chain(
+                self._guard_resolve(self.resolve(op.host)),
+                lambda addr: self._limited(lambda: resolved(addr), op)
+            )
+
+        if isinstance(op, IPMIBatch):
+
+            def resolved(addr):
+                future = Future()
+                if addr is None:
+                    future.set_result([lanplus.Response(
+                        "Unable to resolve {}".format(op.host), None, '')
+                    ] * len(op.requests))
+                    return future
+                lanplus.get_client().request_batch(
+                    addr, op.username, op.password, op.requests, op.timeout,
+                    lambda responses: self.reactor.call_soon_threadsafe(
+                        future.set_result, responses)
+                )
+                return future
+
+            return self._chain(
+                self._guard_resolve(self.resolve(op.host)),
+                lambda addr: self._limited(lambda: resolved(addr), op)
+            )
+
+        if isinstance(op, HTTPPost):
+            host = urllib2.urlparse.urlparse(op.url).hostname
+
+            def resolved(addr):
+                port = urllib2.urlparse.urlparse(op.url).port
+                if port is None:
+                    port = 443 if op.url.startswith('https') else 80
+                return self._limited(lambda: self.reactor.http_post(
+                    op.url, op.body, op.headers, op.timeout,
+                    addr=(addr, port)
+                ), op)
+
+            return self._chain(self.resolve(host), resolved)
+
+        if isinstance(op, Call):
+            return self.run_in_thread(op.fn, *op.args)
+
+        if isinstance(op, Sleep):
+            future = Future()
+            timer = self.reactor.call_later(
+                op.seconds, future.set_result, None)
+            future.add_cancel_callback(timer.cancel)
+            return future
+
+        if isinstance(op, Throttle):
+            future = Future()
+            delay = ratelimit.reserve(op.backend)
+            if delay <= 0:
+                future.set_result(None)
+                return future
+            timer = self.reactor.call_later(delay, future.set_result, None)
+            future.add_cancel_callback(timer.cancel)
+            return future
+
+        if isinstance(op, Gather):
+            return self.gather([
+                self.spawn(op.kind, lambda item: item, (item, ))
+                for item in op.items
+            ])
+
+        if isinstance(op, Speculate):
+            return self.speculate([
+                self.spawn(op.kind, lambda item: item, (item, ))
+                for item in op.items
+            ], op.decisive)
+
+        raise TypeError("Unknown operation: {}".format(op))
+
+    def _socket_to_rc(self, sock):
+        future = Future()
+        if isinstance(sock, int):
+            future.set_result(sock)
+        else:
+            sock.close()
+            future.set_result(0)
+        return future
+
+    def spawn(self, kind, fn, args):
+        """
+        Start fn(*args) once the limit for the kind allows it.
+        fn should return coroutine or operation
+        """
+        limit = self.limits.get(kind)
+        if limit is None:
+            return self.execute(fn(*args))
+
+        future = Future()
+
+        def start(_):
+            if future.done:
+                limit.release()
+                return
+            child = self.execute(fn(*args))
+
+            def finished(f):
+                limit.release()
+                if f.exception is not None:
+                    future.set_exception(f.exception)
+                else:
+                    future.set_result(f.result)
+
+            future.add_cancel_callback(child.cancel)
+            child.add_done_callback(finished)
+
+        limit.acquire().add_done_callback(start)
+        return future
+
+    def gather(self, futures):
+        result = Future()
+        left = [len(futures)]
+
+        def finished(_):
+            left[0] -= 1
+            if left[0] > 0:
+                return
+            for f in futures:
+                if f.exception is not None:
+                    result.set_exception(f.exception)
+                    return
+            result.set_result([f.result for f in futures])
+
+        if not futures:
+            result.set_result([])
+        for f in futures:
+            result.add_cancel_callback(f.cancel)
+            f.add_done_callback(finished)
+        return result
+
+    def speculate(self, futures, decisive):
+        result = Future()
+
+        def finished(_):
+            if result.done:
+                return
+            results = []
+            for f in futures:
+                if not f.done:
+                    return
+                if f.exception is not None:
+                    result.set_exception(f.exception)
+                    break
+                results.append(f.result)
+                if decisive(f.result):
+                    result.set_result(results)
+                    break
+            else:
+                result.set_result(results)
+            for f in futures:
+                f.cancel()
+
+        if not futures:
+            result.set_result([])
+        for f in futures:
+            result.add_cancel_callback(f.cancel)
+            f.add_done_callback(finished)
+        return result
+
+    def run_all(self, jobs):
+        """
+        jobs is the list of (kind, coroutine function, args)
+        Returns list of the results
+        """
+        futures = [self.spawn(kind, fn, args) for kind, fn, args in jobs]
+
+        def expire():
+            self.log.debug("Deadline exceeded, cancel unfinished jobs")
+            for f in futures:
+                f.cancel()
+
+        timer = None
+        if deadline.remaining() is not None:
+            timer = self.reactor.call_later(deadline.remaining(), expire)
+        self.reactor.run_until_complete(self.gather(futures))
+        if timer is not None:
+            timer.cancel()
+
+        results = []
+        for f in futures:
+            if isinstance(f.exception, Cancelled):
+                results.append(None)
+            elif f.exception is not None:
+                raise f.exception
+            else:
+                results.append(f.result)
+        if self.aimd is not None:
+            self.log.debug(self.aimd.summary())
+        return results
+
+    def map(self, kind, fn, items):
+        return self.run_all([(kind, fn, (item, )) for item in items])
+
+
+def get_engine(args=None):
+    """
+    Returns process-wide engine selected by args.engine
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            name = getattr(args, 'engine', 'threads')
+            hedging.set_enabled(getattr(args, 'hedge', False))
+            fanout = fd_limit(getattr(args, 'fanout', 10))
+            conf = utils.get_config(
+                'scheduler', {'limits': {}, 'adaptive': {}}
+            )
+            aimd = None
+            if getattr(args, 'adaptive_fanout', False):
+                adaptive = conf['adaptive'] or {}
+                aimd = AIMD(
+                    initial=fanout,
+                    minimum=adaptive.get('min', 1),
+                    maximum=adaptive.get('max', 256)
+                )
+            if name == 'events':
+                _engine = EventEngine(
+                    fanout=fanout, limits=conf['limits'] or {}, aimd=aimd)
+            elif aimd is not None:
+                _engine = ThreadEngine(fanout=aimd.limit, aimd=aimd)
+            else:
+                _engine = ThreadEngine(fanout=fanout)
+        return _engine
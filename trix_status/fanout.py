@@ -0,0 +1,160 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import logging
+import resource
+import threading
+
+log = logging.getLogger(__name__)
+
+# parent side of a running command: stdin, stdout and stderr pipes
+# plus a socket or two of the checks running next to it
+FDS_PER_OPERATION = 4
+FDS_RESERVED = 64
+
+
+def fd_limit(fanout):
+    """
+    Max fanout the soft RLIMIT_NOFILE of the process allows
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return fanout
+    allowed = max(1, (soft - FDS_RESERVED) // FDS_PER_OPERATION)
+    if fanout > allowed:
+        log.debug(
+            "Fanout {} is limited to {} by open files limit {}".format(
+                fanout, allowed, soft)
+        )
+        return allowed
+    return fanout
+
+
+class AIMD(object):
+    """
+    Additive increase / multiplicative decrease of the number of
+    operations in flight.
+    Every operation reports its latency and whether it failed in a way
+    which can be caused by overload (timeout, refused connection).
+    After each window of operations the limit is
+      - halved, if share of failures grew compared to the best window
+      - increased by 1, if latency is close to the best seen
+        (doubled until the first decrease, like TCP slow start)
+      - kept as is otherwise
+    Latency is compared per operation type, as ping and stat of
+    a filesystem can not be compared with each other.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=256):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.maximum = fd_limit(max(1, int(maximum)))
+        self.minimum = max(1, min(int(minimum), self.maximum))
+        self.limit = max(self.minimum, min(int(initial), self.maximum))
+        self.lock = threading.Lock()
+        self.best_latency = {}
+        self.best_error_rate = None
+        self.ratios = []
+        self.errors = 0
+        self.slow_start = True
+        self.history = [self.limit]
+        self.log.debug(
+            "Adaptive fanout: start {}, min {}, max {}".format(
+                self.limit, self.minimum, self.maximum)
+        )
+
+    def observe(self, op_type, latency, failed):
+        """
+        Returns new limit if it was changed, otherwise None
+        """
+        with self.lock:
+            if failed:
+                self.errors += 1
+            else:
+                best = self.best_latency.get(op_type)
+                if best is None or latency < best:
+                    self.best_latency[op_type] = best = max(latency, 0.001)
+                self.ratios.append(latency / best)
+            if self.errors + len(self.ratios) < max(self.limit, 10):
+                return None
+            return self._adjust()
+
+    def _adjust(self):
+        # should be called with self.lock acquired
+        total = self.errors + len(self.ratios)
+        error_rate = float(self.errors) / total
+        ratios = sorted(self.ratios)
+        median = ratios[len(ratios) // 2] if ratios else None
+        self.errors, self.ratios = 0, []
+
+        if self.best_error_rate is None or error_rate < self.best_error_rate:
+            self.best_error_rate = error_rate
+
+        old = self.limit
+        if error_rate > self.best_error_rate + 0.1:
+            self.slow_start = False
+            self.limit = max(self.minimum, self.limit // 2)
+        elif median is not None and median < 2.0:
+            step = self.limit if self.slow_start else 1
+            self.limit = min(self.maximum, self.limit + step)
+
+        if self.limit == old:
+            return None
+        self.history.append(self.limit)
+        self.log.debug(
+            (
+                "Fanout {} -> {}: error rate {:.2f} (best {:.2f}), "
+                + "median latency {}x of best"
+            ).format(
+                old, self.limit, error_rate, self.best_error_rate,
+                "{:.1f}".format(median) if median is not None else "-"
+            )
+        )
+        return self.limit
+
+    def summary(self):
+        return "Adaptive fanout: final {}, max reached {}, changes {}".format(
+            self.limit, max(self.history), len(self.history) - 1)
+
+
+class BlockingLimiter(object):
+    """
+    Counting semaphore for threads with the size taken from AIMD
+    """
+
+    def __init__(self, aimd, on_change=None):
+        self.aimd = aimd
+        self.on_change = on_change
+        self.cond = threading.Condition()
+        self.running = 0
+
+    def acquire(self):
+        with self.cond:
+            while self.running >= self.aimd.limit:
+                self.cond.wait()
+            self.running += 1
+
+    def release(self, op_type, latency, failed):
+        changed = self.aimd.observe(op_type, latency, failed)
+        if changed is not None and self.on_change is not None:
+            self.on_change(changed)
+        with self.cond:
+            self.running -= 1
+            if changed is not None:
+                self.cond.notify_all()
+            else:
+                self.cond.notify()
@@ -0,0 +1,239 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import errno
+import logging
+import os
+import signal
+import socket
+import struct
+import cPickle as pickle
+
+from reactor import Reactor, Future, CommandResult, _set_nonblocking
+
+HEADER = struct.Struct('!I')
+
+
+def _restore_sigint():
+    # Popen keeps ignored signals ignored after exec
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+
+class Channel(object):
+    """
+    Framed pickles over non-blocking socket served by the reactor.
+    'on_message' is called for every received object,
+    'on_close' once the other side is gone
+    """
+
+    def __init__(self, reactor, sock, on_message, on_close):
+        self.reactor = reactor
+        self.sock = sock
+        self.on_message = on_message
+        self.on_close = on_close
+        self.inbuf = ""
+        self.outbuf = ""
+        self.closed = False
+        _set_nonblocking(sock.fileno())
+        self.reactor.add_reader(sock.fileno(), self._read)
+
+    def send(self, obj):
+        if self.closed:
+            return
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        self.outbuf += HEADER.pack(len(data)) + data
+        self.reactor.add_writer(self.sock.fileno(), self._write)
+
+    def _write(self):
+        try:
+            sent = self.sock.send(self.outbuf)
+        except socket.error as exc:
+            if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.close()
+            return
+        self.outbuf = self.outbuf[sent:]
+        if not self.outbuf:
+            self.reactor.remove_writer(self.sock.fileno())
+
+    def _read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error as exc:
+            if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ""
+        if not data:
+            self.close()
+            return
+        self.inbuf += data
+        while len(self.inbuf) >= HEADER.size:
+            length, = HEADER.unpack(self.inbuf[:HEADER.size])
+            if len(self.inbuf) < HEADER.size + length:
+                break
+            frame = self.inbuf[HEADER.size:HEADER.size + length]
+            self.inbuf = self.inbuf[HEADER.size + length:]
+            self.on_message(pickle.loads(frame))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.reactor.remove_reader(self.sock.fileno())
+        self.reactor.remove_writer(self.sock.fileno())
+        self.sock.close()
+        self.on_close()
+
+
+def _serve(sock):
+    """
+    Main loop of the helper process.
+    Requests are {'id', 'cmd', 'timeout', 'input'} or {'id', 'cancel'},
+    answers are {'id', 'rc', 'stdout', 'stderr', 'exception',
+    'wall_time', 'timed_out'}
+    """
+    reactor = Reactor()
+    reactor.preexec_fn = _restore_sigint
+    running = {}
+
+    def finished(req_id, future):
+        running.pop(req_id, None)
+        result = future.result
+        if future.exception is not None:
+            result = CommandResult(255, "", "", future.exception)
+        channel.send({
+            'id': req_id,
+            'rc': result.rc,
+            'stdout': result.stdout,
+            'stderr': result.stderr,
+            'exception': str(result.exception) if result.exception else "",
+            'wall_time': result.wall_time,
+            'timed_out': result.timed_out,
+        })
+
+    def on_message(msg):
+        if msg.get('cancel'):
+            if msg['id'] in running:
+                running[msg['id']].cancel()
+            return
+        future = reactor.run_process(
+            msg['cmd'], msg['timeout'], msg['input'])
+        running[msg['id']] = future
+        future.add_done_callback(lambda f: finished(msg['id'], f))
+
+    def on_close():
+        # parent is gone, nobody needs the answers
+        for future in running.values():
+            future.cancel()
+        reactor.stop()
+
+    channel = Channel(reactor, sock, on_message, on_close)
+    reactor.run_forever()
+
+
+class ForkServer(object):
+    """
+    Helper process spawning commands on behalf of trix-status.
+    It should be started before any thread is created: forking the small
+    helper keeps spawn cost constant however big the main process grows.
+    Client side is attached to one reactor, see run_process()
+    """
+
+    def __init__(self):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.pid = None
+        self.sock = None
+        self.channel = None
+        self.pending = {}
+        self.seq = 0
+
+    def start(self):
+        parent_sock, child_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            parent_sock.close()
+            # Ctrl-C is handled by parent, helper exits once socket is closed
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                _serve(child_sock)
+            finally:
+                os._exit(0)
+        child_sock.close()
+        self.pid = pid
+        self.sock = parent_sock
+        self.log.debug("Fork server started with pid {}".format(pid))
+
+    def attach(self, reactor):
+        """
+        Serve answers from the helper in the reactor.
+        run_process() should be called from the thread running it
+        """
+        self.channel = Channel(
+            reactor, self.sock, self._on_message, self._on_close)
+
+    def _on_message(self, msg):
+        future = self.pending.pop(msg['id'], None)
+        if future is None:
+            return
+        result = CommandResult(
+            msg['rc'], msg['stdout'], msg['stderr'], msg['exception'])
+        result.wall_time = msg['wall_time']
+        result.timed_out = msg['timed_out']
+        future.set_result(result)
+
+    def _on_close(self):
+        self.log.debug("Fork server closed connection")
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_result(CommandResult(
+                255, "", "", IOError("Fork server exited")))
+
+    def run_process(self, cmd, timeout=30, input=None):
+        """
+        Same as Reactor.run_process, but command is spawned by the helper
+        """
+        future = Future()
+        if self.channel is None or self.channel.closed:
+            future.set_result(CommandResult(
+                255, "", "", IOError("Fork server is not running")))
+            return future
+        self.seq += 1
+        req_id = self.seq
+        self.pending[req_id] = future
+        self.channel.send({
+            'id': req_id, 'cmd': cmd, 'timeout': timeout, 'input': input
+        })
+
+        def cancel():
+            self.pending.pop(req_id, None)
+            self.channel.send({'id': req_id, 'cancel': True})
+
+        future.add_cancel_callback(cancel)
+        return future
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+        elif self.sock is not None:
+            self.sock.close()
+        if self.pid is not None:
+            try:
+                os.waitpid(self.pid, 0)
+            except OSError:
+                pass
+            self.pid = None
@@ -0,0 +1,172 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Hedged probes ('--hedge'). If a probe (ssh, ping) did not answer
+after the rolling p95 latency of its type, an identical one is started.
+The first to finish wins, the other is killed.
+'''
+
+
+import logging
+import threading
+import time
+from collections import deque
+
+from reactor import Future
+
+log = logging.getLogger(__name__)
+
+PERCENTILE = 0.95
+# no hedging until there is enough samples for the percentile
+MIN_SAMPLES = 20
+WINDOW = 200
+MIN_DELAY = 0.05
+# max share of probes which can be hedged, keeps extra load bounded
+# when latency of all the probes grows
+BUDGET = 0.1
+
+_enabled = False
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+class LatencyTracker(object):
+    """
+    Rolling window of latencies of one probe type
+    """
+
+    def __init__(self, probe):
+        self.probe = probe
+        self.samples = deque(maxlen=WINDOW)
+        self.lock = threading.Lock()
+        self.started = 0
+        self.hedged = 0
+        self.won = 0
+
+    def record(self, latency):
+        with self.lock:
+            self.samples.append(latency)
+
+    def percentile(self):
+        with self.lock:
+            if len(self.samples) < MIN_SAMPLES:
+                return None
+            samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * PERCENTILE))]
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def enabled():
+    return _enabled
+
+
+def get_tracker(probe):
+    with _trackers_lock:
+        if probe not in _trackers:
+            _trackers[probe] = LatencyTracker(probe)
+        return _trackers[probe]
+
+
+def reset():
+    with _trackers_lock:
+        _trackers.clear()
+
+
+def summary():
+    with _trackers_lock:
+        trackers = sorted(_trackers.items())
+    return ", ".join(
+        "{}: {} probes, {} hedged, {} won by hedge".format(
+            probe, t.started, t.hedged, t.won)
+        for probe, t in trackers
+    )
+
+
+def hedge(reactor, start, timeout, probe):
+    """
+    Should be called in the reactor thread.
+    start(timeout) returns future for reactor.CommandResult.
+    Hedge gets the time left of the 'timeout', so the probe
+    never takes longer than without hedging
+    """
+    tracker = get_tracker(probe)
+    future = Future()
+    running = []
+    delay = tracker.percentile() if _enabled else None
+    timer = [None]
+
+    def finished(f, hedged, started):
+        if future.done:
+            # loser killed by the winner, its age is not a latency
+            return
+        # only answers count, failed and killed probes would make p95
+        # the timeout when many nodes are down, then nothing is hedged
+        if f.exception is None and f.result.rc == 0 and \
+                not f.result.timed_out:
+            tracker.record(time.time() - started)
+        if hedged:
+            tracker.won += 1
+        if f.exception is not None:
+            future.set_exception(f.exception)
+        else:
+            future.set_result(f.result)
+        if timer[0] is not None:
+            timer[0].cancel()
+        for other in running:
+            if other is not f:
+                other.cancel()
+
+    def launch(t, hedged=False):
+        started = time.time()
+        f = start(t)
+        running.append(f)
+        f.add_done_callback(lambda f: finished(f, hedged, started))
+
+    def second():
+        timer[0] = None
+        if future.done:
+            return
+        if tracker.hedged >= BUDGET * tracker.started:
+            return
+        tracker.hedged += 1
+        log.debug(
+            "No answer from {} probe after {:.3f}s, start hedge".format(
+                probe, delay)
+        )
+        launch(None if timeout is None else timeout - delay, hedged=True)
+
+    cancelled = []
+
+    def cancel():
+        cancelled.append(True)
+        if timer[0] is not None:
+            timer[0].cancel()
+        for f in running:
+            f.cancel()
+
+    future.add_cancel_callback(cancel)
+    tracker.started += 1
+    launch(timeout)
+    if delay is not None and not future.done:
+        delay = max(delay, MIN_DELAY)
+        if timeout is None or delay < timeout:
+            timer[0] = reactor.call_later(delay, second)
+    return future
@@ -0,0 +1,334 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+In-process pinger. Echo requests to all targets are sent from one ICMP
+socket and replies are matched by sequence number in a receiver thread,
+so checking reachability of thousands of nodes and BMCs does not fork
+'ping' for every one of them. Like 'ping -c1 -w<timeout>' the echo is
+sent again every second until a reply to any of them comes:
+
+    icmp:
+      native: true
+
+Unprivileged datagram ICMP socket is used if net.ipv4.ping_group_range
+allows it, otherwise raw socket. If neither can be opened, get_pinger()
+returns None and checks run 'ping' as before.
+'''
+
+
+import errno
+import heapq
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+from trix_status.utils import get_config
+
+log = logging.getLogger(__name__)
+
+ECHO_REQUEST = 8
+ECHO_REPLY = 0
+# seconds between echo requests to the same target
+RESEND = 1.0
+
+_pinger = None
+_pinger_lock = threading.Lock()
+_unavailable = False
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += '\0'
+    total = sum(struct.unpack('!{}H'.format(len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(ident, seq, payload):
+    header = struct.pack('!BBHHH', ECHO_REQUEST, 0, 0, ident, seq)
+    csum = checksum(header + payload)
+    return struct.pack('!BBHHH', ECHO_REQUEST, 0, csum, ident, seq) + payload
+
+
+def parse_reply(packet, raw):
+    """
+    Returns (ident, seq) of echo reply or None.
+    Raw sockets get packets with IP header
+    """
+    if raw:
+        if len(packet) < 20:
+            return None
+        packet = packet[(ord(packet[0]) & 0x0f) * 4:]
+    if len(packet) < 8:
+        return None
+    icmp_type, code, csum, ident, seq = struct.unpack('!BBHHH', packet[:8])
+    if icmp_type != ECHO_REPLY:
+        return None
+    return ident, seq
+
+
+class Request(object):
+    """
+    Request in flight. 'callback' gets RTT in seconds or None
+    """
+
+    def __init__(self, addr, expires, callback):
+        self.addr = addr
+        self.expires = expires
+        self.callback = callback
+        # seq: time the echo with this seq was sent
+        self.sent = {}
+        self.done = False
+
+
+class Pinger(object):
+
+    def __init__(self):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.sock, self.raw = self._open_socket()
+        self.ident = os.getpid() & 0xffff
+        self.lock = threading.Lock()
+        self.pending = {}
+        # (time, number, echo, resend), heap of expiries and resends
+        self.timers = []
+        self.timer_count = 0
+        self.seq = 0
+        self.closed = False
+        # wakes up the receiver when a request with earlier expiry comes
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        self.thread = threading.Thread(
+            target=self._receiver, name="trix-status-pinger")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _open_socket(self):
+        try:
+            sock = socket.socket(
+                socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            raw = False
+        except socket.error:
+            # no fallback from here, raises if it is not permitted
+            sock = socket.socket(
+                socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            raw = True
+        sock.setblocking(False)
+        return sock, raw
+
+    def _next_seq(self):
+        # should be called with self.lock acquired
+        for _ in range(0x10000):
+            self.seq = (self.seq + 1) & 0xffff
+            if self.seq not in self.pending:
+                return self.seq
+        raise RuntimeError("Too many echo requests in flight")
+
+    def _timer(self, when, echo, resend):
+        # should be called with self.lock acquired
+        self.timer_count += 1
+        heapq.heappush(self.timers, (when, self.timer_count, echo, resend))
+
+    def _send(self, echo):
+        """
+        Sends the next echo request of 'echo', returns False on failure.
+        Should be called with self.lock acquired
+        """
+        seq = self._next_seq()
+        self.pending[seq] = echo
+        echo.sent[seq] = time.time()
+        packet = echo_request(self.ident, seq, struct.pack('!d', time.time()))
+        try:
+            self.sock.sendto(packet, (echo.addr, 0))
+        except socket.error as exc:
+            self.log.debug("Unable to send echo to {}: {}".format(
+                echo.addr, exc))
+            return False
+        if echo.sent[seq] + RESEND < echo.expires:
+            self._timer(echo.sent[seq] + RESEND, echo, True)
+        return True
+
+    def ping(self, addr, timeout, callback):
+        """
+        Send echo requests to IPv4 'addr'. callback(rtt) is called
+        from the receiver thread, rtt is None if there was no reply
+        in 'timeout' seconds. Returns request for cancel()
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Pinger is closed")
+            echo = Request(addr, time.time() + timeout, callback)
+            self._timer(echo.expires, echo, False)
+            if self._send(echo):
+                failed = None
+            else:
+                failed = self._finish(echo, None)
+            # the receiver waits for an earlier timer
+            first = self.timers[0][2] is echo
+        if failed is not None:
+            # the same as no reply, unreachable hosts are DOWN
+            failed()
+        elif first:
+            os.write(self.wakeup_w, 'x')
+        return echo
+
+    def _forget(self, echo):
+        # should be called with self.lock acquired
+        for seq in echo.sent:
+            if self.pending.get(seq) is echo:
+                del self.pending[seq]
+
+    def cancel(self, echo):
+        with self.lock:
+            self._forget(echo)
+            echo.done = True
+
+    def _finish(self, echo, rtt):
+        # should be called with self.lock acquired
+        if echo.done:
+            return None
+        echo.done = True
+        self._forget(echo)
+        return lambda: echo.callback(rtt)
+
+    def _expire(self):
+        calls = []
+        now = time.time()
+        with self.lock:
+            while self.timers:
+                when, count, echo, resend = self.timers[0]
+                if echo.done:
+                    heapq.heappop(self.timers)
+                    continue
+                if when > now:
+                    break
+                heapq.heappop(self.timers)
+                if resend:
+                    # a failed resend leaves the earlier echoes waiting
+                    self._send(echo)
+                else:
+                    calls.append(self._finish(echo, None))
+            wait = self.timers[0][0] - now if self.timers else None
+        return calls, wait
+
+    def _read(self):
+        calls = []
+        while True:
+            try:
+                packet, (addr, _) = self.sock.recvfrom(65536)
+            except socket.error as exc:
+                if exc.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.log.debug("Receive failed: {}".format(exc))
+                return calls
+            received = time.time()
+            reply = parse_reply(packet, self.raw)
+            if reply is None:
+                continue
+            ident, seq = reply
+            # kernel sets identifier of datagram sockets itself
+            if self.raw and ident != self.ident:
+                continue
+            with self.lock:
+                echo = self.pending.get(seq)
+                if echo is None or echo.addr != addr:
+                    continue
+                calls.append(
+                    self._finish(echo, received - echo.sent[seq]))
+
+    def _receiver(self):
+        while True:
+            calls, wait = self._expire()
+            for call in calls:
+                call()
+            if self.closed:
+                return
+            try:
+                readable, _, _ = select.select(
+                    [self.sock, self.wakeup_r], [], [], wait)
+            except select.error as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            if self.wakeup_r in readable:
+                os.read(self.wakeup_r, 4096)
+            if self.sock in readable:
+                for call in self._read():
+                    call()
+
+    def ping_sync(self, addr, timeout):
+        """
+        Blocking ping, returns rtt or None
+        """
+        done = threading.Event()
+        result = []
+
+        def callback(rtt):
+            result.append(rtt)
+            done.set()
+
+        self.ping(addr, timeout, callback)
+        # wait with timeout, otherwise KeyboardInterrupt is not delivered
+        while not done.wait(1):
+            pass
+        return result[0]
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            pending, self.pending = set(self.pending.values()), {}
+        os.write(self.wakeup_w, 'x')
+        self.thread.join(1)
+        for echo in pending:
+            if not echo.done:
+                echo.done = True
+                echo.callback(None)
+        self.sock.close()
+        os.close(self.wakeup_r)
+        os.close(self.wakeup_w)
+
+
+def get_pinger():
+    """
+    Returns process-wide pinger or None if ICMP sockets
+    are not permitted or native pinger is disabled
+    """
+    global _pinger, _unavailable
+    with _pinger_lock:
+        if _pinger is None and not _unavailable:
+            if not get_config('icmp', {'native': True})['native']:
+                _unavailable = True
+                return None
+            try:
+                _pinger = Pinger()
+            except socket.error as exc:
+                log.debug("ICMP sockets are not permitted, use ping: {}".format(
+                    exc))
+                _unavailable = True
+        return _pinger
+
+
+def shutdown():
+    global _pinger, _unavailable
+    with _pinger_lock:
+        if _pinger is not None:
+            _pinger.close()
+        _pinger = None
+        _unavailable = False
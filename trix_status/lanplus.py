@@ -0,0 +1,638 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+In-process IPMI 2.0 (RMCP+) client, what 'ipmitool -I lanplus' does
+without a process and a new session per command. Requests to all BMCs
+go through one UDP socket, sessions to many BMCs are opened at once and
+every session is used by all ipmi checks of the BMC until the end of
+the run:
+
+    ipmi:
+      native: true      # false - run ipmitool
+      cipher_suite: 3   # 1, 2, 3 or 17
+      privilege: 4      # requested role, 4 - administrator as ipmitool
+
+Cipher suites 3 and 17 encrypt payloads with AES, it needs python-crypto.
+Without it get_client() returns None and checks run ipmitool as before.
+'''
+
+
+import errno
+import functools
+import hashlib
+import hmac
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+from trix_status.reactor import Reactor
+from trix_status.utils import get_config
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+log = logging.getLogger(__name__)
+
+RMCP_PORT = 623
+# RMCP v1.0, no RMCP ACK, IPMI class
+RMCP_HEADER = struct.pack('!BBBB', 0x06, 0x00, 0xff, 0x07)
+AUTH_RMCPPLUS = 0x06
+
+PAYLOAD_IPMI = 0x00
+OPEN_SESSION_REQUEST = 0x10
+OPEN_SESSION_RESPONSE = 0x11
+RAKP1 = 0x12
+RAKP2 = 0x13
+RAKP3 = 0x14
+RAKP4 = 0x15
+ENCRYPTED = 0x80
+AUTHENTICATED = 0x40
+
+BMC_ADDR = 0x20
+CONSOLE_ADDR = 0x81
+NETFN_CHASSIS = 0x00
+NETFN_APP = 0x06
+GET_CHASSIS_STATUS = 0x01
+CLOSE_SESSION = 0x3c
+
+# RAKP 1 role: user is looked up by name only
+NAME_ONLY = 0x10
+# seconds before the packet is sent again
+RETRANSMIT = 1.0
+
+# suite: (hash, length of integrity codes,
+#         authentication, integrity, confidentiality algorithms)
+CIPHER_SUITES = {
+    1: (hashlib.sha1, 12, 1, 0, 0),
+    2: (hashlib.sha1, 12, 1, 1, 0),
+    3: (hashlib.sha1, 12, 1, 1, 1),
+    17: (hashlib.sha256, 16, 3, 4, 1),
+}
+
+# RMCP+ status codes of session setup
+RMCP_ERRORS = {
+    0x01: "Insufficient resources to create a session",
+    0x02: "Invalid session ID",
+    0x04: "Invalid role",
+    0x09: "Requested privilege level is not available",
+    0x0d: "Unauthorized name",
+    0x11: "No cipher suite match with proposed security algorithms",
+    0x12: "Illegal or unrecognized parameter",
+}
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable = False
+
+
+class Response(namedtuple('Response', ['error', 'code', 'data'])):
+    """
+    Answer of BMC. 'error' is None if BMC answered, then 'code'
+    is completion code of the command and 'data' is the rest
+    """
+
+
+def checksum(data):
+    return -sum(bytearray(data)) & 0xff
+
+
+def ipmi_request(netfn, cmd, seq, data=''):
+    header = struct.pack('BB', BMC_ADDR, netfn << 2)
+    body = struct.pack('BBB', CONSOLE_ADDR, seq << 2, cmd) + data
+    return header + chr(checksum(header)) + body + chr(checksum(body))
+
+
+def parse_ipmi_response(payload):
+    """
+    Returns (netfn, seq, cmd, completion code, data) or None
+    """
+    if len(payload) < 8:
+        return None
+    netfn, lun = divmod(ord(payload[1]), 4)
+    seq, lun = divmod(ord(payload[4]), 4)
+    return netfn, seq, ord(payload[5]), ord(payload[6]), payload[7:-1]
+
+
+def pack_packet(payload_type, session_id, seq, payload):
+    return RMCP_HEADER + struct.pack(
+        '<BBIIH', AUTH_RMCPPLUS, payload_type, session_id, seq,
+        len(payload)) + payload
+
+
+def unpack_packet(packet):
+    """
+    Returns (payload type, session ID, payload) of RMCP+ packet or None
+    """
+    if len(packet) < 16 or packet[:4] != RMCP_HEADER:
+        return None
+    auth, payload_type, session_id, seq, length = struct.unpack(
+        '<BBIIH', packet[4:16])
+    if auth & 0x0f != AUTH_RMCPPLUS or len(packet) < 16 + length:
+        return None
+    return payload_type, session_id, packet[16:16 + length]
+
+
+def power_state(data):
+    """
+    'ON' or 'OFF' from Get Chassis Status answer
+    """
+    return 'ON' if ord(data[0]) & 0x01 else 'OFF'
+
+
+class Request(object):
+
+    def __init__(self, netfn, cmd, data, expires, callback):
+        self.netfn = netfn
+        self.cmd = cmd
+        self.data = data
+        self.expires = expires
+        self.callback = callback
+
+
+class Session(object):
+    """
+    RMCP+ session with one BMC. Requests are queued and sent one by one
+    """
+
+    def __init__(self, addr, username, password, suite, privilege,
+                 console_id):
+        self.addr = addr
+        self.username = username
+        # Kuid, HMAC pads the key with zeros anyway
+        self.password = password
+        (self.digest, self.icv_length, self.auth_alg, self.integrity_alg,
+         self.conf_alg) = CIPHER_SUITES[suite]
+        self.suite = suite
+        self.privilege = privilege
+        self.role = privilege | NAME_ONLY
+        self.console_id = console_id
+        self.bmc_id = 0
+        self.state = 'new'
+        self.queue = deque()
+        self.current = None
+        self.tag = 0
+        self.seq = 0
+        self.rq_seq = 0
+        self.packet = None
+        self.expires = None
+        self.timer = None
+        self.rm = None
+        self.rc = None
+        self.guid = None
+        self.sik = None
+        self.k1 = None
+        self.aes_key = None
+
+    def _hmac(self, key, data):
+        return hmac.new(key, data, self.digest).digest()
+
+    def _user(self):
+        return struct.pack('BB', self.role, len(self.username)) + \
+            self.username
+
+    def open_request(self):
+        self.tag = (self.tag + 1) & 0xff
+        algorithms = ''.join(
+            struct.pack('BxxBBxxx', kind, 8, alg) for kind, alg in (
+                (0, self.auth_alg),
+                (1, self.integrity_alg),
+                (2, self.conf_alg))
+        )
+        payload = struct.pack(
+            '<BBxxI', self.tag, self.privilege, self.console_id) + algorithms
+        return pack_packet(OPEN_SESSION_REQUEST, 0, 0, payload)
+
+    def rakp1(self, response):
+        """
+        Takes Open Session Response, returns RAKP 1 or raises IOError
+        """
+        tag, status = struct.unpack('BB', response[:2])
+        if status:
+            raise IOError(RMCP_ERRORS.get(
+                status, "RMCP+ status 0x{:02x}".format(status)))
+        if len(response) < 36:
+            raise IOError("Malformed Open Session Response")
+        self.bmc_id, = struct.unpack('<I', response[8:12])
+        algorithms = [ord(response[i]) & 0x3f for i in (16, 24, 32)]
+        if algorithms != [self.auth_alg, self.integrity_alg, self.conf_alg]:
+            raise IOError("Cipher suite {} is not accepted".format(
+                self.suite))
+        self.tag = (self.tag + 1) & 0xff
+        self.rm = os.urandom(16)
+        payload = struct.pack('<BxxxI', self.tag, self.bmc_id) + \
+            self.rm + struct.pack('Bxx', self.role) + \
+            chr(len(self.username)) + self.username
+        return pack_packet(RAKP1, 0, 0, payload)
+
+    def rakp3(self, response):
+        """
+        Takes RAKP 2, returns RAKP 3 or raises IOError
+        """
+        tag, status = struct.unpack('BB', response[:2])
+        if status:
+            raise IOError(RMCP_ERRORS.get(
+                status, "RMCP+ status 0x{:02x} in RAKP 2".format(status)))
+        self.rc = response[8:24]
+        self.guid = response[24:40]
+        expected = self._hmac(
+            self.password,
+            struct.pack('<II', self.console_id, self.bmc_id) +
+            self.rm + self.rc + self.guid + self._user()
+        )
+        if not hmac.compare_digest(response[40:], expected):
+            raise IOError("Wrong password")
+        self.sik = self._hmac(
+            self.password, self.rm + self.rc + self._user())
+        self.k1 = self._hmac(self.sik, '\x01' * 20)
+        self.aes_key = self._hmac(self.sik, '\x02' * 20)[:16]
+        self.tag = (self.tag + 1) & 0xff
+        payload = struct.pack('<BxxxI', self.tag, self.bmc_id) + self._hmac(
+            self.password,
+            self.rc + struct.pack('<I', self.console_id) + self._user()
+        )
+        return pack_packet(RAKP3, 0, 0, payload)
+
+    def activate(self, response):
+        """
+        Takes RAKP 4, raises IOError if BMC does not know the keys
+        """
+        tag, status = struct.unpack('BB', response[:2])
+        if status:
+            raise IOError(RMCP_ERRORS.get(
+                status, "RMCP+ status 0x{:02x} in RAKP 4".format(status)))
+        expected = self._hmac(
+            self.sik, self.rm + struct.pack('<I', self.bmc_id) + self.guid
+        )[:self.icv_length]
+        if not hmac.compare_digest(response[8:], expected):
+            raise IOError("Invalid integrity check value in RAKP 4")
+        self.state = 'active'
+
+    def seal(self, netfn, cmd, data):
+        """
+        IPMI request in the session
+        """
+        self.rq_seq = (self.rq_seq + 1) % 64
+        self.seq = (self.seq + 1) & 0xffffffff or 1
+        payload = ipmi_request(netfn, cmd, self.rq_seq, data)
+        payload_type = PAYLOAD_IPMI
+        if self.conf_alg:
+            payload_type |= ENCRYPTED
+            iv = os.urandom(16)
+            pad = -(len(payload) + 1) % 16
+            payload += ''.join(chr(i) for i in range(1, pad + 1)) + chr(pad)
+            payload = iv + AES.new(
+                self.aes_key, AES.MODE_CBC, iv).encrypt(payload)
+        if self.integrity_alg:
+            payload_type |= AUTHENTICATED
+        packet = pack_packet(payload_type, self.bmc_id, self.seq, payload)
+        if self.integrity_alg:
+            # from authentication type to next header is 4-byte aligned
+            pad = -(len(packet) - 2) % 4
+            packet += '\xff' * pad + chr(pad) + '\x07'
+            packet += self._hmac(self.k1, packet[4:])[:self.icv_length]
+        return packet
+
+    def unseal(self, packet, payload_type, payload):
+        """
+        Returns IPMI payload or None if it is not authentic
+        """
+        if self.integrity_alg:
+            if not payload_type & AUTHENTICATED:
+                return None
+            code = self._hmac(
+                self.k1, packet[4:-self.icv_length])[:self.icv_length]
+            if not hmac.compare_digest(packet[-self.icv_length:], code):
+                return None
+        if payload_type & ENCRYPTED:
+            if not self.conf_alg or len(payload) < 32 or len(payload) % 16:
+                return None
+            payload = AES.new(
+                self.aes_key, AES.MODE_CBC, payload[:16]).decrypt(payload[16:])
+            payload = payload[:-(ord(payload[-1]) + 1)]
+        return payload
+
+
+class Client(object):
+
+    def __init__(self, suite=3, privilege=4, port=RMCP_PORT):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        if suite not in CIPHER_SUITES:
+            raise ValueError("Unsupported cipher suite {}".format(suite))
+        if CIPHER_SUITES[suite][4] and AES is None:
+            raise ValueError(
+                "Cipher suite {} needs python-crypto".format(suite))
+        self.suite = suite
+        self.privilege = privilege
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(0)
+        # (addr, username, password): session
+        self.sessions = {}
+        # console session ID: session
+        self.by_id = {}
+        self.reactor = Reactor()
+        self.reactor.add_reader(self.sock.fileno(), self._received)
+        self.thread = threading.Thread(
+            target=self.reactor.run_forever, name="trix-status-lanplus")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def request(self, addr, username, password, netfn, cmd, data='',
+                timeout=10, callback=None):
+        """
+        Send IPMI request to BMC at IPv4 'addr'. callback(response)
+        is called from the client thread, see Response
+        """
+        self.request_batch(
+            addr, username, password, [(netfn, cmd, data)], timeout,
+            None if callback is None else lambda responses: callback(
+                responses[0])
+        )
+
+    def request_batch(self, addr, username, password, requests, timeout=10,
+                      callback=None):
+        """
+        Queue (netfn, cmd, data) requests to the BMC at once, they are
+        sent one by one in its session. callback(responses) gets answers
+        in the same order when all of them are known
+        """
+        if isinstance(username, unicode):
+            username = username.encode('utf-8')
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        responses = [None] * len(requests)
+        left = [len(requests)]
+
+        def answered(i, response):
+            responses[i] = response
+            left[0] -= 1
+            if not left[0] and callback is not None:
+                callback(responses)
+
+        if not requests:
+            if callback is not None:
+                callback(responses)
+            return
+        expires = time.time() + timeout
+        batch = [
+            Request(netfn, cmd, data, expires, functools.partial(answered, i))
+            for i, (netfn, cmd, data) in enumerate(requests)
+        ]
+        self.reactor.call_soon_threadsafe(
+            self._submit, (addr, username, password), batch)
+
+    def request_batch_sync(self, addr, username, password, requests,
+                           timeout=10):
+        done = threading.Event()
+        result = []
+
+        def callback(responses):
+            result.append(responses)
+            done.set()
+
+        self.request_batch(
+            addr, username, password, requests, timeout, callback)
+        # wait with timeout, otherwise KeyboardInterrupt is not delivered
+        while not done.wait(1):
+            pass
+        return result[0]
+
+    def request_sync(self, addr, username, password, netfn, cmd, data='',
+                     timeout=10):
+        return self.request_batch_sync(
+            addr, username, password, [(netfn, cmd, data)], timeout)[0]
+
+    def _console_id(self):
+        while True:
+            console_id, = struct.unpack('<I', os.urandom(4))
+            if console_id and console_id not in self.by_id:
+                return console_id
+
+    def _submit(self, key, requests):
+        session = self.sessions.get(key)
+        if session is None:
+            addr, username, password = key
+            session = Session(
+                addr, username, password, self.suite, self.privilege,
+                self._console_id()
+            )
+            self.sessions[key] = session
+            self.by_id[session.console_id] = session
+        session.queue.extend(requests)
+        self._pump(session)
+
+    def _pump(self, session):
+        if session.current is not None or not session.queue:
+            return
+        if session.state == 'new':
+            session.state = 'opening'
+            self._send(
+                session, session.open_request(), session.queue[0].expires)
+            return
+        if session.state != 'active':
+            return
+        session.current = session.queue.popleft()
+        if session.current.expires <= time.time():
+            self._reply(session, Response("Timed out", None, ''))
+            return
+        self._send(
+            session,
+            session.seal(
+                session.current.netfn, session.current.cmd,
+                session.current.data),
+            session.current.expires
+        )
+
+    def _send(self, session, packet, expires):
+        session.packet = packet
+        session.expires = expires
+        self._transmit(session)
+
+    def _transmit(self, session):
+        try:
+            self.sock.sendto(session.packet, (session.addr, self.port))
+        except socket.error as exc:
+            self._drop(session, str(exc))
+            return
+        delay = min(RETRANSMIT, max(0, session.expires - time.time()))
+        session.timer = self.reactor.call_later(
+            delay, self._retransmit, session)
+
+    def _retransmit(self, session):
+        if time.time() < session.expires:
+            self._transmit(session)
+            return
+        if session.state == 'active':
+            self._drop(session, "No answer from BMC")
+        else:
+            self._drop(session, "Unable to establish IPMI v2 / RMCP+ session")
+
+    def _reply(self, session, response):
+        request, session.current = session.current, None
+        if request.callback is not None:
+            request.callback(response)
+        self._pump(session)
+
+    def _drop(self, session, error):
+        """
+        Forget the session, queued requests get 'error'
+        """
+        if session.timer is not None:
+            session.timer.cancel()
+        self.log.debug("Session with {} failed: {}".format(
+            session.addr, error))
+        session.state = 'failed'
+        key = (session.addr, session.username, session.password)
+        if self.sessions.get(key) is session:
+            del self.sessions[key]
+        self.by_id.pop(session.console_id, None)
+        requests = list(session.queue)
+        if session.current is not None:
+            requests.insert(0, session.current)
+        session.queue.clear()
+        session.current = None
+        for request in requests:
+            if request.callback is not None:
+                request.callback(Response(error, None, ''))
+
+    def _received(self):
+        while True:
+            try:
+                packet, (addr, port) = self.sock.recvfrom(65536)
+            except socket.error as exc:
+                if exc.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.log.debug("Receive failed: {}".format(exc))
+                return
+            unpacked = unpack_packet(packet)
+            if unpacked is None:
+                continue
+            payload_type, session_id, payload = unpacked
+            bare_type = payload_type & 0x3f
+            if bare_type == PAYLOAD_IPMI:
+                session = self.by_id.get(session_id)
+            elif len(payload) >= 8:
+                console_id, = struct.unpack('<I', payload[4:8])
+                session = self.by_id.get(console_id)
+            else:
+                continue
+            if session is None or session.addr != addr:
+                continue
+            try:
+                self._handle(session, packet, payload_type, payload)
+            except IOError as exc:
+                self._drop(session, str(exc))
+
+    def _handle(self, session, packet, payload_type, payload):
+        bare_type = payload_type & 0x3f
+        expected = {
+            'opening': OPEN_SESSION_RESPONSE,
+            'rakp1': RAKP2,
+            'rakp3': RAKP4,
+            'active': PAYLOAD_IPMI,
+        }.get(session.state)
+        if bare_type != expected:
+            return
+        if bare_type != PAYLOAD_IPMI:
+            # answers to the packets sent before retransmit
+            if ord(payload[0]) != session.tag:
+                return
+            session.timer.cancel()
+            if bare_type == OPEN_SESSION_RESPONSE:
+                session.state = 'rakp1'
+                self._send(session, session.rakp1(payload), session.expires)
+            elif bare_type == RAKP2:
+                session.state = 'rakp3'
+                self._send(session, session.rakp3(payload), session.expires)
+            else:
+                session.activate(payload)
+                self.log.debug("Session with {} established".format(
+                    session.addr))
+                self._pump(session)
+            return
+
+        payload = session.unseal(packet, payload_type, payload)
+        if payload is None or session.current is None:
+            return
+        response = parse_ipmi_response(payload)
+        if response is None:
+            return
+        netfn, seq, cmd, code, data = response
+        request = session.current
+        if (netfn, seq, cmd) != (request.netfn | 1, session.rq_seq,
+                                 request.cmd):
+            return
+        session.timer.cancel()
+        self._reply(session, Response(None, code, data))
+
+    def close(self):
+        """
+        Close sessions, requests in flight get an error
+        """
+        self.reactor.stop()
+        self.thread.join(1)
+        for session in self.sessions.values():
+            if session.state == 'active':
+                packet = session.seal(
+                    NETFN_APP, CLOSE_SESSION,
+                    struct.pack('<I', session.bmc_id))
+                try:
+                    self.sock.sendto(packet, (session.addr, self.port))
+                except socket.error:
+                    pass
+            self._drop(session, "Client is closed")
+        self.sock.close()
+
+
+def get_client():
+    """
+    Returns process-wide client or None if native client is disabled
+    or the configured cipher suite can not be used
+    """
+    global _client, _unavailable
+    with _client_lock:
+        if _client is None and not _unavailable:
+            conf = get_config('ipmi', {
+                'native': True,
+                'cipher_suite': 3,
+                'privilege': 4,
+            })
+            if not conf['native']:
+                _unavailable = True
+                return None
+            try:
+                _client = Client(conf['cipher_suite'], conf['privilege'])
+            except ValueError as exc:
+                log.debug("Native IPMI is not available, use ipmitool: "
+                          "{}".format(exc))
+                _unavailable = True
+        return _client
+
+
+def shutdown():
+    global _client, _unavailable
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _unavailable = False
@@ -0,0 +1,185 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Per-node, per-probe latency kept between runs ('--adaptive-timeout').
+Timeout of a probe is p99 of the successful answers multiplied
+by 'factor' and clamped by '--timeout'. A probe that got a learned
+timeout and no answer is recorded with that timeout, so the learned
+value widens if latency of the node rises:
+
+    latency:
+      file: /var/cache/trix-status/latency.json
+      factor: 3
+      samples: 50   # latest answers kept per node and probe
+'''
+
+
+import fcntl
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+
+from trix_status import utils
+
+log = logging.getLogger(__name__)
+
+PERCENTILE = 0.99
+# not enough history, use '--timeout'
+MIN_SAMPLES = 5
+# probes get timeouts in whole seconds (ping -w, ssh ConnectTimeout)
+MIN_TIMEOUT = 1
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class LatencyStore(object):
+
+    def __init__(self, path, factor=3, samples=50):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.path = path
+        self.factor = float(factor)
+        self.samples = int(samples)
+        self.lock = threading.Lock()
+        self.stats = {}
+        # nodes probed by this process
+        self.touched = set()
+        # (node, probe): learned timeout given out and not answered yet
+        self.pending = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                stats = json.load(f)
+        except (IOError, OSError) as exc:
+            self.log.debug("No latency history in {}: {}".format(
+                self.path, exc))
+            return {}
+        except ValueError as exc:
+            self.log.warning("Ignore broken latency history {}: {}".format(
+                self.path, exc))
+            return {}
+        if not isinstance(stats, dict):
+            return {}
+        return stats
+
+    def load(self):
+        self.stats = self._read()
+
+    def save(self):
+        """
+        File is replaced atomically and only nodes probed by this
+        process are updated under a lock, so '--processes' shards
+        and parallel runs do not lose history of each other
+        """
+        with self.lock:
+            for (node, probe), timeout in self.pending.items():
+                self._add(node, probe, timeout)
+            self.pending = {}
+            if not self.touched:
+                return
+            touched = {node: self.stats[node] for node in self.touched}
+            self.touched = set()
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                stats = self._read()
+                stats.update(touched)
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix='.latency')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(stats, f, sort_keys=True)
+                os.rename(tmp, self.path)
+        except (IOError, OSError) as exc:
+            self.log.warning("Unable to save latency history to {}: {}".format(
+                self.path, exc))
+
+    def _add(self, node, probe, latency):
+        history = self.stats.setdefault(node, {}).setdefault(probe, [])
+        history.append(round(latency, 3))
+        del history[:-self.samples]
+        self.touched.add(node)
+
+    def record(self, node, probe, latency):
+        with self.lock:
+            self._add(node, probe, latency)
+            self.pending.pop((node, probe), None)
+
+    def timeout(self, node, probe, timeout):
+        """
+        Timeout for the probe, 'timeout' is the upper limit
+        """
+        with self.lock:
+            history = sorted(self.stats.get(node, {}).get(probe, []))
+        if len(history) < MIN_SAMPLES:
+            return timeout
+        p99 = history[min(len(history) - 1, int(len(history) * PERCENTILE))]
+        learned = max(MIN_TIMEOUT, int(math.ceil(p99 * self.factor)))
+        if learned >= timeout:
+            return timeout
+        with self.lock:
+            self.pending[(node, probe)] = learned
+        return learned
+
+
+def enable():
+    """
+    Load history from the file in config
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            conf = utils.get_config('latency', {
+                'file': '/var/cache/trix-status/latency.json',
+                'factor': 3,
+                'samples': 50,
+            })
+            _store = LatencyStore(
+                conf['file'], conf['factor'], conf['samples'])
+            _store.load()
+        return _store
+
+
+def disable():
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def record(node, probe, latency):
+    store = _store
+    if store is not None:
+        store.record(node, probe, latency)
+
+
+def timeout(node, probe, timeout):
+    store = _store
+    if store is None:
+        return timeout
+    return store.timeout(node, probe, timeout)
+
+
+def save():
+    store = _store
+    if store is not None:
+        store.save()
@@ -0,0 +1,188 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Delegation of node checks ('--delegate'). Nodes of a Luna group are
+checked by trix-status running on the delegate host of the group:
+
+    delegation:
+      command: [trix-status]   # how to run trix-status on delegates
+      delegates:
+        group1: node001
+        group2: localhost      # no ssh, command is started locally
+
+Delegate gets the nodes as JSON on stdin ('--node-list -'), so it
+does not need Luna, and streams answers back with '--json'.
+'''
+
+
+import json
+import logging
+import subprocess as sp
+import tempfile
+import threading
+
+from trix_status.config import category
+from trix_status.utils import get_config, ssh_cmd
+from trix_status import deadline
+
+LOCAL = 'localhost'
+
+# options passed to delegates as is when they are set
+FLAGS = [
+    ('forkserver', '--forkserver'),
+    ('adaptive_fanout', '--adaptive-fanout'),
+    ('adaptive_timeout', '--adaptive-timeout'),
+    ('hedge', '--hedge'),
+    ('pipeline', '--pipeline'),
+]
+
+
+def get_delegates():
+    """
+    Returns dict of group: delegate host
+    """
+    conf = get_config('delegation', {'delegates': {}})
+    return conf['delegates'] or {}
+
+
+class Delegate(object):
+    """
+    Runs trix-status on 'host' for 'nodes' and calls
+    on_answer(node, answers) for every node it reports.
+    'command' overrides 'delegation: command' of the config
+    """
+
+    def __init__(self, host, nodes, args, on_answer, command=None,
+                 name=None):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.host = host
+        self.name = name or host
+        self.trix_status = command
+        self.nodes = nodes
+        self.args = args
+        self.on_answer = on_answer
+        self.reported = set()
+        self.error = ''
+        self.thread = None
+
+    def command(self):
+        cmd = self.trix_status
+        if cmd is None:
+            conf = get_config('delegation', {'command': ['trix-status']})
+            cmd = conf['command']
+        cmd = list(cmd) + [
+            '--nodes', '--json', '--node-list', '-',
+            '--checks', ",".join(self.args.checks),
+            '--timeout', str(self.args.timeout),
+            '--fanout', str(self.args.fanout),
+            '--engine', self.args.engine,
+            # delegates check their nodes themselves whatever 'cli:'
+            # of their config says, so delegation never recurses
+            '--no-delegate', '--processes', '1',
+        ]
+        cmd += [
+            flag for attr, flag in FLAGS if getattr(self.args, attr, False)
+        ]
+        left = deadline.remaining()
+        if left is not None:
+            # answers need time to travel back
+            cmd += ['--deadline', str(max(1, int(left) - 1))]
+        if self.host == LOCAL:
+            return cmd
+        return ssh_cmd(self.host, cmd, self.args.timeout)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="trix-status-delegate-{}".format(self.name)
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        cmd = self.command()
+        self.log.debug("Delegate {} nodes to {}: '{}'".format(
+            len(self.nodes), self.name, cmd))
+        stderr = tempfile.TemporaryFile()
+        try:
+            proc = sp.Popen(
+                cmd, stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr,
+                close_fds=True
+            )
+        except OSError as exc:
+            self.error = str(exc)
+            stderr.close()
+            return
+
+        timer = None
+        if deadline.remaining() is not None:
+            timer = threading.Timer(deadline.remaining(), proc.kill)
+            timer.daemon = True
+            timer.start()
+
+        try:
+            proc.stdin.write(json.dumps(self.nodes))
+            proc.stdin.close()
+        except IOError:
+            pass
+
+        # readline instead of iteration, file iterator reads ahead
+        for line in iter(proc.stdout.readline, ''):
+            self._answer(line)
+
+        rc = proc.wait()
+        if timer is not None:
+            timer.cancel()
+        stderr.seek(0)
+        err = stderr.read().strip()
+        stderr.close()
+        if rc != 0:
+            self.error = "rc = {}".format(rc)
+            if err:
+                self.error += ": " + err.split("\n")[-1]
+        self.log.debug("Delegate {} finished, rc = {}, {} nodes reported".format(
+            self.name, rc, len(self.reported)))
+
+    def _answer(self, line):
+        try:
+            msg = json.loads(line)
+            node, answers = msg['node'], msg['answers']
+        except (ValueError, KeyError, TypeError):
+            self.log.debug("Unexpected line from {}: '{}'".format(
+                self.name, line.strip()))
+            return
+        self.reported.add(node)
+        self.on_answer(node, answers)
+
+    def missing_answer(self, column):
+        """
+        Answer for the node the delegate did not report
+        """
+        return {
+            'column': column,
+            'status': 'UNKN',
+            'category': category.UNKN,
+            'history': ['delegate'],
+            'info': 'delegate',
+            'details': "Delegate {} did not report the node{}".format(
+                self.name, " ({})".format(self.error) if self.error else ""
+            ),
+        }
@@ -15,110 +15,272 @@ along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
 
-import subprocess as sp
-from multiprocessing.pool import ThreadPool
-import socket
+import re
+import copy
 import time
+import errno
+import socket
 import hostlist
 
 from trix_status.config import category
+from trix_status.breaker import get_breaker
+from trix_status import latency
+from trix_status import resolver
 from nodestatus import NodeStatus
-from trix_status.utils import get_config
+from trix_status.utils import get_config, ssh_cmd
+from trix_status.engine import (
+    Call, Gather, Scan, Speculate, Throttle, Return
+)
+import probe
+
+
+def health_config():
+    """
+    'health' section, it is read once per run and given to every check
+    """
+    return get_config('health', {
+        'inventory_ip': False,
+        'ssh_banner': False,
+        'mounts': [],
+        'probe_bundle': True,
+        'speculative': False,
+    })
 
 
 class HealthStatus(NodeStatus):
+    """
+    'ip' is BOOTIF address from Luna. With 'health: inventory_ip'
+    probes use it instead of the name and DNS is only compared with it.
+    'conf' is the result of health_config(), it is read if not given
+    """
+
+    def __init__(self, node, timeout=10, ip=None, conf=None):
+        super(HealthStatus, self).__init__(node, timeout)
+        self.ip = ip
+        self.conf = conf if conf is not None else health_config()
+
+    def use_inventory_ip(self):
+        """
+        True if probes should use the address from Luna,
+        it is pinned in the resolver then
+        """
+        if not self.ip:
+            return False
+        if not self.conf['inventory_ip']:
+            return False
+        resolver.get_resolver().pin(self.node, self.ip)
+        return True
+
+    def _dns_answered(self, dns, error):
+        # unknown name is an answer, failed server is not
+        if error is not None and error.args[0] == socket.EAI_AGAIN:
+            dns.failure(error.args[1])
+        else:
+            dns.success()
+
+    def _host_answered(self, dns, output):
+        # unknown name is an answer, silent server is not
+        if output.timed_out or 'no servers could be reached' in output.stdout:
+            dns.failure(output.stdout.strip().lstrip('; ') or 'timeout')
+        else:
+            dns.success()
+
+    def check_dns(self):
+        """
+        Compare DNS answer for the node with its address in Luna.
+        DNS is asked with 'host', the resolver would answer from
+        /etc/hosts too. Returns description of the mismatch or ''
+        """
+        dns = get_breaker('DNS')
+        if not dns.allow():
+            self.tagged_log_debug("Skip DNS check: {}".format(dns.reason()))
+            raise Return('')
+
+        yield Throttle('dns')
+        output = yield self.cmd(
+            ['host', '-t', 'A', '-W', str(self.probe_timeout('resolve')),
+             self.node],
+            probe='resolve'
+        )
+        rc, stdout, stdout_lines, stderr = output
+        self._host_answered(dns, output)
+        addrs = re.findall(r' has address (\S+)', stdout)
+        self.tagged_log_debug(
+            "DNS answer {}, rc: {}, Luna: {}".format(addrs, rc, self.ip))
+
+        if output.timed_out:
+            raise Return("DNS: no answer for {}".format(self.node))
+        if rc or not addrs:
+            raise Return("DNS: {}".format(
+                stdout.strip().lstrip('; ') or 'no address'))
+        if self.ip not in addrs:
+            raise Return("DNS: {} resolves to {}, Luna has {}".format(
+                self.node, ', '.join(addrs), self.ip))
+        raise Return('')
 
     def check_resolv(self):
         self.tagged_log_debug("Check if we can resolve hostname")
         self.answer['history'].append('resolve')
 
-        rc, stdout, stdout_lines, stderr = self.cmd(
-            "host -W {} {}".format(self.timeout, self.node))
+        dns = get_breaker('DNS')
+        if not dns.allow():
+            self.answer['details'] = dns.reason()
+            raise Return(False)
+
+        if resolver.native():
+            ok = yield self._resolve_native(dns)
+            raise Return(ok)
+
+        yield Throttle('dns')
+        output = yield self.cmd(
+            ['host', '-W', str(self.probe_timeout('resolve')), self.node],
+            probe='resolve'
+        )
+        rc, stdout, stdout_lines, stderr = output
 
         self.tagged_log_debug("Check resolve rc = {}".format(rc))
+        self._host_answered(dns, output)
 
         if rc:
             self.answer['details'] = stdout
 
-        return not rc
+        raise Return(not rc)
+
+    def _resolve_native(self, dns):
+        started = time.time()
+        addr, error = yield Call(resolver.get_resolver().lookup, self.node)
+
+        self.tagged_log_debug("Resolved to {}, error: {}".format(addr, error))
+        self._dns_answered(dns, error)
+
+        if error is not None:
+            self.answer['details'] = "Host {} not found: {}".format(
+                self.node, error.args[-1])
+            raise Return(False)
+
+        latency.record(self.node, 'resolve', time.time() - started)
+        raise Return(True)
 
     def check_ping(self):
         self.tagged_log_debug("Check if node is pingable")
         self.answer['history'].append('ping')
 
-        rc, stdout, stdout_lines, stderr = self.cmd(
-            "ping -c1 -w{} {}".format(self.timeout, self.node)
-        )
+        ok, details = yield self.ping(self.node, 'ping', hedge=True)
 
-        self.tagged_log_debug("Check ping rc = {}".format(rc))
+        self.tagged_log_debug("Check ping ok = {}".format(ok))
 
-        if rc:
-            if len(stdout_lines) > 1:
-                self.answer['details'] = stdout_lines[-2]
+        if not ok and details:
+            self.answer['details'] = details
 
-        return not rc
+        raise Return(ok)
 
-    def check_ssh_port(self):
+    def check_ssh_port(self, scanned=None):
+        """
+        'scanned' is (rc, banner) if the port was scanned already
+        (see HealthPipeline)
+        """
         self.tagged_log_debug("Check if ssh port is open")
         self.answer['history'].append('ssh port')
 
-        try:
-            rc = 1
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.timeout)
-            rc = sock.connect_ex((self.node, 22))
-        except Exception as e:
-            msg = (
-                "Exception on checking if ssh port is open on node: '{}'"
-            ).format(e)
-            self.tagged_log_debug(msg)
-            rc = 1
-        finally:
-            sock.close()
+        banner = self.conf['ssh_banner']
+        if scanned is None:
+            started = time.time()
+            scanned = yield Scan(
+                self.node, 22, self.probe_timeout('ssh_port'), banner)
+            if not scanned[0]:
+                latency.record(self.node, 'ssh_port', time.time() - started)
+        rc, line = scanned
 
         if rc:
+            self.tagged_log_debug(
+                "Connect to ssh port failed: '{}'".format(
+                    errno.errorcode.get(rc, rc))
+            )
             self.answer['details'] = "Port 22 is closed"
+        elif banner:
+            self.tagged_log_debug("ssh banner: '{}'".format(line))
+            if line is None or not line.startswith('SSH-'):
+                self.answer['details'] = "No ssh banner on port 22"
+                raise Return(False)
 
         self.tagged_log_debug("Check ssh port rc = {}".format(rc))
-        return not rc
+        raise Return(not rc)
 
     def check_ssh(self):
         self.tagged_log_debug("Check if node available via ssh")
         self.answer['history'].append('ssh')
 
-        rc, stdout, stdout_lines, stderr = self.cmd(
-            (
-                "ssh -o ConnectTimeout={} -o StrictHostKeyChecking=no {} uname"
-            ).format(self.timeout, self.node)
+        rc, stdout, stdout_lines, stderr = yield self.cmd(
+            ssh_cmd(self.node, ['uname'], self.probe_timeout('ssh')),
+            probe='ssh', hedge=True
         )
 
         self.tagged_log_debug("Check ssh rc = {}".format(rc))
-        return not rc
+        raise Return(not rc)
+
+    def _speculative_step(self, check):
+        """
+        Runs the check on a copy, so checks running in parallel
+        do not mix their history and details
+        """
+        step = copy.copy(self)
+        step.answer = {'history': [], 'details': ''}
+        ok = yield getattr(step, check)()
+        raise Return((ok, step.answer['history'], step.answer['details']))
+
+    def check_reachable(self, resolve=True):
+        """
+        Starts resolve, ping and ssh port checks at the same time.
+        Once one of them fails and the ones before it succeeded,
+        the rest are cancelled. History, info and details are the same
+        as if the checks were run one by one
+        """
+        checks = ['check_ping', 'check_ssh_port']
+        if resolve:
+            checks.insert(0, 'check_resolv')
+        else:
+            self.answer['status'] = 'DOWN'
+        results = yield Speculate(
+            [self._speculative_step(check) for check in checks],
+            decisive=lambda result: not result[0],
+            kind='health probe'
+        )
+        for ok, history, details in results:
+            self.answer['history'].extend(history)
+            if not ok:
+                self.answer['info'] = history[-1]
+                self.answer['details'] = details
+                raise Return(False)
+            # name is resolved, unreachable node is DOWN
+            self.answer['status'] = 'DOWN'
+        raise Return(True)
 
     def _discover_mountpoints(self):
         # get mountpoints
-        cmd = (
-            "ssh -o ConnectTimeout={} -o StrictHostKeyChecking=no {} "
-            + "systemctl --type mount --all --no-legend"
-        ).format(self.timeout, self.node)
-        rc, stdout, stdout_lines, stderr = self.cmd(cmd)
+        cmd = ssh_cmd(
+            self.node,
+            ['systemctl', '--type', 'mount', '--all', '--no-legend'],
+            self.timeout
+        )
+        rc, stdout, stdout_lines, stderr = yield self.cmd(cmd)
         if rc:
-            return []
+            raise Return([])
+        raise Return(self._mount_units_to_fs(stdout_lines))
+
+    def _mount_units_to_fs(self, lines):
         fs_mounts = []
-        standart_mounts = ['-.mount', 'run-user-0.mount']
-        for line in stdout_lines:
+        for line in lines:
             line = line.split()
+            if len(line) < 5:
+                continue
             fs, unit_name = line[4], line[0]
-            if fs[0] == '/' and unit_name not in standart_mounts:
+            if fs[0] == '/' and unit_name not in probe.STANDARD_MOUNTS:
                 fs_mounts.append(fs)
-
         return fs_mounts
 
     def _get_mountfs_from_confg(self):
-        config = get_config('health', {'mounts': []})
         fs_mounts = []
-        config = config['mounts']
-        for hostexpr, mps in config.items():
+        for hostexpr, mps in self.conf['mounts'].items():
             hosts = hostlist.expand_hostlist(hostexpr)
             if self.node in hosts:
                 fs_mounts.extend(mps)
@@ -134,87 +296,157 @@ class HealthStatus(NodeStatus):
             fs_mounts = []
 
         if not fs_mounts:
-            fs_mounts = self._discover_mountpoints()
+            fs_mounts = yield self._discover_mountpoints()
 
             self.tagged_log_debug(
                 "Discovered mounts: {}".format(fs_mounts)
             )
 
         if not fs_mounts:
-            return False
-
-        thread_pool = ThreadPool(10)
+            raise Return(False)
 
-        self.tagged_log_debug("Map check_mount workers to threads")
-        workers_return = thread_pool.map(
-            self.mount_worker,
-            fs_mounts
+        self.tagged_log_debug("Run check_mount workers in parallel")
+        workers_return = yield Gather(
+            [self.mount_worker(fs) for fs in fs_mounts],
+            kind='mount'
         )
 
         self.tagged_log_debug(
             "Returned from mount workers: '{}'".format(workers_return)
         )
+        raise Return(self._mounts_result(workers_return))
+
+    def _mounts_result(self, workers_return):
+        """
+        Fill details from (fs, details, status_ok) of every mountpoint.
+        Returns True if all of them are healthy
+        """
         broken_fs = []
+        ssh_errors = []
         error = False
         for fs, details, status_ok in workers_return:
             if not status_ok:
                 error = True
                 broken_fs.append(fs)
+                if details[:3] == 'ssh' and details not in ssh_errors:
+                    ssh_errors.append(details)
         if broken_fs:
             self.answer['details'] = "FAIL:" + ",".join(broken_fs)
+        if ssh_errors:
+            self.answer['details'] += " ({})".format(", ".join(ssh_errors))
 
         return not error
 
-    def mount_worker(self, fs):
+    def run_bundle(self):
+        """
+        Runs the probe bundle (see probe.py) over one ssh session.
+        Returns (ssh_ok, answer), answer is None if the bundle
+        is not usable on the node
+        """
+        self.tagged_log_debug("Run probe bundle")
+        self.answer['history'].append('ssh')
+
+        try:
+            fs_mounts = self._get_mountfs_from_confg()
+        except Exception:
+            fs_mounts = []
+
+        # connect and stat of the mountpoints take a timeout each
+        output = yield self.cmd(
+            probe.probe_cmd(self.node, fs_mounts, self.timeout),
+            timeout=self.timeout * 2, input=probe.SCRIPT
+        )
+        rc, stdout, stdout_lines, stderr = output
 
-        ssh_cmd = (
-            "ssh -o ConnectTimeout={} -o StrictHostKeyChecking=no {} "
-        ).format(self.timeout, self.node)
+        if rc == 255 or output.timed_out:
+            raise Return((False, None))
+
+        answer = probe.parse(stdout) if rc == 0 else None
+        if answer is None:
+            self.tagged_log_debug(
+                "Probe bundle is not usable, rc = {}, stderr = '{}'".format(
+                    rc, stderr.strip())
+            )
+        raise Return((True, answer))
+
+    def check_bundle_mounts(self, bundle):
+        self.tagged_log_debug("Check mountpoints from probe bundle")
+        self.answer['history'].append('mounts')
+
+        try:
+            fs_mounts = self._get_mountfs_from_confg()
+        except Exception:
+            fs_mounts = []
+
+        if not fs_mounts:
+            fs_mounts = self._mount_units_to_fs(bundle['mount_units'])
+
+        if not fs_mounts:
+            return False
+
+        results = []
+        for fs in fs_mounts:
+            stat = bundle['stat'].get(fs)
+            if fs not in bundle['proc_mounts']:
+                results.append((fs, 'Not mounted', False))
+            elif stat is None or stat['timed_out']:
+                results.append((fs, 'Stat timeout', False))
+            elif stat['rc'] != 0:
+                results.append((fs, "Stat rc = {}".format(stat['rc']), False))
+            else:
+                results.append((fs, "", True))
+
+        self.tagged_log_debug("Mountpoints from bundle: '{}'".format(results))
+        return self._mounts_result(results)
+
+    def mount_worker(self, fs):
 
         self.tagged_log_debug(
             "Mount worker is spawned for {}".format(fs)
         )
 
         # check if fs mounted
-        cmd = ssh_cmd + "cat /proc/mounts | grep -q '{}'".format(fs)
-        rc, stdout, stdout_lines, stderr = self.cmd(cmd)
+        cmd = ssh_cmd(self.node, ['cat', '/proc/mounts'], self.timeout)
+        rc, stdout, stdout_lines, stderr = yield self.cmd(cmd)
         if rc:
-            return (fs, 'Not mounted', False)
+            raise Return((fs, "ssh rc = {}".format(rc), False))
+
+        # kernel escapes spaces and other special chars as \ooo
+        mountpoints = [
+            re.sub(
+                r'\\([0-7]{3})',
+                lambda m: chr(int(m.group(1), 8)),
+                line.split()[1]
+            )
+            for line in stdout_lines if len(line.split()) > 1
+        ]
+        if fs not in mountpoints:
+            raise Return((fs, 'Not mounted', False))
 
-        cmd = ssh_cmd + "stat -t {}".format(fs)
+        cmd = ssh_cmd(self.node, ['stat', '-t', fs], self.timeout)
 
         self.tagged_log_debug(
             "Stat cmd: '{}'".format(cmd)
         )
 
-        stat_proc = sp.Popen(
-            cmd, shell=True, stdout=sp.PIPE, stderr=sp.PIPE)
-        i = 0
-        while True:
-            if stat_proc.poll() is None:
-                time.sleep(1)
-            else:
-                break
-            i += 1
-            if i > self.timeout:
-                stat_proc.kill()
-                msg = 'Stat timeout for {}'.format(fs)
-                self.tagged_log_debug(msg)
-                return (fs, 'Stat timeout', False)
+        output = yield self.cmd(cmd, timeout=self.timeout)
+        rc, stdout, stdout_lines, stderr = output
 
-        stdout, stderr = stat_proc.communicate()
+        if output.timed_out:
+            msg = 'Stat timeout for {}'.format(fs)
+            self.tagged_log_debug(msg)
+            raise Return((fs, 'Stat timeout', False))
 
-        if stat_proc.returncode != 0:
+        if rc != 0:
             msg = 'Stat for {} returned non-zero code: {}'.format(
-                fs, stat_proc.returncode
+                fs, rc
             )
             self.tagged_log_debug(msg)
-            return (fs, "Stat rc = {}".format(stat_proc.returncode), False)
+            raise Return((fs, "Stat rc = {}".format(rc), False))
 
-        return (fs, "", True)
+        raise Return((fs, "", True))
 
-    def status(self):
-        self.tagged_log_debug("Health checker started")
+    def new_answer(self):
         self.answer = {
             'column': 'health',
             'status': 'UNKN',
@@ -224,35 +456,79 @@ class HealthStatus(NodeStatus):
             'details': ''
         }
 
-        if not self.check_resolv():
-            self.answer['info'] = self.answer['history'][-1]
-            return self.answer
-
-        self.answer['status'] = 'DOWN'
-
-        if not self.check_ping():
-            self.answer['info'] = self.answer['history'][-1]
-            return self.answer
-
-        if not self.check_ssh_port():
-            self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+    def status_coro(self):
+        self.tagged_log_debug("Health checker started")
+        self.new_answer()
+
+        if not self.use_inventory_ip():
+            answer = yield self.probe(resolve=True)
+            raise Return(answer)
+
+        # DNS is asked in parallel and does not block the probes
+        answer, mismatch = yield Gather([
+            self.probe(resolve=False), self.check_dns()])
+        self.dns_mismatch(mismatch)
+        raise Return(answer)
+
+    def dns_mismatch(self, mismatch):
+        """
+        Healthy node with broken DNS record needs attention
+        """
+        if not mismatch or self.answer['status'] != 'OK':
+            return
+        self.answer['category'] = category.WARN
+        self.answer['info'] = 'dns'
+        self.answer['details'] = mismatch
+
+    def probe(self, resolve=True):
+        """
+        Probes of the node, without 'resolve' the name
+        is expected to be resolved already
+        """
+        if self.conf['speculative']:
+            if not (yield self.check_reachable(resolve)):
+                raise Return(self.answer)
+        else:
+            if resolve and not (yield self.check_resolv()):
+                self.answer['info'] = self.answer['history'][-1]
+                raise Return(self.answer)
+
+            self.answer['status'] = 'DOWN'
+
+            if not (yield self.check_ping()):
+                self.answer['info'] = self.answer['history'][-1]
+                raise Return(self.answer)
+
+            if not (yield self.check_ssh_port()):
+                self.answer['info'] = self.answer['history'][-1]
+                raise Return(self.answer)
 
         self.answer['category'] = category.DOWN
 
-        if not self.check_ssh():
+        bundle = None
+        if self.conf['probe_bundle']:
+            ssh_ok, bundle = yield self.run_bundle()
+        else:
+            ssh_ok = yield self.check_ssh()
+
+        if not ssh_ok:
             self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+            raise Return(self.answer)
 
         self.answer['status'] = 'AVAIL'
         self.answer['category'] = category.WARN
 
-        if not self.check_mounts():
+        if bundle is not None:
+            mounts_ok = self.check_bundle_mounts(bundle)
+        else:
+            mounts_ok = yield self.check_mounts()
+
+        if not mounts_ok:
             self.answer['info'] = self.answer['history'][-1]
             self.answer['status'] = 'NO_FS'
-            return self.answer
+            raise Return(self.answer)
 
         self.answer['status'] = 'OK'
         self.answer['category'] = category.GOOD
 
-        return self.answer
+        raise Return(self.answer)
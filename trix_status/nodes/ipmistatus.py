@@ -16,15 +16,26 @@ along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
 
 
 import logging
-import socket
+import time
 
 from nodestatus import NodeStatus
 from trix_status.config import category
+from trix_status import latency
+from trix_status import lanplus
+from trix_status import sdr
+from trix_status import sel
+from trix_status import redfish
+from trix_status import resolver
+from trix_status import deadline
+from trix_status.engine import (
+    RMCPPing, IPMIRequest, IPMIBatch, Call, Throttle, Return
+)
 
 
 class IPMIStatus(NodeStatus):
 
-    def __init__(self, node, ip, username, password, timeout=10):
+    def __init__(self, node, ip, username, password, timeout=10,
+                 backend='ipmi'):
         self.node = node
         self.timeout = timeout
         module_name = self.__module__ + "." + type(self).__name__
@@ -32,58 +43,196 @@ class IPMIStatus(NodeStatus):
         self.ip = ip
         self.username = username
         self.password = password
+        # 'ipmi' or 'redfish'
+        self.backend = backend
 
     def check_ipmi_configured(self):
         self.answer['history'].append('config')
 
         return (self.ip and self.username and self.password)
 
+    def ipmi(self, netfn, cmd, data='', probe=None):
+        """
+        IPMI command over RMCP+ session shared by all checks of the BMC.
+        Returns lanplus.Response, latency of answers is recorded as 'probe'
+        """
+        timeout = self.timeout if probe is None else self.probe_timeout(probe)
+        started = time.time()
+        response = yield IPMIRequest(
+            self.ip, self.username, self.password, netfn, cmd, data, timeout)
+        if response.error is not None:
+            self.tagged_log_debug(
+                "IPMI command 0x{:02x}/0x{:02x} failed: {}".format(
+                    netfn, cmd, response.error))
+        elif probe is not None:
+            latency.record(self.node, probe, time.time() - started)
+        raise Return(response)
+
+    def session_request(self):
+        """
+        Returns (address of BMC, request(netfn, cmd, data)) for
+        commands sent from worker threads, (None, None) if the BMC
+        is not resolved
+        """
+        addr, error = resolver.get_resolver().lookup(self.ip)
+        if addr is None:
+            return None, None
+        client = lanplus.get_client()
+        timeout = deadline.clamp(self.timeout)
+
+        def request(netfn, cmd, data):
+            return client.request_sync(
+                addr, self.username, self.password, netfn, cmd, data,
+                timeout)
+
+        return addr, request
+
+    def read_sdr(self):
+        """
+        Threshold sensors of the BMC from SDR cache,
+        it is called in a worker thread
+        """
+        addr, request = self.session_request()
+        if addr is None:
+            return None
+        return sdr.get_cache().sensors(addr, request)
+
+    def read_sel(self):
+        """
+        Events of the BMC logged since the last run,
+        it is called in a worker thread
+        """
+        addr, request = self.session_request()
+        if addr is None:
+            return None
+        return sel.get_log().events(addr, request)
+
+    def check_sensors(self):
+        """
+        Read all threshold sensors at once,
+        the ones out of range are listed in details
+        """
+        self.answer['history'].append('sensors')
+
+        sensors = yield Call(self.read_sdr)
+        if sensors is None:
+            self.answer['details'] = "Unable to read SDR"
+            raise Return(None)
+        responses = yield IPMIBatch(
+            self.ip, self.username, self.password,
+            [(sdr.NETFN_SENSOR, sdr.GET_SENSOR_READING, chr(s['number']))
+             for s in sensors],
+            self.probe_timeout('bmc_sensors')
+        )
+        alerts = []
+        for sensor, response in zip(sensors, responses):
+            if response.error is not None or response.code:
+                continue
+            alert = sdr.check_reading(sensor, response.data)
+            if alert is not None:
+                alerts.append(alert)
+        self.tagged_log_debug("{} sensors, {} out of range".format(
+            len(sensors), len(alerts)))
+        raise Return(alerts)
+
+    def check_sel(self):
+        """
+        Read SEL entries added since the last run,
+        warning and critical events are listed in details
+        """
+        self.answer['history'].append('sel')
+
+        events = yield Call(self.read_sel)
+        if events is None:
+            self.answer['details'] = "Unable to read SEL"
+            raise Return(None)
+        self.tagged_log_debug("{} SEL events".format(len(events)))
+        raise Return(events)
+
+    def read_redfish(self):
+        """
+        (error, power state, health rollup) from Redfish,
+        it is called in a worker thread
+        """
+        addr, error = resolver.get_resolver().lookup(self.ip)
+        if addr is None:
+            return "Unable to resolve {}".format(self.ip), None, None
+        return redfish.get_pool().system_status(
+            addr, self.username, self.password,
+            deadline.clamp(self.probe_timeout('bmc_redfish')))
+
+    def check_redfish(self):
+        """
+        Power state and health rollup of the system from Redfish
+        """
+        self.tagged_log_debug("Check power status of the node over Redfish")
+        self.answer['history'].append('redfish')
+
+        yield Throttle('bmc')
+        started = time.time()
+        error, power, health = yield Call(self.read_redfish)
+        if error is not None:
+            self.answer['details'] = error
+            raise Return(False)
+        latency.record(self.node, 'bmc_redfish', time.time() - started)
+        self.answer['status'] = power
+        raise Return(health)
+
     def check_udp_ping(self):
         self.answer['history'].append('udp_ping')
 
-        ipmi_message = (
-            "0600ff07000000000000000000092018c88100388e04b5").decode('hex')
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.settimeout(self.timeout)
-        sock.sendto(ipmi_message, (self.ip, 623))
-
-        try:
-            data, addr = sock.recvfrom(1024)
-            udp_pingable = True
-        except:
-            udp_pingable = False
+        # BMCs are swept at start, this waits for the shared answer
+        rtt = yield RMCPPing(self.ip, self.probe_timeout('bmc_udp'))
+        udp_pingable = rtt is not None
+        if udp_pingable:
+            latency.record(self.node, 'bmc_udp', rtt)
 
-        return udp_pingable
+        raise Return(udp_pingable)
 
     def check_ping(self):
 
         self.tagged_log_debug("Check if IPMI IP is pingable")
         self.answer['history'].append('ping')
 
-        rc, stdout, stdout_lines, stderr = self.cmd(
-            "ping -c1 -w{} {}".format(self.timeout, self.ip)
-        )
-        self.tagged_log_debug("Check ping rc = {}".format(rc))
+        yield Throttle('bmc')
+        ok, details = yield self.ping(self.ip, 'bmc_ping')
+        self.tagged_log_debug("Check ping ok = {}".format(ok))
 
-        return not rc
+        raise Return(ok)
 
     def check_power(self):
         self.tagged_log_debug("Check power status of the node")
         self.answer['history'].append('power')
 
-        rc, stdout, stdout_lines, stderr = self.cmd(
-            (
-                "ipmitool -I lanplus -H {} -U {} -P {} chassis status"
-            ).format(self.ip, self.username, self.password)
-        )
+        yield Throttle('bmc')
+        if lanplus.get_client() is not None:
+            response = yield self.ipmi(
+                lanplus.NETFN_CHASSIS, lanplus.GET_CHASSIS_STATUS,
+                probe='bmc_power'
+            )
+            if response.error is not None:
+                self.answer['details'] = response.error
+                raise Return(False)
+            if response.code or not response.data:
+                self.answer['details'] = (
+                    "Get Chassis Status completion code 0x{:02x}".format(
+                        response.code))
+                raise Return(False)
+            self.answer['status'] = lanplus.power_state(response.data)
+            raise Return(True)
+
+        rc, stdout, stdout_lines, stderr = yield self.cmd([
+            'ipmitool', '-I', 'lanplus', '-H', self.ip,
+            '-U', self.username, '-P', self.password, 'chassis', 'status'
+        ])
         self.tagged_log_debug("Check ping rc = {}".format(rc))
         for line in stdout_lines:
             if line[:12] == 'System Power':
                 self.answer['status'] = line.split(" ")[-1].upper()
 
-        return not rc
+        raise Return(not rc)
 
-    def status(self):
+    def status_coro(self):
         self.tagged_log_debug("IPMI checker started")
         self.answer = {
             'column': 'ipmi',
@@ -96,21 +245,24 @@ class IPMIStatus(NodeStatus):
 
         if not self.check_ipmi_configured():
             self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+            raise Return(self.answer)
 
-        if not self.check_udp_ping():
+        if self.backend == 'redfish':
+            raise Return((yield self.redfish_coro()))
+
+        if not (yield self.check_udp_ping()):
             self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+            raise Return(self.answer)
 
-        if not self.check_ping():
+        if not (yield self.check_ping()):
             self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+            raise Return(self.answer)
 
         self.answer['category'] = category.WARN
 
-        if not self.check_power():
+        if not (yield self.check_power()):
             self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+            raise Return(self.answer)
 
         if self.answer['status'] == 'ON':
             self.answer['category'] = category.GOOD
@@ -118,4 +270,52 @@ class IPMIStatus(NodeStatus):
         if self.answer['status'] == 'OFF':
             self.answer['category'] = category.DOWN
 
-        return self.answer
+        alerts = []
+        if self.answer['status'] == 'ON' and sdr.enabled() and \
+                lanplus.get_client() is not None:
+            found = yield self.check_sensors()
+            if found:
+                self.answer['info'] = self.answer['history'][-1]
+                alerts.extend(found)
+
+        if sel.enabled() and lanplus.get_client() is not None:
+            found = yield self.check_sel()
+            if found:
+                self.answer['info'] = self.answer['history'][-1]
+                alerts.extend(found)
+
+        if alerts:
+            self.answer['details'] = ", ".join(
+                text for critical, text in alerts)
+            self.answer['category'] = category.WARN
+            if any(critical for critical, text in alerts):
+                self.answer['category'] = category.ERROR
+
+        raise Return(self.answer)
+
+    def redfish_coro(self):
+        if not (yield self.check_ping()):
+            self.answer['info'] = self.answer['history'][-1]
+            raise Return(self.answer)
+
+        self.answer['category'] = category.WARN
+
+        health = yield self.check_redfish()
+        if not health:
+            self.answer['info'] = self.answer['history'][-1]
+            raise Return(self.answer)
+
+        if self.answer['status'] == 'ON':
+            self.answer['category'] = category.GOOD
+
+        if self.answer['status'] == 'OFF':
+            self.answer['category'] = category.DOWN
+
+        if health != 'OK':
+            self.answer['info'] = self.answer['history'][-1]
+            self.answer['details'] = "Health {}".format(health)
+            self.answer['category'] = category.WARN
+            if health == 'Critical':
+                self.answer['category'] = category.ERROR
+
+        raise Return(self.answer)
@@ -16,13 +16,41 @@ along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
 
 
 import logging
-from trix_status import utils
-from abc import ABCMeta, abstractmethod
+from collections import namedtuple
+from trix_status import latency
+from trix_status import icmp
+from trix_status import resolver
+from trix_status.engine import Command, Hedged, Call, Ping, Return, run_sync
+
+
+class CmdOutput(namedtuple(
+        'CmdOutput', ['rc', 'stdout', 'stdout_lines', 'stderr'])):
+    """
+    Returned by NodeStatus.cmd(), can be unpacked as 4 values.
+    Also has 'wall_time' and 'timed_out' of the command
+    """
+    wall_time = 0.0
+    timed_out = False
 
 
 class NodeStatus(object):
+    """
+    Checks implement either blocking status()
+    or status_coro() coroutine (see trix_status.engine).
+    Default implementations call each other, so at least one of them
+    should be overridden, otherwise the check can not be created
+    """
 
-    __metaclass__ = ABCMeta
+    def __new__(cls, *args, **kwargs):
+        if (cls.status.im_func is NodeStatus.status.im_func
+                and cls.status_coro.im_func is NodeStatus.status_coro.im_func):
+            raise TypeError(
+                (
+                    "Can't instantiate {}: either status() or "
+                    + "status_coro() should be implemented"
+                ).format(cls.__name__)
+            )
+        return super(NodeStatus, cls).__new__(cls)
 
     def __init__(self, node, timeout=10):
         self.node = node
@@ -34,9 +62,24 @@ class NodeStatus(object):
         tag = self.node
         self.log.debug("{}:{}".format(tag, line))
 
-    def cmd(self, cmd):
+    def probe_timeout(self, probe):
+        """
+        Timeout for the probe learned from its latency on this node,
+        see trix_status.latency
+        """
+        return latency.timeout(self.node, probe, self.timeout)
+
+    def cmd(self, cmd, timeout=30, probe=None, hedge=False, input=None):
+        """
+        Latency of successful 'probe' commands is recorded,
+        with 'hedge' they can be hedged (see trix_status.hedging)
+        """
         self.tagged_log_debug("Command to run: '{}'".format(cmd))
-        rc, stdout, stderr, e = utils.run_cmd(cmd)
+        op = Command(cmd, timeout, input)
+        if probe is not None and hedge:
+            op = Hedged(op, probe)
+        result = yield op
+        rc, stdout, stderr, e = result
 
         if e:
             self.tagged_log_debug(
@@ -52,12 +95,50 @@ class NodeStatus(object):
         oneline = lambda x: "\\n".join(x.split("\n"))
         self.tagged_log_debug(
             (
-                "cmd = '{}', rc = {}, stdout = '{}', stderr = '{}'"
-            ).format(cmd, rc, oneline(stdout), oneline(stderr))
+                "cmd = '{}', rc = {}, wall time = {:.3f}s, "
+                + "stdout = '{}', stderr = '{}'"
+            ).format(
+                cmd, rc, result.wall_time, oneline(stdout), oneline(stderr)
+            )
         )
 
-        return rc, stdout, stdout_lines, stderr
+        if probe is not None and rc == 0 and not result.timed_out:
+            latency.record(self.node, probe, result.wall_time)
+
+        output = CmdOutput(rc, stdout, stdout_lines, stderr)
+        output.wall_time = result.wall_time
+        output.timed_out = result.timed_out
+        raise Return(output)
+
+    def ping(self, host, probe, hedge=False):
+        """
+        Returns (ok, details). Echo is sent by the in-process pinger,
+        if ICMP sockets are not permitted 'ping' is run
+        """
+        timeout = self.probe_timeout(probe)
+        if icmp.get_pinger() is not None:
+            rtt = yield Ping(host, timeout)
+            if rtt is None:
+                self.tagged_log_debug("No echo reply from {}".format(host))
+                raise Return((False, "No echo reply in {}s".format(timeout)))
+            self.tagged_log_debug(
+                "Echo reply from {} in {:.3f}s".format(host, rtt))
+            latency.record(self.node, probe, rtt)
+            raise Return((True, ''))
+
+        rc, stdout, stdout_lines, stderr = yield self.cmd(
+            ['ping', '-c1', '-w{}'.format(timeout),
+             resolver.cached(host) or host],
+            probe=probe, hedge=hedge
+        )
+        details = ''
+        if rc and len(stdout_lines) > 1:
+            details = stdout_lines[-2]
+        raise Return((not rc, details))
 
-    @abstractmethod
     def status(self):
-        pass
+        return run_sync(self.status_coro())
+
+    def status_coro(self):
+        answer = yield Call(self.status)
+        raise Return(answer)
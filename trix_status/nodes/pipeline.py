@@ -0,0 +1,166 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Health check as a pipeline of stages ('--pipeline'). Instead of every
+node walking its own resolve -> ping -> ssh port -> ssh -> mounts chain,
+every stage is run for all nodes which passed the previous one:
+
+    resolve   all nodes, but the ones probed by Luna address
+    ping      resolved nodes
+    ssh port  pingable nodes
+    ssh       nodes with open port (probe bundle or uname)
+    mounts    nodes available via ssh
+
+Answers are the same as HealthStatus gives, nodes are reported as soon
+as they fail a stage. DNS records of healthy nodes probed by Luna
+address ('health: inventory_ip') are compared with it at the end.
+'''
+
+
+import logging
+
+from trix_status.config import category
+from trix_status.engine import Call, Gather, Return
+from trix_status import resolver
+from trix_status import portscan
+
+
+class HealthPipeline(object):
+    """
+    Runs the stages for HealthStatus 'checks' and calls
+    on_answer(check) once the answer of the check is final
+    """
+
+    def __init__(self, checks, on_answer):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.checks = checks
+        self.on_answer = on_answer
+
+    def _passed(self, checks, results, status=None):
+        """
+        Report checks failed the stage, returns the rest
+        """
+        alive = []
+        for check, ok in zip(checks, results):
+            if ok:
+                alive.append(check)
+                continue
+            check.answer['info'] = check.answer['history'][-1]
+            if status is not None:
+                check.answer['status'] = status
+            self.on_answer(check)
+        self.log.debug("{} of {} nodes passed '{}' stage".format(
+            len(alive), len(checks),
+            checks[0].answer['history'][-1] if checks else None))
+        return alive
+
+    def stage(self, checks, step):
+        """
+        Runs HealthStatus method 'step' for all checks
+        """
+        if not checks:
+            raise Return([])
+        results = yield Gather(
+            [getattr(check, step)() for check in checks], kind='health')
+        raise Return(self._passed(checks, results))
+
+    def ssh_port_stage(self, checks):
+        """
+        Port 22 of all nodes is scanned at once from one thread
+        """
+        if not checks:
+            raise Return([])
+        scanned = yield Call(
+            portscan.get_scanner().scan_all,
+            [(c.node, c.probe_timeout('ssh_port')) for c in checks],
+            22, checks[0].conf['ssh_banner']
+        )
+        results = yield Gather(
+            [c.check_ssh_port(s) for c, s in zip(checks, scanned)],
+            kind='health'
+        )
+        raise Return(self._passed(checks, results))
+
+    def ssh_stage(self, checks):
+        if not checks:
+            raise Return([])
+        if not checks[0].conf['probe_bundle']:
+            alive = yield self.stage(checks, 'check_ssh')
+            raise Return(alive)
+        results = yield Gather(
+            [check.run_bundle() for check in checks], kind='health')
+        for check, (ssh_ok, bundle) in zip(checks, results):
+            check.bundle = bundle
+        raise Return(self._passed(checks, [ok for ok, _ in results]))
+
+    def mounts_stage(self, checks):
+        with_bundle = [c for c in checks if c.bundle is not None]
+        results = [c.check_bundle_mounts(c.bundle) for c in with_bundle]
+        without_bundle = [c for c in checks if c.bundle is None]
+        if without_bundle:
+            results += yield Gather(
+                [c.check_mounts() for c in without_bundle], kind='health')
+        raise Return(self._passed(
+            with_bundle + without_bundle, results, status='NO_FS'))
+
+    def run(self):
+        to_resolve = []
+        pinned = []
+        for check in self.checks:
+            check.new_answer()
+            check.bundle = None
+            if check.use_inventory_ip():
+                pinned.append(check)
+            else:
+                to_resolve.append(check)
+
+        if resolver.native() and to_resolve:
+            # all names at once, check_resolv gets answers from the cache
+            yield Call(
+                resolver.get_resolver().lookup_all,
+                [check.node for check in to_resolve]
+            )
+        alive = yield self.stage(to_resolve, 'check_resolv')
+        alive += pinned
+        for check in alive:
+            check.answer['status'] = 'DOWN'
+
+        alive = yield self.stage(alive, 'check_ping')
+        alive = yield self.ssh_port_stage(alive)
+        for check in alive:
+            check.answer['category'] = category.DOWN
+
+        alive = yield self.ssh_stage(alive)
+        for check in alive:
+            check.answer['status'] = 'AVAIL'
+            check.answer['category'] = category.WARN
+
+        alive = yield self.mounts_stage(alive)
+        for check in alive:
+            check.answer['status'] = 'OK'
+            check.answer['category'] = category.GOOD
+
+        pinned = [check for check in alive if check in pinned]
+        if pinned:
+            mismatches = yield Gather(
+                [check.check_dns() for check in pinned], kind='health')
+            for check, mismatch in zip(pinned, mismatches):
+                check.dns_mismatch(mismatch)
+
+        for check in alive:
+            self.on_answer(check)
@@ -0,0 +1,146 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Probe bundle of the health check. SCRIPT is sent to the node over one
+ssh session and executed by any python found there. It gets
+{"mounts": [...], "timeout": N} as the only argument and prints JSON:
+
+    {
+      "uname": "Linux",
+      "mount_units": ["-.mount loaded active mounted /", ...],
+      "proc_mounts": ["/", "/home", ...],
+      "stat": {"/home": {"rc": 0, "timed_out": false}, ...}
+    }
+
+Filesystems to stat are the ones from the argument or, if it is empty,
+discovered from mount units, as HealthStatus does. Every mounted one
+is stat'ed in parallel, bounded by the timeout.
+'''
+
+
+import json
+
+from trix_status.utils import ssh_cmd
+
+# mount units every node has, not reported
+STANDARD_MOUNTS = ['-.mount', 'run-user-0.mount']
+
+SCRIPT = r'''
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+args = json.loads(sys.argv[1])
+timeout = args['timeout']
+standard_mounts = args['standard_mounts']
+devnull = open(os.devnull, 'w')
+
+
+def run(cmd):
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=devnull)
+    return proc.communicate()[0].decode('utf-8', 'replace')
+
+
+def stat(fs, result):
+    proc = subprocess.Popen(
+        ['stat', '-t', fs], stdout=devnull, stderr=devnull)
+    started = time.time()
+    while proc.poll() is None and time.time() - started < timeout:
+        time.sleep(0.01)
+    if proc.poll() is None:
+        proc.kill()
+        result[fs] = {'rc': None, 'timed_out': True}
+    else:
+        result[fs] = {'rc': proc.returncode, 'timed_out': False}
+
+
+answer = {'uname': run(['uname']).strip()}
+answer['mount_units'] = [
+    line for line in run(
+        ['systemctl', '--type', 'mount', '--all', '--no-legend']
+    ).split('\n') if line.strip()
+]
+with open('/proc/mounts') as f:
+    answer['proc_mounts'] = [
+        re.sub(
+            r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)),
+            line.split()[1]
+        )
+        for line in f if len(line.split()) > 1
+    ]
+
+mounts = args['mounts']
+if not mounts:
+    for line in answer['mount_units']:
+        line = line.split()
+        if (len(line) > 4 and line[4][0] == '/'
+                and line[0] not in standard_mounts):
+            mounts.append(line[4])
+
+answer['stat'] = {}
+workers = []
+for fs in mounts:
+    if fs not in answer['proc_mounts']:
+        continue
+    worker = threading.Thread(target=stat, args=(fs, answer['stat']))
+    worker.daemon = True
+    worker.start()
+    workers.append(worker)
+for worker in workers:
+    worker.join()
+
+sys.stdout.write(json.dumps(answer))
+'''
+
+# runs SCRIPT from stdin with the first python available on the node
+LAUNCHER = (
+    'for p in python3 python python2; do '
+    + 'command -v $p >/dev/null && exec $p - "$@"; done; exit 127'
+)
+
+
+def probe_cmd(host, mounts, timeout):
+    """
+    Returns command which runs the bundle on the host.
+    SCRIPT should be passed to its stdin
+    """
+    args = json.dumps({
+        'mounts': list(mounts),
+        'timeout': timeout,
+        'standard_mounts': STANDARD_MOUNTS,
+    })
+    return ssh_cmd(host, ['sh', '-c', LAUNCHER, 'probe', args], timeout)
+
+
+def parse(stdout):
+    """
+    Returns dict printed by SCRIPT or None if the answer is broken
+    """
+    try:
+        answer = json.loads(stdout)
+    except ValueError:
+        return None
+    if not isinstance(answer, dict):
+        return None
+    for key in ('uname', 'mount_units', 'proc_mounts', 'stat'):
+        if key not in answer:
+            return None
+    return answer
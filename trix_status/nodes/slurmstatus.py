@@ -16,6 +16,7 @@ along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
 
 
 from trix_status import utils
+from trix_status import ratelimit
 from trix_status.config import category
 from nodestatus import NodeStatus
 
@@ -69,7 +70,8 @@ class SlurmStatus(NodeStatus):
         sinfo -N -o "%N %6T"
         """
         self.statuses = {}
-        cmd = 'sinfo -N -o "%N %6T"'
+        cmd = ['sinfo', '-N', '-o', '%N %6T']
+        ratelimit.wait('slurmctld')
         rc, stdout, _, _ = utils.run_cmd(cmd)
 
         if rc:
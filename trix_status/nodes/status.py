@@ -16,17 +16,31 @@ along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
 
 
 from trix_status import AbstractStatus
+import json
 import logging
-from multiprocessing.pool import ThreadPool
-from multiprocessing import Lock
+import os
+import sys
+from threading import Lock
 
 from trix_status.out import Out
 from trix_status.config import available_checks
-from healthstatus import HealthStatus
+from trix_status.engine import get_engine, Return
+from trix_status import deadline
+from trix_status import ratelimit
+from trix_status import hedging
+from trix_status import latency
+from trix_status import resolver
+from trix_status import rmcp
+from trix_status import sdr
+from trix_status import sel
+from trix_status import redfish
+from healthstatus import HealthStatus, health_config
 from ipmistatus import IPMIStatus
 from slurmstatus import SlurmStatus
 from lunastatus import LunaStatus
 from zabbixstatus import ZabbixStatus
+from delegation import Delegate, get_delegates, LOCAL
+from pipeline import HealthPipeline
 
 
 luna_present = True
@@ -49,7 +63,13 @@ class Status(AbstractStatus):
 
     def __init__(self, args):
 
-        self.nodes = self._get_nodes(args.group, args.hosts)
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+
+        if args.node_list:
+            self.nodes = self._read_node_list(args.node_list, args.hosts)
+        else:
+            self.nodes = self._get_nodes(args.group, args.hosts)
         self.args = args
 
         self.fanout = args.fanout
@@ -57,8 +77,25 @@ class Status(AbstractStatus):
         self.timeout = args.timeout
         self.sorted_output = args.sorted_output
 
-        module_name = self.__module__ + "." + type(self).__name__
-        self.log = logging.getLogger(module_name)
+    def _read_node_list(self, path, nodelist=None):
+        """
+        Nodes in the format of _get_nodes() from JSON file or stdin
+        """
+        try:
+            if path == '-':
+                nodes = json.load(sys.stdin)
+            else:
+                with open(path) as f:
+                    nodes = json.load(f)
+        except (IOError, ValueError) as exc:
+            self.log.error("Unable to read node list: {}".format(exc))
+            return []
+        nodes = [
+            {str(k): v for k, v in node_dict.items()} for node_dict in nodes
+        ]
+        if not nodelist:
+            return nodes
+        return self._filter_nodes(nodes, nodelist)
 
     def _get_nodes(self, group=None, nodelist=None):
 
@@ -107,6 +144,7 @@ class Status(AbstractStatus):
                 node_dict['ipmi_username'] = ipmi_username
                 node_dict['ipmi_password'] = ipmi_password
                 node_dict['hostname'] = node_name
+                node_dict['group'] = group_name
                 if domain:
                     node_dict['hostname'] += "." + domain
                 nodes.append(node_dict)
@@ -114,6 +152,9 @@ class Status(AbstractStatus):
         if not nodelist:
             return nodes
 
+        return self._filter_nodes(nodes, nodelist)
+
+    def _filter_nodes(self, nodes, nodelist):
         nodelist = ",".join(nodelist)
 
         if not hostlist_present:
@@ -147,6 +188,12 @@ class Status(AbstractStatus):
             # otherwise we will read creds files in every thread
             self.zabbix_creds = ZabbixStatus().get_credentials()
 
+        # config is read once, not for every node
+        if 'health' in self.checks:
+            self.health_conf = health_config()
+        if 'ipmi' in self.checks:
+            self.redfish_groups = redfish.groups()
+
 
         self.out = Out(
             max_node_name=max_node_name,
@@ -165,13 +212,70 @@ class Status(AbstractStatus):
             self.out.header()
             self.out.statusbar(update=False)
 
-        self.log.debug('Start thread pool')
-        thread_pool = ThreadPool(processes=self.fanout)
+        self.engine = get_engine(self.args)
         self.lock = Lock()
+        if self.args.adaptive_timeout:
+            latency.enable()
+
+        self.log.debug('Run checks using {} engine'.format(self.args.engine))
+
+        self.delegates = []
+        delegates = {}
+        if self.args.delegate and not self.args.shard:
+            delegates = self.start_delegates()
+        if self.args.processes > 1 and not self.args.shard:
+            delegates.update(self.start_shards(
+                [n for n in self.nodes if n['node'] not in delegates]))
+
+        rows = []
+        jobs = []
+        pipeline = []
+        for node_dict in self.nodes:
+            if node_dict['node'] in delegates:
+                rows.append(delegates[node_dict['node']])
+                continue
+            checks = self.node_checks(node_dict)
+            row = {
+                'node': node_dict['node'],
+                'checks': checks,
+                'answers': [None] * len(checks),
+                'left': len(checks),
+                'expired': False,
+            }
+            rows.append(row)
+            if not checks:
+                self.node_done(row)
+            for i, (name, check) in enumerate(checks):
+                if name == 'health' and self.args.pipeline:
+                    pipeline.append((row, i, check))
+                    continue
+                jobs.append((name, self.check_worker, (row, i, check)))
+        if pipeline:
+            jobs.append(
+                ('health pipeline', self.pipeline_worker, (pipeline, )))
 
-        self.log.debug('Map main workers to threads')
-
-        workers_return = thread_pool.map(self.main_worker, self.nodes)
+        if 'ipmi' in self.checks:
+            # all BMCs are pinged from one socket before checks start
+            rmcp.get_pinger().sweep([
+                (check.ip, check.probe_timeout('bmc_udp'))
+                for row in rows for name, check in row['checks']
+                if isinstance(check, IPMIStatus) and check.backend == 'ipmi'
+                and check.ip and check.username and check.password
+            ])
+
+        self.engine.run_all(jobs)
+        self.join_delegates(delegates)
+        self.expire_rows(rows)
+        latency.save()
+        resolver.save()
+        sdr.save()
+        sel.save()
+        if ratelimit.get_buckets():
+            self.log.debug("Rate limits: {}".format(ratelimit.summary()))
+        if hedging.enabled():
+            self.log.debug("Hedged probes: {}".format(hedging.summary()))
+
+        workers_return = [(row['node'], row['answers']) for row in rows]
         self.log.debug('Retuned from workers: {}'.format(workers_return))
 
         if self.sorted_output:
@@ -183,47 +287,144 @@ class Status(AbstractStatus):
         self.out.separator()
         return True
 
-    def main_worker(self, node_dict):
+    def start_delegates(self):
+        """
+        Start delegates for nodes of the groups they are configured for.
+        Returns dict of node name: row, filled by delegates
+        """
+        by_group = get_delegates()
+        nodes_by_host = {}
+        for node_dict in self.nodes:
+            host = by_group.get(node_dict.get('group'))
+            if host is not None:
+                nodes_by_host.setdefault(host, []).append(node_dict)
+
+        rows = {}
+        for host, nodes in sorted(nodes_by_host.items()):
+            rows.update(self.start_delegate(host, nodes))
+        return rows
+
+    def start_shards(self, nodes):
+        """
+        Split nodes between '--processes' worker processes, every one
+        runs this script with its own fanout. Returns rows like
+        start_delegates()
+        """
+        processes = min(self.args.processes, len(nodes))
+        command = [sys.executable, os.path.abspath(sys.argv[0]), '--shard']
+        rows = {}
+        for i in range(processes):
+            rows.update(self.start_delegate(
+                LOCAL, nodes[i::processes], command=command,
+                name="shard-{}".format(i)
+            ))
+        return rows
+
+    def start_delegate(self, host, nodes, command=None, name=None):
+        rows = {}
+        for node_dict in nodes:
+            rows[node_dict['node']] = {
+                'node': node_dict['node'],
+                # only names are needed for the rows of delegates
+                'checks': [(check, None) for check in self.args.checks],
+                'answers': [None] * len(self.args.checks),
+                'left': len(self.args.checks),
+                'expired': False,
+            }
+        delegate = Delegate(
+            host, nodes, self.args,
+            on_answer=(
+                lambda node, answers:
+                self.delegated_answer(rows, node, answers)
+            ),
+            command=command, name=name
+        )
+        delegate.rows = rows
+        delegate.start()
+        self.delegates.append(delegate)
+        return rows
+
+    def delegated_answer(self, rows, node, answers):
+        row = rows.get(node)
+        if row is None or len(answers) != len(row['answers']):
+            self.log.debug(
+                "Unexpected answer for '{}': {}".format(node, answers))
+            return
+        with self.lock:
+            if row['expired'] or row['left'] == 0:
+                return
+            row['answers'] = answers
+            row['left'] = 0
+        self.node_done(row)
+
+    def join_delegates(self, rows):
+        """
+        Wait for delegates, nodes they did not report are UNKN
+        """
+        if not rows:
+            return
+        for delegate in self.delegates:
+            delegate.join()
+            for row in delegate.rows.values():
+                with self.lock:
+                    if row['expired'] or row['left'] == 0:
+                        continue
+                    row['answers'] = [
+                        delegate.missing_answer(name)
+                        for name, _ in row['checks']
+                    ]
+                    row['left'] = 0
+                self.node_done(row)
+
+    def node_checks(self, node_dict):
         self.log.debug(
-            "Starting worker thread for dict '{}'".format(node_dict))
+            "Creating checks for dict '{}'".format(node_dict))
 
         checks = []
         node = node_dict['node']
 
         if 'health' in self.checks:
 
-            checks.append(
+            checks.append((
+                'health',
                 HealthStatus(
                     node=node,
-                    timeout=self.timeout
+                    timeout=self.timeout,
+                    ip=node_dict.get('BOOTIF'),
+                    conf=self.health_conf
                 )
-            )
+            ))
 
         if 'ipmi' in self.checks:
 
-            checks.append(
+            checks.append((
+                'ipmi',
                 IPMIStatus(
                     node=node,
                     ip=node_dict['BMC'],
                     username=node_dict['ipmi_username'],
                     password=node_dict['ipmi_password'],
-                    timeout=self.timeout
+                    timeout=self.timeout,
+                    backend=redfish.backend(
+                        node_dict.get('group'), self.redfish_groups)
                 )
-            )
+            ))
 
         if 'slurm' in self.checks:
-            checks.append(
+            checks.append((
+                'slurm',
                 SlurmStatus(
                     node=node,
                     statuses=self.sinfo
                 )
-            )
+            ))
 
         if 'luna' in self.checks:
-            checks.append(LunaStatus(node=node))
+            checks.append(('luna', LunaStatus(node=node)))
 
         if 'zabbix' in self.checks:
-            checks.append(
+            checks.append((
+                'zabbix',
                 ZabbixStatus(
                     node=node,
                     hostname=node_dict['hostname'],
@@ -231,22 +432,68 @@ class Status(AbstractStatus):
                     username=self.zabbix_creds[0],
                     password=self.zabbix_creds[1]
                 )
-            )
+            ))
 
-        thread_pool = ThreadPool(processes=5)
-        self.log.debug('{}:Map check workers to threads'.format(node))
-        workers_return = thread_pool.map(self.check_worker, checks)
+        return checks
+
+    def node_done(self, row):
         self.log.debug(
-            '{}:Retuned from check workers: {}'.format(node, workers_return))
+            '{}:Retuned from check workers: {}'.format(
+                row['node'], row['answers']))
 
         with self.lock:
             if not self.sorted_output:
-                self.out.line(node, workers_return)
-                self.out.statusbar()
-            else:
-                self.out.statusbar()
+                self.out.line(row['node'], row['answers'])
+            self.out.statusbar()
+
+    def expire_rows(self, rows):
+        """
+        Fill answers of the checks interrupted by deadline
+        """
+        expired = []
+        with self.lock:
+            for row in rows:
+                if row['left'] == 0:
+                    continue
+                row['expired'] = True
+                for i, (name, check) in enumerate(row['checks']):
+                    if row['answers'][i] is None:
+                        row['answers'][i] = deadline.timeout_answer(
+                            name, getattr(check, 'answer', None))
+                expired.append(row)
+        if expired:
+            self.log.debug(
+                "{} nodes did not finish before deadline".format(len(expired))
+            )
+        for row in expired:
+            self.node_done(row)
 
-        return (node, workers_return)
+    def check_worker(self, row, i, check):
+        answer = yield check.status_coro()
+        self.check_done(row, i, answer)
+        raise Return(answer)
 
-    def check_worker(self, check):
-        return check.status()
+    def pipeline_worker(self, entries):
+        """
+        Health checks of all nodes as one HealthPipeline,
+        entries are (row, index, check)
+        """
+        places = {check: (row, i) for row, i, check in entries}
+
+        def on_answer(check):
+            row, i = places[check]
+            self.check_done(row, i, check.answer)
+
+        yield HealthPipeline(
+            [check for row, i, check in entries], on_answer).run()
+
+    def check_done(self, row, i, answer):
+        with self.lock:
+            if row['expired']:
+                # row is already printed with TIMEOUT answers
+                return
+            row['answers'][i] = answer
+            row['left'] -= 1
+            last = row['left'] == 0
+        if last:
+            self.node_done(row)
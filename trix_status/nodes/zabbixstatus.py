@@ -17,6 +17,8 @@ along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
 from trix_status.config import category
 from nodestatus import NodeStatus
 from trix_status.utils import get_config
+from trix_status.breaker import get_breaker
+from trix_status.engine import HTTPPost, Call, Throttle, Return, run_sync
 import os
 import logging
 import json
@@ -110,50 +112,65 @@ class ZabbixStatus(NodeStatus):
 
     def get_sabbix_url(self):
         errors = []
-        servers, https_err = self.get_https_zabbix_hosts()
+        servers, https_err = yield Call(self.get_https_zabbix_hosts)
         if https_err:
-            errors.append(errors)
+            errors.append(https_err)
         servers.append("http://localhost")
         doc = "/zabbix/api_jsonrpc.php"
         possible_urls = [u + doc for u in servers if u is not None]
         valid_urls = []
         for url in possible_urls:
             try:
-                req = urllib2.Request(url)
-                req.add_header('Content-Type', 'application/json')
-                r = next(urllib2.urlopen(
-                    req, json.dumps({}), timeout=self.timeout))
+                yield Throttle('zabbix')
+                r = yield HTTPPost(
+                    url, json.dumps({}),
+                    {'Content-Type': 'application/json'},
+                    timeout=self.timeout
+                )
                 r = json.loads(r)
                 valid_urls.append(url)
             except Exception as exc:
                 errors.append(str(exc))
         if len(valid_urls) == 0:
-            return None, "|".join(errors)
-        return valid_urls[0], ""
+            raise Return((None, "|".join(errors)))
+        raise Return((valid_urls[0], ""))
 
 
     def _do_request(self, j):
         err = ""
+        api = get_breaker('Zabbix API')
+        if not api.allow():
+            raise Return((False, api.reason()))
         if self.z_url is None:
-            self.z_url, err = self.get_sabbix_url()
+            self.z_url, err = yield self.get_sabbix_url()
         if self.z_url is None:
-            return False, err
+            api.failure(err)
+            raise Return((False, err))
         else:
             conf = {'url': self.z_url}
         if 'method' in j:
             method = j['method']
         else:
             method = j
+        exc_msg = None
         try:
             self.tagged_log_debug("Talking to zabbix API")
-            req = urllib2.Request(self.z_url)
-            req.add_header('Content-Type', 'application/json')
-            r = next(urllib2.urlopen(
-                req, json.dumps(j), timeout=self.timeout))
+            yield Throttle('zabbix')
+            r = yield HTTPPost(
+                self.z_url, json.dumps(j),
+                {'Content-Type': 'application/json'},
+                timeout=self.timeout
+            )
             r = json.loads(r)
         except Exception as exc:
             self.tagged_log_debug(exc)
-            return False, str(exc)
+            exc_msg = str(exc)
+
+        if exc_msg is not None:
+            api.failure(exc_msg)
+            raise Return((False, exc_msg))
+
+        api.success()
 
         if not r:
             msg = (
@@ -161,7 +178,7 @@ class ZabbixStatus(NodeStatus):
                 '{}: {}'.format(method, str(r))
             )
             self.tagged_log_debug(msg)
-            return False, msg
+            raise Return((False, msg))
 
         if not 'result' in r:
             msg = (
@@ -169,18 +186,18 @@ class ZabbixStatus(NodeStatus):
                 '{}: {}'.format(method, str(r))
             )
             self.log.debug(msg)
-            return False, msg
+            raise Return((False, msg))
 
-        return r['result'], ""
+        raise Return((r['result'], ""))
 
     def do_request(self, j):
         if self.answer:
             self.answer['history'].append(j['method'])
-        data, details = self._do_request(j)
+        data, details = yield self._do_request(j)
         if details and self.answer:
             self.answer['details'] += " |{}: ".format(j['method'])
             self.answer['details'] += details
-        return data
+        raise Return(data)
 
     def get_token(self):
         j = {
@@ -193,7 +210,8 @@ class ZabbixStatus(NodeStatus):
                 'password': self.password
             }
         }
-        return self.do_request(j)
+        answer = yield self.do_request(j)
+        raise Return(answer)
 
     def get_hostid(self, token):
         j = {
@@ -209,25 +227,25 @@ class ZabbixStatus(NodeStatus):
                 }
             }
         }
-        z_answer = self.do_request(j)
+        z_answer = yield self.do_request(j)
         if not z_answer:
             self.answer['details'] = (
                 "Zabbix did not return hostid for this host"
             )
-            return False
+            raise Return(False)
         latest_record = max(z_answer, key=lambda x: x['hostid'])
         self.answer['details'] = latest_record['error']
-        return latest_record['hostid']
+        raise Return(latest_record['hostid'])
 
     def get_most_important_event(self, token, hostid=None):
-        triggers = self.get_triggers(token, hostid)
+        triggers = yield self.get_triggers(token, hostid)
         if len(triggers) == 0:
-            return -1
+            raise Return(-1)
         self.tagged_log_debug("Triggers for node: {}".format(triggers))
         self.answer["details"] = " / ".join(
             [e["description"] for e in triggers]
         )
-        return int(triggers[0]["priority"])
+        raise Return(int(triggers[0]["priority"]))
 
     def get_triggers(self, token, hostid=None):
         j = {
@@ -248,10 +266,10 @@ class ZabbixStatus(NodeStatus):
         if hostid is not None:
             j['params']['hostids'] = hostid
 
-        z_answer = self.do_request(j)
+        z_answer = yield self.do_request(j)
 
         if not z_answer:
-            return []  # no events
+            raise Return([])  # no events
 
         self.tagged_log_debug("Problems for node: {}".format(z_answer))
         objectsids = [e['objectid'] for e in z_answer]
@@ -274,10 +292,10 @@ class ZabbixStatus(NodeStatus):
         if hostid is not None:
             j['params']['hostids'] = hostid
 
-        z_answer = self.do_request(j)
-        return z_answer
+        z_answer = yield self.do_request(j)
+        raise Return(z_answer)
 
-    def status(self):
+    def status_coro(self):
         self.answer = {
             'column': 'zabbix',
             'status': 'UNKN',
@@ -288,39 +306,43 @@ class ZabbixStatus(NodeStatus):
         }
 
         if self.node is None:
-            return self.answer
+            raise Return(self.answer)
 
         if self.username is None or self.username is None:
             self.username, self.password = self.get_credentials()
 
-        token = self.get_token()
+        token = yield self.get_token()
         if not token:
             self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+            raise Return(self.answer)
 
-        hostid = self.get_hostid(token)
+        hostid = yield self.get_hostid(token)
         if not hostid:
             self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+            raise Return(self.answer)
 
-        max_event_priority = self.get_most_important_event(token, hostid)
+        max_event_priority = yield self.get_most_important_event(
+            token, hostid)
 
         if max_event_priority > 2:
             self.answer["category"] = category.ERROR
             self.answer["status"] = "ERR"
-            return self.answer
+            raise Return(self.answer)
 
         if max_event_priority > 1:
             self.answer["category"] = category.WARN
             self.answer["status"] = "WARN"
-            return self.answer
+            raise Return(self.answer)
 
         self.answer["category"] = category.GOOD
         self.answer["status"] = "OK"
 
-        return self.answer
+        raise Return(self.answer)
 
     def get_cluster_events(self):
+        return run_sync(self.cluster_events_coro())
+
+    def cluster_events_coro(self):
         self.answer = {
             'column': 'zabbix',
             'status': 'UNKN',
@@ -333,13 +355,13 @@ class ZabbixStatus(NodeStatus):
         if self.username is None or self.username is None:
             self.username, self.password = self.get_credentials()
 
-        token = self.get_token()
+        token = yield self.get_token()
         if not token:
             self.answer['info'] = self.answer['history'][-1]
-            return self.answer
+            raise Return(self.answer)
 
         triggers = []
-        for event in self.get_triggers(token):
+        for event in (yield self.get_triggers(token)):
             for host in event['hosts']:
                 triggers.append({
                     'priority': int(event['priority']),
@@ -406,19 +428,22 @@ class ZabbixStatus(NodeStatus):
 
         triggers.sort(key=lambda x: x['priority'])
 
-        return self.answer
+        raise Return(self.answer)
 
     def get_all_events(self):
+        return run_sync(self.all_events_coro())
+
+    def all_events_coro(self):
         if self.username is None or self.username is None:
             self.username, self.password = self.get_credentials()
 
-        token = self.get_token()
+        token = yield self.get_token()
         if not token:
             self.log.error("Unable to get auth token")
-            return None
+            raise Return(None)
 
         triggers = []
-        for event in self.get_triggers(token):
+        for event in (yield self.get_triggers(token)):
             for host in event['hosts']:
                 triggers.append({
                     'priority': int(event['priority']),
@@ -426,5 +451,5 @@ class ZabbixStatus(NodeStatus):
                     'description': event['description']
                 })
 
-        return triggers
+        raise Return(triggers)
 
@@ -15,6 +15,7 @@ along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
 
+import json
 import logging
 import sys
 import config
@@ -30,7 +31,13 @@ class Out(object):
                  index_col='', columns=[], spaces=4):
         module_name = self.__module__ + "." + type(self).__name__
         self.log = logging.getLogger(module_name)
-        self.screen_width = int(os.popen('stty size', 'r').read().split()[1])
+        self.machine = getattr(args, 'json', False)
+        try:
+            self.screen_width = int(
+                os.popen('stty size', 'r').read().split()[1])
+        except (IndexError, ValueError):
+            # not a terminal, e.g. running on a delegate
+            self.screen_width = 80
 
         self.max_node_name = max_node_name
         self.status_col = args.status_column
@@ -119,10 +126,12 @@ class Out(object):
         return min_len
 
     def separator(self):
-        if self.table:
+        if self.table and not self.machine:
             print(self.sep)
 
     def header(self):
+        if self.machine:
+            return
         self.separator()
         first_col = self.index_col
         out = self.col_sep + " " * self.spaces
@@ -148,6 +157,9 @@ class Out(object):
         self.separator()
 
     def line(self, node, json):
+        if self.machine:
+            return self.machine_line(node, json)
+
         fields = {}
 
         column_keys = [e['key'] for e in self.column_names]
@@ -246,8 +258,13 @@ class Out(object):
         if not skip:
             print(out)
 
+    def machine_line(self, node, answers):
+        sys.stdout.write(
+            json.dumps({'node': node, 'answers': answers}) + "\n")
+        sys.stdout.flush()
+
     def statusbar(self, update=True):
-        if self.no_statusbar:
+        if self.no_statusbar or self.machine:
             return
         width = len(self.sep) - 12
 
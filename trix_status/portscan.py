@@ -0,0 +1,138 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+TCP port scanner. Non-blocking connects to all targets are driven by
+one reactor in its own thread, with optional read of the banner on the
+same connection (see Reactor.scan). Used by the health check for the
+ssh port:
+
+    health:
+      ssh_banner: false   # port is open only if sshd sends its banner
+'''
+
+
+import errno
+import logging
+import threading
+
+from trix_status.reactor import Reactor
+from trix_status.fanout import fd_limit
+from trix_status import resolver
+
+_scanner = None
+_scanner_lock = threading.Lock()
+
+
+class Scanner(object):
+    """
+    'max_connections' is the limit of scan_all() connections
+    open at the same time
+    """
+
+    def __init__(self, max_connections=1024):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.max_connections = max(1, int(max_connections))
+        self.reactor = Reactor()
+        self.thread = threading.Thread(
+            target=self.reactor.run_forever, name="trix-status-scanner")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _start(self, host, port, timeout, banner, callback):
+        addr, error = resolver.get_resolver().lookup(host)
+        if addr is None:
+            callback((errno.EHOSTUNREACH, None))
+            return
+
+        def start():
+            future = self.reactor.scan(
+                host, port, timeout, banner, addr=(addr, port))
+            future.add_done_callback(lambda f: callback(
+                f.result if f.exception is None else (errno.EIO, None)))
+
+        self.reactor.call_soon_threadsafe(start)
+
+    def scan(self, host, port, timeout, banner=False):
+        """
+        Returns (rc, banner line), rc is 0 or errno of connect()
+        """
+        done = threading.Event()
+        result = []
+
+        def callback(answer):
+            result.append(answer)
+            done.set()
+
+        self._start(host, port, timeout, banner, callback)
+        # wait with timeout, otherwise KeyboardInterrupt is not delivered
+        while not done.wait(1):
+            pass
+        return result[0]
+
+    def scan_all(self, targets, port, banner=False):
+        """
+        Scan the port on all (host, timeout) targets at once.
+        Returns list of (rc, banner line) in the same order
+        """
+        results = [None] * len(targets)
+        slots = threading.Semaphore(self.max_connections)
+        left = [len(targets)]
+        done = threading.Event()
+        lock = threading.Lock()
+
+        def callback(i, answer):
+            results[i] = answer
+            slots.release()
+            with lock:
+                left[0] -= 1
+                if left[0] == 0:
+                    done.set()
+
+        resolver.get_resolver().lookup_all([host for host, _ in targets])
+        for i, (host, timeout) in enumerate(targets):
+            slots.acquire()
+            self._start(
+                host, port, timeout, banner,
+                lambda answer, i=i: callback(i, answer)
+            )
+        while targets and not done.wait(1):
+            pass
+        self.log.debug("Scanned port {} on {} hosts, {} open".format(
+            port, len(targets), len([r for r in results if r[0] == 0])))
+        return results
+
+    def close(self):
+        self.reactor.stop()
+        self.thread.join(1)
+
+
+def get_scanner():
+    global _scanner
+    with _scanner_lock:
+        if _scanner is None:
+            # connections share open files limit with the checks
+            _scanner = Scanner(fd_limit(4096))
+        return _scanner
+
+
+def shutdown():
+    global _scanner
+    with _scanner_lock:
+        if _scanner is not None:
+            _scanner.close()
+        _scanner = None
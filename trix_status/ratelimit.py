@@ -0,0 +1,127 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Token-bucket rate limits for backends shared by all checks
+(Zabbix API, DNS, BMC network, slurmctld), declared in the
+'ratelimit' section of the config:
+
+    ratelimit:
+      zabbix:
+        rate: 20    # requests per second
+        burst: 5    # requests allowed at once
+
+Coroutines yield engine.Throttle(name) before they touch the backend,
+blocking code calls wait(name).
+'''
+
+
+import logging
+import threading
+import time
+
+from trix_status import deadline
+from trix_status import utils
+
+log = logging.getLogger(__name__)
+
+# known backends, configured limits for other names are ignored
+BACKENDS = ['zabbix', 'dns', 'bmc', 'slurmctld']
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """
+    'rate' tokens per second are added up to 'burst'.
+    reserve() takes a token in advance and returns how long the caller
+    should wait for it, so waiters are served in order
+    """
+
+    def __init__(self, name, rate, burst=1):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.name = name
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+
+    def reserve(self):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            delay = -self.tokens / self.rate
+            self.waited += delay
+            return delay
+
+
+def get_buckets():
+    """
+    Returns dict of buckets configured in the 'ratelimit' section
+    """
+    global _buckets
+    with _buckets_lock:
+        if _buckets is None:
+            _buckets = {}
+            conf = utils.get_config('ratelimit', {
+                name: None for name in BACKENDS
+            })
+            for name in BACKENDS:
+                limit = conf.get(name) or {}
+                if not limit.get('rate'):
+                    continue
+                _buckets[name] = TokenBucket(
+                    name, limit['rate'], limit.get('burst', 1))
+                log.debug(
+                    "Rate limit for {}: {}/s, burst {}".format(
+                        name, limit['rate'], limit.get('burst', 1))
+                )
+        return _buckets
+
+
+def reserve(name):
+    """
+    Seconds to wait before using backend 'name'
+    """
+    bucket = get_buckets().get(name)
+    if bucket is None:
+        return 0.0
+    return bucket.reserve()
+
+
+def wait(name):
+    """
+    Blocking version of engine.Throttle
+    """
+    delay = deadline.clamp(reserve(name))
+    if delay > 0:
+        time.sleep(delay)
+
+
+def summary():
+    return ", ".join(
+        "{} waited {:.1f}s".format(name, bucket.waited)
+        for name, bucket in sorted(get_buckets().items())
+    )
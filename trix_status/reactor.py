@@ -0,0 +1,625 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import errno
+import fcntl
+import heapq
+import logging
+import os
+import select
+import socket
+import ssl
+import subprocess as sp
+import threading
+import time
+import urlparse
+from collections import deque, namedtuple
+
+
+# banner is one line, servers send it right after accept
+MAX_BANNER = 256
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Future(object):
+    """
+    Result of an operation running on the reactor.
+    Callbacks are called with the future as the only argument
+    """
+
+    def __init__(self):
+        self.done = False
+        self.result = None
+        self.exception = None
+        self.callbacks = []
+        self.cancel_callbacks = []
+
+    def add_done_callback(self, callback):
+        if self.done:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def add_cancel_callback(self, callback):
+        self.cancel_callbacks.append(callback)
+
+    def _finish(self):
+        self.done = True
+        callbacks, self.callbacks = self.callbacks, []
+        self.cancel_callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+    def set_result(self, result):
+        if self.done:
+            return
+        self.result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        if self.done:
+            return
+        self.exception = exception
+        self._finish()
+
+    def cancel(self):
+        if self.done:
+            return
+        for callback in self.cancel_callbacks:
+            callback()
+        self.set_exception(Cancelled())
+
+
+class CommandResult(namedtuple(
+        'CommandResult', ['rc', 'stdout', 'stderr', 'exception'])):
+    """
+    Can be unpacked as (rc, stdout, stderr, exception) tuple.
+    Also has 'wall_time' and 'timed_out' attributes
+    """
+    wall_time = 0.0
+    timed_out = False
+
+
+class Timer(object):
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def _set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+class Reactor(object):
+    """
+    poll() based event loop. Everything but call_soon_threadsafe()
+    should be called from the thread running the loop
+    """
+
+    def __init__(self):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.poller = select.poll()
+        self.readers = {}
+        self.writers = {}
+        self.timers = []
+        self.timer_seq = 0
+        self.ready = deque()
+        self.lock = threading.Lock()
+        self.stopped = False
+        # called in the child before exec of run_process() commands
+        self.preexec_fn = None
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        _set_nonblocking(self.wakeup_r)
+        _set_nonblocking(self.wakeup_w)
+        self.add_reader(self.wakeup_r, self._drain_wakeup)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self.wakeup_r, 4096):
+                pass
+        except OSError:
+            pass
+
+    def _update(self, fd):
+        mask = 0
+        if fd in self.readers:
+            mask |= select.POLLIN | select.POLLPRI
+        if fd in self.writers:
+            mask |= select.POLLOUT
+        if mask:
+            self.poller.register(fd, mask)
+        else:
+            try:
+                self.poller.unregister(fd)
+            except KeyError:
+                pass
+
+    def add_reader(self, fd, callback):
+        self.readers[fd] = callback
+        self._update(fd)
+
+    def remove_reader(self, fd):
+        self.readers.pop(fd, None)
+        self._update(fd)
+
+    def add_writer(self, fd, callback):
+        self.writers[fd] = callback
+        self._update(fd)
+
+    def remove_writer(self, fd):
+        self.writers.pop(fd, None)
+        self._update(fd)
+
+    def call_soon(self, callback, *args):
+        self.ready.append((callback, args))
+
+    def call_soon_threadsafe(self, callback, *args):
+        with self.lock:
+            self.ready.append((callback, args))
+        try:
+            os.write(self.wakeup_w, 'x')
+        except OSError:
+            pass
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(time.time() + delay, callback, args)
+        self.timer_seq += 1
+        heapq.heappush(self.timers, (timer.when, self.timer_seq, timer))
+        return timer
+
+    def _run_callback(self, callback, args):
+        try:
+            callback(*args)
+        except Exception:
+            self.log.exception("Exception in reactor callback")
+
+    def run_once(self, timeout=None):
+        if self.ready:
+            timeout = 0
+        elif self.timers:
+            delay = max(0, self.timers[0][0] - time.time())
+            if timeout is None or delay < timeout:
+                timeout = delay
+
+        if timeout is not None:
+            timeout = int(timeout * 1000)
+        try:
+            events = self.poller.poll(timeout)
+        except select.error as exc:
+            if exc.args[0] != errno.EINTR:
+                raise
+            events = []
+
+        for fd, mask in events:
+            if mask & (select.POLLIN | select.POLLPRI | select.POLLHUP
+                       | select.POLLERR | select.POLLNVAL):
+                if fd in self.readers:
+                    self._run_callback(self.readers[fd], ())
+            if mask & (select.POLLOUT | select.POLLHUP
+                       | select.POLLERR | select.POLLNVAL):
+                if fd in self.writers:
+                    self._run_callback(self.writers[fd], ())
+
+        now = time.time()
+        while self.timers and self.timers[0][0] <= now:
+            when, seq, timer = heapq.heappop(self.timers)
+            if not timer.cancelled:
+                self._run_callback(timer.callback, timer.args)
+
+        with self.lock:
+            ready, self.ready = self.ready, deque()
+        for callback, args in ready:
+            self._run_callback(callback, args)
+
+    def run_until_complete(self, future):
+        while not future.done:
+            self.run_once(timeout=1)
+        return future
+
+    def run_forever(self):
+        self.stopped = False
+        while not self.stopped:
+            self.run_once(timeout=1)
+
+    def stop(self):
+        self.stopped = True
+        self.call_soon_threadsafe(lambda: None)
+
+    # operations
+
+    def run_process(self, cmd, timeout=30, input=None):
+        """
+        Future's result is CommandResult.
+        List is executed directly, string is passed to /bin/sh
+        """
+        future = Future()
+        started = time.time()
+        try:
+            proc = sp.Popen(
+                cmd, shell=isinstance(cmd, basestring),
+                stdin=sp.PIPE,
+                stdout=sp.PIPE, stderr=sp.PIPE, close_fds=True,
+                preexec_fn=self.preexec_fn
+            )
+        except Exception as exc:
+            future.set_result(CommandResult(255, "", "", exc))
+            return future
+
+        stdout_fd, stderr_fd = proc.stdout.fileno(), proc.stderr.fileno()
+        output = {stdout_fd: [], stderr_fd: []}
+        pipes = {stdout_fd: proc.stdout, stderr_fd: proc.stderr}
+        state = {'input': input, 'killed': False}
+
+        def kill():
+            if state['killed']:
+                return
+            state['killed'] = True
+            try:
+                proc.kill()
+            except OSError:
+                pass
+            # grandchildren can keep pipes open
+            self.call_later(1, abandon)
+
+        def abandon():
+            for fd in pipes.keys():
+                self.remove_reader(fd)
+                pipes.pop(fd).close()
+            close_stdin()
+            reap()
+
+        def reap():
+            if proc.poll() is None:
+                self.call_later(0.01, reap)
+                return
+            timer.cancel()
+            result = CommandResult(
+                proc.returncode,
+                "".join(output[stdout_fd]),
+                "".join(output[stderr_fd]),
+                ""
+            )
+            result.wall_time = time.time() - started
+            result.timed_out = state['killed']
+            self.log.debug(
+                "'{}' rc = {}, wall time = {:.3f}s".format(
+                    cmd, result.rc, result.wall_time)
+            )
+            future.set_result(result)
+
+        def make_reader(fd):
+            def read():
+                try:
+                    data = os.read(fd, 65536)
+                except OSError as exc:
+                    if exc.errno == errno.EAGAIN:
+                        return
+                    data = ""
+                if data:
+                    output[fd].append(data)
+                    return
+                self.remove_reader(fd)
+                pipes.pop(fd).close()
+                if not pipes:
+                    reap()
+            return read
+
+        def close_stdin():
+            if not proc.stdin.closed:
+                self.remove_writer(proc.stdin.fileno())
+                proc.stdin.close()
+
+        def write():
+            try:
+                sent = os.write(proc.stdin.fileno(), state['input'])
+            except OSError as exc:
+                if exc.errno == errno.EAGAIN:
+                    return
+                sent = len(state['input'])
+            state['input'] = state['input'][sent:]
+            if not state['input']:
+                close_stdin()
+
+        for fd in pipes:
+            _set_nonblocking(fd)
+            self.add_reader(fd, make_reader(fd))
+
+        if state['input']:
+            _set_nonblocking(proc.stdin.fileno())
+            self.add_writer(proc.stdin.fileno(), write)
+        else:
+            close_stdin()
+
+        timer = self.call_later(timeout, kill)
+        future.add_cancel_callback(kill)
+        return future
+
+    def _resolve(self, host, port, sock_type):
+        # name resolution is blocking, so it is up to the caller
+        # to pass IP or run it in a thread
+        infos = socket.getaddrinfo(host, port, socket.AF_INET, sock_type)
+        return infos[0][4]
+
+    def connect(self, host, port, timeout=10, addr=None):
+        """
+        Future's result is connected non-blocking socket
+        or errno from connect() if connection failed
+        """
+        future = Future()
+        try:
+            if addr is None:
+                addr = self._resolve(host, port, socket.SOCK_STREAM)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(0)
+            rc = sock.connect_ex(addr)
+        except socket.error as exc:
+            future.set_result(exc.args[0] or errno.EHOSTUNREACH)
+            return future
+        if rc == 0:
+            future.set_result(sock)
+            return future
+        if rc not in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            future.set_result(rc)
+            return future
+
+        def connected():
+            self.remove_writer(sock.fileno())
+            timer.cancel()
+            rc = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if rc:
+                sock.close()
+                future.set_result(rc)
+            else:
+                future.set_result(sock)
+
+        def expired():
+            self.remove_writer(sock.fileno())
+            sock.close()
+            future.set_result(errno.ETIMEDOUT)
+
+        def cancel():
+            timer.cancel()
+            self.remove_writer(sock.fileno())
+            sock.close()
+
+        self.add_writer(sock.fileno(), connected)
+        timer = self.call_later(timeout, expired)
+        future.add_cancel_callback(cancel)
+        return future
+
+    def scan(self, host, port, timeout=10, banner=False, addr=None):
+        """
+        Connect and, with 'banner', read the first line the server
+        sends on the same connection. Future's result is (rc, line),
+        line is None if it was not requested or nothing came in time
+        """
+        future = Future()
+        started = time.time()
+        connecting = self.connect(host, port, timeout, addr=addr)
+        future.add_cancel_callback(connecting.cancel)
+
+        def connected(f):
+            sock = f.result
+            if isinstance(sock, int):
+                future.set_result((sock, None))
+                return
+            if not banner:
+                sock.close()
+                future.set_result((0, None))
+                return
+
+            fd = sock.fileno()
+            data = []
+
+            def close():
+                timer.cancel()
+                self.remove_reader(fd)
+                sock.close()
+
+            def finish():
+                close()
+                line = ''.join(data).split('\n')[0].strip()
+                future.set_result((0, line or None))
+
+            def received():
+                try:
+                    chunk = sock.recv(MAX_BANNER)
+                except socket.error as exc:
+                    if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        return
+                    chunk = ''
+                data.append(chunk)
+                text = ''.join(data)
+                if not chunk or '\n' in text or len(text) >= MAX_BANNER:
+                    finish()
+
+            self.add_reader(fd, received)
+            timer = self.call_later(
+                max(0, timeout - (time.time() - started)), finish)
+            future.add_cancel_callback(close)
+
+        connecting.add_done_callback(connected)
+        return future
+
+    def datagram(self, host, port, payload, timeout=10, addr=None):
+        """
+        Send UDP datagram and wait for one reply.
+        Future's result is reply or None
+        """
+        future = Future()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(0)
+        try:
+            if addr is None:
+                addr = self._resolve(host, port, socket.SOCK_DGRAM)
+            sock.sendto(payload, addr)
+        except socket.error:
+            sock.close()
+            future.set_result(None)
+            return future
+
+        def finish(data):
+            self.remove_reader(sock.fileno())
+            timer.cancel()
+            sock.close()
+            future.set_result(data)
+
+        def received():
+            try:
+                data, _ = sock.recvfrom(65536)
+            except socket.error as exc:
+                if exc.args[0] == errno.EAGAIN:
+                    return
+                data = None
+            finish(data)
+
+        self.add_reader(sock.fileno(), received)
+        timer = self.call_later(timeout, finish, None)
+        future.add_cancel_callback(lambda: finish(None))
+        return future
+
+    def http_post(self, url, body, headers=None, timeout=10, addr=None):
+        """
+        Minimal HTTP/1.0 client. Future's result is response body.
+        IOError is set as exception on failures and non-2xx codes
+        """
+        future = Future()
+        parsed = urlparse.urlparse(url)
+        https = parsed.scheme == 'https'
+        host = parsed.hostname
+        port = parsed.port or (443 if https else 80)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        request = "POST {} HTTP/1.0\r\nHost: {}\r\n".format(path, host)
+        request += "Content-Length: {}\r\n".format(len(body))
+        for k, v in (headers or {}).items():
+            request += "{}: {}\r\n".format(k, v)
+        request += "Connection: close\r\n\r\n" + body
+
+        state = {'sock': None, 'out': request, 'in': []}
+        deadline = self.call_later(
+            timeout, lambda: fail(IOError("timed out")))
+
+        def close():
+            sock = state['sock']
+            if sock is None:
+                return
+            self.remove_reader(sock.fileno())
+            self.remove_writer(sock.fileno())
+            sock.close()
+            state['sock'] = None
+
+        def fail(exc):
+            close()
+            deadline.cancel()
+            future.set_exception(exc)
+
+        def wait_for(want_read):
+            fd = state['sock'].fileno()
+            if want_read:
+                self.remove_writer(fd)
+                self.add_reader(fd, step)
+            else:
+                self.remove_reader(fd)
+                self.add_writer(fd, step)
+
+        def done():
+            close()
+            deadline.cancel()
+            response = "".join(state['in'])
+            head, _, content = response.partition("\r\n\r\n")
+            status_line = head.split("\r\n")[0].split(" ", 2)
+            try:
+                code = int(status_line[1])
+            except (IndexError, ValueError):
+                future.set_exception(IOError("Malformed HTTP answer"))
+                return
+            if code < 200 or code > 299:
+                future.set_exception(IOError("HTTP Error {}: {}".format(
+                    code, status_line[-1])))
+                return
+            future.set_result(content)
+
+        def step():
+            sock = state['sock']
+            try:
+                if https and not state.get('handshaked'):
+                    sock.do_handshake()
+                    state['handshaked'] = True
+                if state['out']:
+                    sent = sock.send(state['out'])
+                    state['out'] = state['out'][sent:]
+                    if state['out']:
+                        wait_for(want_read=False)
+                        return
+                while True:
+                    data = sock.recv(65536)
+                    if not data:
+                        done()
+                        return
+                    state['in'].append(data)
+            except ssl.SSLError as exc:
+                if exc.args[0] == ssl.SSL_ERROR_WANT_READ:
+                    wait_for(want_read=True)
+                elif exc.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+                    wait_for(want_read=False)
+                else:
+                    fail(IOError(str(exc)))
+            except socket.error as exc:
+                if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    wait_for(want_read=True)
+                else:
+                    fail(IOError(str(exc)))
+
+        def connected(conn):
+            sock = conn.result
+            if future.done:
+                if not isinstance(sock, int):
+                    sock.close()
+                return
+            if isinstance(sock, int):
+                deadline.cancel()
+                future.set_exception(IOError(os.strerror(sock)))
+                return
+            if https:
+                context = ssl.create_default_context()
+                sock = context.wrap_socket(
+                    sock, server_hostname=host,
+                    do_handshake_on_connect=False
+                )
+            state['sock'] = sock
+            step()
+
+        self.connect(host, port, timeout, addr=addr).add_done_callback(
+            connected)
+        future.add_cancel_callback(close)
+        future.add_cancel_callback(deadline.cancel)
+        return future
@@ -0,0 +1,379 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Redfish backend of the ipmi check for nodes of the Luna groups listed
+in 'redfish: groups'. Power state and health rollup are read from the
+Systems resource over one keep-alive connection per BMC:
+
+    redfish:
+      groups: []
+      verify: false           # check certificates of BMCs
+      max_per_network: 8      # requests at once to BMCs of one network
+      prefix: 24              # length of network prefix of BMCs
+      # session tokens are kept for the next run, '' - sessions
+      # are deleted at exit
+      token_file: /var/cache/trix-status/redfish.json
+
+Sessions are created with the SessionService, a token is used until
+the BMC rejects it.
+'''
+
+
+import fcntl
+import httplib
+import json
+import logging
+import os
+import socket
+import ssl
+import struct
+import tempfile
+import threading
+import urlparse
+
+from trix_status import utils
+
+log = logging.getLogger(__name__)
+
+SYSTEMS = '/redfish/v1/Systems'
+SESSIONS = '/redfish/v1/SessionService/Sessions'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class RedfishError(Exception):
+    pass
+
+
+def network(addr, prefix):
+    """
+    Network of IPv4 address, other addresses are networks of their own
+    """
+    try:
+        packed, = struct.unpack('!I', socket.inet_aton(addr))
+    except socket.error:
+        return addr
+    mask = (0xffffffff << (32 - prefix)) & 0xffffffff
+    return '{}/{}'.format(
+        socket.inet_ntoa(struct.pack('!I', packed & mask)), prefix)
+
+
+def health(system):
+    """
+    Health rollup of the system, 'OK', 'Warning' or 'Critical'
+    """
+    status = system.get('Status') or {}
+    return status.get('HealthRollup') or status.get('Health') or 'OK'
+
+
+class Session(object):
+    """
+    Keep-alive connection and session token for one BMC account,
+    requests are sent one by one
+    """
+
+    def __init__(self, pool, addr, username, password, token=None):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.pool = pool
+        self.addr = addr
+        self.username = username
+        self.password = password
+        # {'token': X-Auth-Token, 'location': path of the session}
+        self.token = token
+        self.lock = threading.Lock()
+        self.conn = None
+        # path of the computer system
+        self.system = None
+
+    def _connect(self, timeout):
+        if self.pool.scheme == 'https':
+            conn = httplib.HTTPSConnection(
+                self.addr, self.pool.port, timeout=timeout,
+                context=self.pool.context)
+        else:
+            conn = httplib.HTTPConnection(
+                self.addr, self.pool.port, timeout=timeout)
+        self.pool.connected(self)
+        return conn
+
+    def _send(self, method, path, body, headers, timeout):
+        """
+        Returns (status, headers, body), connection closed by the BMC
+        between requests is opened again once
+        """
+        for attempt in (0, 1):
+            fresh = self.conn is None
+            if fresh:
+                self.conn = self._connect(timeout)
+            try:
+                if self.conn.sock is not None:
+                    self.conn.sock.settimeout(timeout)
+                self.conn.request(method, path, body, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error, ssl.SSLError) as exc:
+                self.conn.close()
+                self.conn = None
+                if fresh:
+                    raise RedfishError(str(exc) or type(exc).__name__)
+                continue
+            if response.getheader('connection', '').lower() == 'close':
+                self.conn.close()
+                self.conn = None
+            return response.status, response, data
+
+    def _login(self, timeout):
+        status, response, data = self._send(
+            'POST', SESSIONS,
+            json.dumps({'UserName': self.username,
+                        'Password': self.password}),
+            {'Content-Type': 'application/json'}, timeout)
+        if status == 401:
+            raise RedfishError("Wrong password")
+        token = response.getheader('x-auth-token')
+        if status not in (200, 201) or not token:
+            raise RedfishError(
+                "Unable to create session: HTTP {}".format(status))
+        location = response.getheader('location') or ''
+        self.token = {
+            'token': token,
+            'location': urlparse.urlparse(location).path,
+        }
+        self.pool.changed(self)
+
+    def get(self, path, timeout):
+        """
+        JSON resource at path, session is created again if BMC
+        does not accept the token
+        """
+        with self.lock:
+            for attempt in (0, 1):
+                if self.token is None:
+                    self._login(timeout)
+                status, response, data = self._send(
+                    'GET', path, None,
+                    {'X-Auth-Token': self.token['token'],
+                     'Accept': 'application/json'},
+                    timeout)
+                if status == 401 and attempt == 0:
+                    self.log.debug("Session of {} expired".format(self.addr))
+                    self.token = None
+                    continue
+                break
+        if status != 200:
+            raise RedfishError("GET {}: HTTP {}".format(path, status))
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise RedfishError("GET {}: not a JSON answer".format(path))
+
+    def close(self, logout, timeout=5):
+        with self.lock:
+            if logout and self.token is not None and \
+                    self.token['location']:
+                try:
+                    self._send(
+                        'DELETE', self.token['location'], None,
+                        {'X-Auth-Token': self.token['token']}, timeout)
+                except RedfishError:
+                    pass
+                self.token = None
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class RedfishPool(object):
+
+    def __init__(self, scheme='https', port=None, verify=False,
+                 max_per_network=8, prefix=24, token_file=None):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.scheme = scheme
+        self.port = port
+        self.context = None
+        if scheme == 'https':
+            self.context = ssl.create_default_context()
+            if not verify:
+                self.context.check_hostname = False
+                self.context.verify_mode = ssl.CERT_NONE
+        self.max_per_network = max_per_network
+        self.prefix = prefix
+        self.token_file = token_file
+        self.lock = threading.Lock()
+        # (addr, username, password): Session
+        self.sessions = {}
+        # network: semaphore
+        self.networks = {}
+        # 'addr username': token saved by the previous runs
+        self.tokens = {}
+        self.touched = set()
+        self.connections = 0
+
+    def _read(self):
+        try:
+            with open(self.token_file) as f:
+                tokens = json.load(f)
+        except (IOError, OSError) as exc:
+            self.log.debug("No Redfish tokens in {}: {}".format(
+                self.token_file, exc))
+            return {}
+        except ValueError as exc:
+            self.log.warning("Ignore broken Redfish tokens {}: {}".format(
+                self.token_file, exc))
+            return {}
+        if not isinstance(tokens, dict):
+            return {}
+        return tokens
+
+    def load(self):
+        if self.token_file:
+            self.tokens = self._read()
+
+    def save(self):
+        """
+        Only tokens of BMCs used by this process are replaced in the file,
+        it is readable by the owner only
+        """
+        with self.lock:
+            if not self.token_file or not self.touched:
+                return
+            touched = {key: self.tokens.get(key) for key in self.touched}
+            self.touched = set()
+        directory = os.path.dirname(self.token_file) or '.'
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.token_file + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                tokens = self._read()
+                tokens.update(touched)
+                tokens = {k: v for k, v in tokens.items() if v is not None}
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix='.redfish')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(tokens, f, sort_keys=True)
+                os.rename(tmp, self.token_file)
+        except (IOError, OSError) as exc:
+            self.log.warning("Unable to save Redfish tokens to {}: {}".format(
+                self.token_file, exc))
+
+    def connected(self, session):
+        with self.lock:
+            self.connections += 1
+
+    def changed(self, session):
+        key = '{} {}'.format(session.addr, session.username)
+        with self.lock:
+            self.tokens[key] = session.token
+            self.touched.add(key)
+
+    def session(self, addr, username, password):
+        key = (addr, username, password)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                token = self.tokens.get('{} {}'.format(addr, username))
+                session = Session(self, addr, username, password, token)
+                self.sessions[key] = session
+            return session
+
+    def limit(self, addr):
+        net = network(addr, self.prefix)
+        with self.lock:
+            if net not in self.networks:
+                self.networks[net] = threading.BoundedSemaphore(
+                    self.max_per_network)
+            return self.networks[net]
+
+    def system_status(self, addr, username, password, timeout):
+        """
+        Returns (error, power state, health rollup) of the first
+        system of the BMC, power state is 'ON' or 'OFF'
+        """
+        session = self.session(addr, username, password)
+        limit = self.limit(addr)
+        limit.acquire()
+        try:
+            if session.system is None:
+                systems = session.get(SYSTEMS, timeout)
+                members = systems.get('Members') or []
+                if not members:
+                    raise RedfishError("No systems")
+                session.system = members[0]['@odata.id']
+            system = session.get(session.system, timeout)
+            power = (system.get('PowerState') or 'unknown').upper()
+            return None, power, health(system)
+        except RedfishError as exc:
+            return str(exc), None, None
+        except (KeyError, TypeError, AttributeError) as exc:
+            return "Unexpected answer: {}".format(exc), None, None
+        finally:
+            limit.release()
+
+    def close(self):
+        """
+        Tokens are saved for the next run, or sessions are deleted
+        if they are not kept
+        """
+        with self.lock:
+            sessions = self.sessions.values()
+            self.sessions = {}
+        for session in sessions:
+            session.close(logout=not self.token_file)
+        self.save()
+
+
+def groups():
+    return utils.get_config('redfish', {'groups': []})['groups'] or []
+
+
+def backend(group, redfish_groups):
+    """
+    Backend of the ipmi check for nodes of the Luna group,
+    'redfish_groups' is the result of groups()
+    """
+    return 'redfish' if group in redfish_groups else 'ipmi'
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            conf = utils.get_config('redfish', {
+                'verify': False,
+                'max_per_network': 8,
+                'prefix': 24,
+                'token_file': '/var/cache/trix-status/redfish.json',
+            })
+            _pool = RedfishPool(
+                verify=conf['verify'],
+                max_per_network=conf['max_per_network'],
+                prefix=conf['prefix'],
+                token_file=conf['token_file'],
+            )
+            _pool.load()
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
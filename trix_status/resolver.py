@@ -0,0 +1,267 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Name resolution shared by all checks. Every name is looked up once per
+run, the health check, ping, port probes, ssh and BMC probes get the
+address from the cache:
+
+    resolver:
+      native: true    # false - health check runs 'host' as before
+      timeout: 10     # seconds to wait for a lookup
+      ttl: 0          # seconds addresses are kept between runs
+      file: /var/cache/trix-status/resolver.json
+
+Lookups are limited by 'dns' rate limit (see trix_status.ratelimit).
+Names are resolved like any other program does, following nsswitch.conf,
+so /etc/hosts answers before DNS unlike 'host'. The DNS check of nodes
+probed by Luna address still asks DNS only (see 'health: inventory_ip').
+'''
+
+
+import fcntl
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from trix_status import deadline
+
+log = logging.getLogger(__name__)
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def is_address(host):
+    try:
+        socket.inet_aton(host)
+    except (socket.error, TypeError):
+        return False
+    # inet_aton accepts '10.1' and alike
+    return host.count('.') == 3
+
+
+class Resolver(object):
+    """
+    Answers are kept for the lifetime of the object, addresses
+    are saved to 'path' for 'ttl' seconds
+    """
+
+    def __init__(self, ttl=0, path=None, timeout=10):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.timeout = timeout
+        self.ttl = int(ttl or 0)
+        self.path = path
+        self.lock = threading.Lock()
+        # host: (address, error)
+        self.answers = {}
+        # host: event set once the lookup in progress is finished
+        self.lookups = {}
+        # host: [address, resolved at] of the answers to save
+        self.resolved = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (IOError, OSError, ValueError) as exc:
+            self.log.debug("No saved addresses in {}: {}".format(
+                self.path, exc))
+            return {}
+        if not isinstance(saved, dict):
+            return {}
+        return saved
+
+    def load(self):
+        if not self.ttl or not self.path:
+            return
+        now = time.time()
+        for host, answer in self._read().items():
+            try:
+                addr, resolved_at = answer
+                if now - resolved_at < self.ttl:
+                    self.answers[str(host)] = (str(addr), None)
+            except (TypeError, ValueError):
+                continue
+
+    def save(self):
+        """
+        Merge addresses resolved by this process into the file
+        """
+        with self.lock:
+            resolved, self.resolved = self.resolved, {}
+        if not self.ttl or not self.path or not resolved:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                saved = self._read()
+                saved.update(resolved)
+                now = time.time()
+                saved = {
+                    host: answer for host, answer in saved.items()
+                    if now - answer[1] < self.ttl
+                }
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix='.resolver')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(saved, f, sort_keys=True)
+                os.rename(tmp, self.path)
+        except (IOError, OSError) as exc:
+            self.log.warning("Unable to save addresses to {}: {}".format(
+                self.path, exc))
+
+    def cached(self, host):
+        """
+        Address of the host if it is already known, otherwise None
+        """
+        with self.lock:
+            return self.answers.get(host, (None, None))[0]
+
+    def lookup(self, host):
+        """
+        Returns (address, error), error is socket.error of the
+        failed lookup. Concurrent lookups of a host wait for the first
+        """
+        if is_address(host):
+            return host, None
+        with self.lock:
+            if host in self.answers:
+                return self.answers[host]
+            waiting = host in self.lookups
+            if not waiting:
+                self.lookups[host] = threading.Event()
+            done = self.lookups[host]
+        if waiting:
+            done.wait()
+            with self.lock:
+                return self.answers[host]
+
+        answer = self.query(host)
+        with self.lock:
+            self.answers[host] = answer
+            if answer[0] is not None:
+                self.resolved[host] = [answer[0], time.time()]
+            del self.lookups[host]
+        done.set()
+        self.log.debug("{} resolved to {}".format(host, answer))
+        return answer
+
+    def query(self, host):
+        """
+        Ask the system resolver bypassing the cache, waiting at most
+        'timeout' seconds and not past the deadline. Returns (address, error)
+        """
+        from trix_status import ratelimit
+        ratelimit.wait('dns')
+        answer = []
+
+        def ask():
+            try:
+                answer.append((socket.gethostbyname(host), None))
+            except (socket.error, UnicodeError) as exc:
+                answer.append((None, exc))
+
+        # gethostbyname can not be interrupted, the thread
+        # is left behind if it does not answer in time
+        thread = threading.Thread(target=ask, name='resolve ' + host)
+        thread.daemon = True
+        thread.start()
+        thread.join(deadline.clamp(self.timeout))
+        if answer:
+            return answer[0]
+        return None, socket.gaierror(
+            socket.EAI_AGAIN, 'Lookup timed out')
+
+    def pin(self, host, addr):
+        """
+        Use 'addr' for the host without asking DNS
+        """
+        with self.lock:
+            self.answers[host] = (addr, None)
+
+    def resolve(self, host):
+        """
+        Returns address of the host, raises socket.error
+        """
+        addr, error = self.lookup(host)
+        if error is not None:
+            raise error
+        return addr
+
+    def lookup_all(self, hosts):
+        """
+        Look up all hosts at once using scheduler workers.
+        Returns list of (address, error)
+        """
+        from trix_status.scheduler import get_scheduler
+        return get_scheduler().map('resolve', self.lookup, hosts)
+
+
+def get_resolver():
+    """
+    Returns process-wide resolver configured by 'resolver' section
+    """
+    global _resolver
+    # utils imports this module
+    from trix_status.utils import get_config
+    with _resolver_lock:
+        if _resolver is None:
+            conf = get_config('resolver', {
+                'ttl': 0,
+                'file': '/var/cache/trix-status/resolver.json',
+                'timeout': 10,
+            })
+            _resolver = Resolver(conf['ttl'], conf['file'], conf['timeout'])
+            _resolver.load()
+        return _resolver
+
+
+def native():
+    """
+    True if the health check should resolve names in-process
+    """
+    from trix_status.utils import get_config
+    return get_config('resolver', {'native': True})['native']
+
+
+def cached(host):
+    """
+    Address of the host if it was resolved, does not trigger lookup
+    """
+    resolver = _resolver
+    if resolver is None:
+        return None
+    return resolver.cached(host)
+
+
+def save():
+    resolver = _resolver
+    if resolver is not None:
+        resolver.save()
+
+
+def reset():
+    global _resolver
+    with _resolver_lock:
+        _resolver = None
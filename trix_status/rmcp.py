@@ -0,0 +1,219 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+BMC presence scanner. RMCP/ASF Presence Ping is sent to every BMC from
+one UDP socket and Presence Pong is matched by source address and
+message tag. Nodes Status sweeps all BMC addresses at start and the
+ipmi checks wait for the answers of their BMCs, so all BMCs are probed
+within one timeout. Every address is pinged once per run.
+Pings are limited by 'bmc' rate limit (see trix_status.ratelimit).
+'''
+
+
+import errno
+import logging
+import socket
+import struct
+import threading
+import time
+
+from trix_status import ratelimit
+from trix_status.reactor import Reactor
+from trix_status.resolver import is_address
+
+RMCP_PORT = 623
+# RMCP v1.0, no RMCP ACK, ASF class
+RMCP_HEADER = struct.pack('!BBBB', 0x06, 0x00, 0xff, 0x06)
+ASF_IANA = 4542
+PRESENCE_PING = 0x80
+PRESENCE_PONG = 0x40
+# 255 means no answer is expected
+MAX_TAG = 254
+
+_pinger = None
+_pinger_lock = threading.Lock()
+
+
+def presence_ping(tag):
+    return RMCP_HEADER + struct.pack(
+        '!IBBBB', ASF_IANA, PRESENCE_PING, tag, 0, 0)
+
+
+def parse_pong(packet):
+    """
+    Returns message tag of Presence Pong or None
+    """
+    if len(packet) < 12 or packet[:4] != RMCP_HEADER:
+        return None
+    iana, msg_type, tag, _, _ = struct.unpack('!IBBBB', packet[4:12])
+    if iana != ASF_IANA or msg_type != PRESENCE_PONG:
+        return None
+    return tag
+
+
+class Presence(object):
+    """
+    Ping of one BMC. 'rtt' is None if it did not answer
+    """
+
+    def __init__(self, addr, tag, timeout):
+        self.addr = addr
+        self.tag = tag
+        self.timeout = timeout
+        self.sent = None
+        self.timer = None
+        self.callbacks = []
+        self.done = False
+        self.rtt = None
+
+
+class Pinger(object):
+
+    def __init__(self, port=RMCP_PORT):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(0)
+        self.lock = threading.Lock()
+        self.pings = {}
+        self.tag = 0
+        self.reactor = Reactor()
+        self.reactor.add_reader(self.sock.fileno(), self._received)
+        self.thread = threading.Thread(
+            target=self.reactor.run_forever, name="trix-status-rmcp")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def ping(self, addr, timeout, callback=None):
+        """
+        Ping BMC at IPv4 'addr' unless it was pinged already in this run.
+        callback(rtt) is called once the answer is known,
+        rtt is None if there was no answer in 'timeout' seconds
+        """
+        new = False
+        with self.lock:
+            presence = self.pings.get(addr)
+            if presence is None:
+                self.tag = self.tag % MAX_TAG + 1
+                presence = Presence(addr, self.tag, timeout)
+                self.pings[addr] = presence
+                new = True
+            answered = presence.done
+            if callback is not None and not answered:
+                presence.callbacks.append(callback)
+        if callback is not None and answered:
+            callback(presence.rtt)
+        if new:
+            delay = ratelimit.reserve('bmc')
+            self.reactor.call_soon_threadsafe(self._send, presence, delay)
+        return presence
+
+    def sweep(self, targets):
+        """
+        Ping (address, timeout) targets at once without waiting.
+        Names are skipped, they are resolved by the checks
+        """
+        count = 0
+        for addr, timeout in targets:
+            if addr and is_address(addr):
+                self.ping(addr, timeout)
+                count += 1
+        self.log.debug("Sweep of {} BMCs started".format(count))
+
+    def ping_sync(self, addr, timeout):
+        done = threading.Event()
+        result = []
+
+        def callback(rtt):
+            result.append(rtt)
+            done.set()
+
+        self.ping(addr, timeout, callback)
+        # wait with timeout, otherwise KeyboardInterrupt is not delivered
+        while not done.wait(1):
+            pass
+        return result[0]
+
+    def _send(self, presence, delay):
+        if delay > 0:
+            self.reactor.call_later(delay, self._send, presence, 0)
+            return
+        presence.sent = time.time()
+        try:
+            self.sock.sendto(
+                presence_ping(presence.tag), (presence.addr, self.port))
+        except socket.error as exc:
+            self.log.debug("Unable to ping {}: {}".format(presence.addr, exc))
+            self._finish(presence, None)
+            return
+        presence.timer = self.reactor.call_later(
+            presence.timeout, self._finish, presence, None)
+
+    def _received(self):
+        while True:
+            try:
+                packet, (addr, port) = self.sock.recvfrom(512)
+            except socket.error as exc:
+                if exc.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.log.debug("Receive failed: {}".format(exc))
+                return
+            received = time.time()
+            tag = parse_pong(packet)
+            with self.lock:
+                presence = self.pings.get(addr)
+            if tag is None or presence is None or presence.tag != tag:
+                continue
+            if presence.sent is not None:
+                self._finish(presence, received - presence.sent)
+
+    def _finish(self, presence, rtt):
+        with self.lock:
+            if presence.done:
+                return
+            presence.done = True
+            presence.rtt = rtt
+            callbacks, presence.callbacks = presence.callbacks, []
+        if presence.timer is not None:
+            presence.timer.cancel()
+        for callback in callbacks:
+            callback(rtt)
+
+    def close(self):
+        self.reactor.stop()
+        self.thread.join(1)
+        self.sock.close()
+        with self.lock:
+            pending = [p for p in self.pings.values() if not p.done]
+        for presence in pending:
+            self._finish(presence, None)
+
+
+def get_pinger():
+    global _pinger
+    with _pinger_lock:
+        if _pinger is None:
+            _pinger = Pinger()
+        return _pinger
+
+
+def shutdown():
+    global _pinger
+    with _pinger_lock:
+        if _pinger is not None:
+            _pinger.close()
+        _pinger = None
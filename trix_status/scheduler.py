@@ -0,0 +1,256 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import logging
+import threading
+import time
+from collections import deque
+
+from trix_status.utils import get_config
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class Task(object):
+
+    PENDING = 0
+    RUNNING = 1
+    DONE = 2
+
+    def __init__(self, kind, fn, args):
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.state = Task.PENDING
+        self.result = None
+        self.exception = None
+        self.finished = threading.Event()
+        self.callbacks = []
+
+
+class Scheduler(object):
+    """
+    Fixed set of worker threads shared by every check in the process.
+    'fanout' is the number of workers, so it is the upper bound of
+    operations in flight. 'limits' maps task kind (check name,
+    'mount', etc) to the max number of tasks of that kind running
+    at the same time.
+    Workers waiting for the tasks they submitted run them inline,
+    so nested maps never need more threads and never deadlock.
+    """
+
+    def __init__(self, fanout=10, limits=None):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.fanout = max(1, int(fanout))
+        self.limits = limits or {}
+        self.cond = threading.Condition()
+        self.ready = deque()
+        self.deferred = {}
+        self.running = {}
+        self.closed = False
+        self.local = threading.local()
+        self.workers = []
+        self._start_workers(self.fanout)
+        self.log.debug(
+            "Started {} workers, limits: {}".format(self.fanout, self.limits)
+        )
+
+    def _start_workers(self, fanout):
+        for i in range(len(self.workers), fanout):
+            worker = threading.Thread(
+                target=self._worker, name="trix-status-worker-{}".format(i)
+            )
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def grow(self, fanout):
+        """
+        Start more workers if there are less than 'fanout'.
+        Workers are never stopped before close()
+        """
+        with self.cond:
+            if fanout <= self.fanout or self.closed:
+                return
+            self.log.debug(
+                "Grow workers from {} to {}".format(self.fanout, fanout))
+            self.fanout = fanout
+            self._start_workers(fanout)
+
+    def _claim(self, task):
+        # should be called with self.cond acquired
+        limit = self.limits.get(task.kind)
+        running = self.running.get(task.kind, 0)
+        if limit and running >= limit:
+            return False
+        task.state = Task.RUNNING
+        self.running[task.kind] = running + 1
+        return True
+
+    def _next_task(self):
+        # should be called with self.cond acquired
+        while self.ready:
+            task = self.ready.popleft()
+            if task.state != Task.PENDING:
+                # was executed inline by the waiter
+                continue
+            if self._claim(task):
+                return task
+            if task.kind not in self.deferred:
+                self.deferred[task.kind] = deque()
+            self.deferred[task.kind].append(task)
+        return None
+
+    def _release(self, task):
+        # should be called with self.cond acquired
+        self.running[task.kind] -= 1
+        deferred = self.deferred.get(task.kind)
+        while deferred:
+            waiting = deferred.popleft()
+            if waiting.state == Task.PENDING:
+                self.ready.appendleft(waiting)
+                break
+        self.cond.notify_all()
+
+    def _run(self, task):
+        try:
+            task.result = task.fn(*task.args)
+        except Exception as exc:
+            self.log.debug(
+                "Exception in {} task: '{}'".format(task.kind, exc))
+            task.exception = exc
+        with self.cond:
+            task.state = Task.DONE
+            self._release(task)
+        task.finished.set()
+        for callback in task.callbacks:
+            try:
+                callback(task)
+            except Exception as exc:
+                self.log.debug("Exception in callback: '{}'".format(exc))
+
+    def _worker(self):
+        self.local.worker = True
+        while True:
+            with self.cond:
+                task = self._next_task()
+                while task is None and not self.closed:
+                    self.cond.wait()
+                    task = self._next_task()
+            if task is None:
+                return
+            self._run(task)
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """
+        Queue fn(*args) as task of the 'kind'.
+        'callback' keyword is called with the task once it is finished
+        """
+        task = Task(kind, fn, args)
+        if kwargs.get('callback') is not None:
+            task.callbacks.append(kwargs['callback'])
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("Scheduler is closed")
+            self.ready.append(task)
+            self.cond.notify()
+        return task
+
+    def wait(self, task, timeout=None):
+        """
+        Wait for the task and return True if it is finished.
+        Called from a worker thread it executes the pending task inline
+        instead of blocking the worker
+        """
+        if getattr(self.local, 'worker', False):
+            inline = False
+            with self.cond:
+                while task.state == Task.PENDING:
+                    if self._claim(task):
+                        inline = True
+                        break
+                    self.cond.wait()
+            if inline:
+                self._run(task)
+            task.finished.wait()
+            return True
+
+        if timeout is not None:
+            return task.finished.wait(timeout)
+
+        # wait with timeout, otherwise KeyboardInterrupt is not delivered
+        while not task.finished.wait(1):
+            pass
+        return True
+
+    def result(self, task):
+        self.wait(task)
+        if task.exception is not None:
+            raise task.exception
+        return task.result
+
+    def cancel(self, task):
+        """
+        Drop the task if it has not started yet.
+        Returns True if it was dropped
+        """
+        with self.cond:
+            if task.state != Task.PENDING:
+                return False
+            task.state = Task.DONE
+        task.finished.set()
+        return True
+
+    def map(self, kind, fn, items):
+        tasks = [self.submit(kind, fn, item) for item in items]
+        return [self.result(task) for task in tasks]
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        # workers stuck in blocking calls are daemons,
+        # so do not wait for them longer than a second in total
+        until = time.time() + 1
+        for worker in self.workers:
+            if worker is not threading.current_thread():
+                worker.join(max(0, until - time.time()))
+
+
+def get_scheduler(fanout=10):
+    """
+    Returns process-wide scheduler. It is created on first call
+    using 'fanout' and the limits from 'scheduler' section of config
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            conf = get_config('scheduler', {'limits': {}})
+            _scheduler = Scheduler(
+                fanout=fanout, limits=conf['limits'] or {}
+            )
+        return _scheduler
+
+
+def shutdown():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.close()
+        _scheduler = None
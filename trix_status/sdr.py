@@ -0,0 +1,366 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Sensor Data Records of BMCs kept between runs for 'ipmi: sensors'.
+Only threshold sensors of the BMC are kept, with the SDR repository
+timestamps they were read with. The repository is downloaded again
+only if the timestamps change:
+
+    ipmi:
+      sensors: false
+      sdr_file: /var/cache/trix-status/sdr.json
+'''
+
+
+import fcntl
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+
+from trix_status import utils
+
+log = logging.getLogger(__name__)
+
+NETFN_SENSOR = 0x04
+NETFN_STORAGE = 0x0a
+GET_SENSOR_READING = 0x2d
+GET_SDR_REPOSITORY_INFO = 0x20
+RESERVE_SDR_REPOSITORY = 0x22
+GET_SDR = 0x23
+
+# completion code of Get SDR if reservation was lost
+RESERVATION_CANCELLED = 0xc5
+FULL_SENSOR_RECORD = 0x01
+# event/reading type code of threshold sensors
+THRESHOLD = 0x01
+BMC_ADDR = 0x20
+SDR_HEADER = 5
+# bytes of the record read with one Get SDR, some BMCs fail on more
+SDR_CHUNK = 16
+LAST_RECORD = 0xffff
+# Get SDR answers with reservation cancelled before
+# the repository is read anyway
+RESERVATIONS = 3
+
+# bits of the threshold comparison status, the worst first
+THRESHOLDS = [
+    (0x20, 'upper non-recoverable', True),
+    (0x04, 'lower non-recoverable', True),
+    (0x10, 'upper critical', True),
+    (0x02, 'lower critical', True),
+    (0x08, 'upper non-critical', False),
+    (0x01, 'lower non-critical', False),
+]
+
+UNITS = {
+    1: 'C',
+    2: 'F',
+    4: 'V',
+    5: 'A',
+    6: 'W',
+    18: 'RPM',
+    19: 'Hz',
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _signed(value, bits):
+    if value & (1 << (bits - 1)):
+        return value - (1 << bits)
+    return value
+
+
+def reserve(request):
+    response = request(NETFN_STORAGE, RESERVE_SDR_REPOSITORY, '')
+    if response.error is not None or response.code or \
+            len(response.data) < 2:
+        return None
+    return response.data[:2]
+
+
+def read_record(request, reservation, record_id):
+    """
+    Returns (completion code, next record ID, record),
+    completion code is None if BMC did not answer
+    """
+    record = ''
+    length = SDR_HEADER
+    next_id = None
+    while len(record) < length:
+        response = request(
+            NETFN_STORAGE, GET_SDR,
+            reservation + struct.pack(
+                '<HBB', record_id, len(record),
+                min(SDR_CHUNK, length - len(record)))
+        )
+        if response.error is not None or response.code:
+            return response.code, None, None
+        if len(response.data) < 3:
+            return None, None, None
+        next_id, = struct.unpack('<H', response.data[:2])
+        record += response.data[2:]
+        if len(record) >= SDR_HEADER:
+            length = SDR_HEADER + ord(record[4])
+    return 0, next_id, record
+
+
+def download(request):
+    """
+    Threshold sensors from all records of the repository.
+    request(netfn, cmd, data) returns lanplus.Response.
+    Returns None on failure
+    """
+    sensors = []
+    seen = set()
+    reservations = RESERVATIONS
+    reservation = reserve(request)
+    record_id = 0
+    while record_id != LAST_RECORD:
+        if reservation is None:
+            return None
+        code, next_id, record = read_record(request, reservation, record_id)
+        if code == RESERVATION_CANCELLED and reservations:
+            reservations -= 1
+            reservation = reserve(request)
+            continue
+        if code != 0:
+            return None
+        sensor = parse_record(record)
+        if sensor is not None:
+            sensors.append(sensor)
+        seen.add(record_id)
+        if next_id in seen:
+            break
+        record_id = next_id
+    return sensors
+
+
+def repository_stamp(data):
+    """
+    (addition, erase) timestamps from Get SDR Repository Info answer
+    """
+    addition, erase = struct.unpack('<II', data[5:13])
+    return [addition, erase]
+
+
+def parse_record(record):
+    """
+    Returns dict of threshold sensor owned by BMC from Full Sensor
+    Record or None for other records
+    """
+    if len(record) < 48 or ord(record[3]) != FULL_SENSOR_RECORD:
+        return None
+    owner, lun, number = struct.unpack('BBB', record[5:8])
+    if owner != BMC_ADDR or lun & 0x03 or ord(record[13]) != THRESHOLD:
+        return None
+    analog = ord(record[20]) >> 6
+    # no numeric reading
+    if analog == 3:
+        return None
+    m = _signed(ord(record[24]) | (ord(record[25]) & 0xc0) << 2, 10)
+    b = _signed(ord(record[26]) | (ord(record[27]) & 0xc0) << 2, 10)
+    k2 = _signed(ord(record[29]) >> 4, 4)
+    k1 = _signed(ord(record[29]) & 0x0f, 4)
+    name = record[48:48 + (ord(record[47]) & 0x1f)]
+    return {
+        'number': number,
+        'name': name.strip('\0 ').decode('ascii', 'replace'),
+        'analog': analog,
+        'm': m,
+        'b': b,
+        'k1': k1,
+        'k2': k2,
+        'unit': UNITS.get(ord(record[21]), ''),
+    }
+
+
+def convert(sensor, raw):
+    """
+    Reading in units of the sensor, linear sensors only
+    """
+    if sensor['analog'] == 1:
+        raw = _signed(raw, 8)
+        if raw < 0:
+            raw += 1
+    elif sensor['analog'] == 2:
+        raw = _signed(raw, 8)
+    value = (sensor['m'] * raw + sensor['b'] * 10 ** sensor['k1']) * \
+        10.0 ** sensor['k2']
+    return round(value, 3)
+
+
+def check_reading(sensor, data):
+    """
+    Takes Get Sensor Reading answer. Returns (critical, text) if
+    the sensor is out of range, otherwise None
+    """
+    if len(data) < 3:
+        return None
+    reading, flags, status = struct.unpack('BBB', data[:3])
+    # scanning disabled or reading unavailable
+    if not flags & 0x40 or flags & 0x20:
+        return None
+    for bit, threshold, critical in THRESHOLDS:
+        if status & bit:
+            value = convert(sensor, reading)
+            text = "{} {:g}{} above {}" if threshold.startswith('upper') \
+                else "{} {:g}{} below {}"
+            unit = ' ' + sensor['unit'] if sensor['unit'] else ''
+            return critical, text.format(
+                sensor['name'], value, unit, threshold)
+    return None
+
+
+class SDRCache(object):
+
+    def __init__(self, path):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.path = path
+        self.lock = threading.Lock()
+        # BMC address: {'stamp': [addition, erase], 'sensors': [...]}
+        self.repositories = {}
+        self.changed = set()
+        # BMC address: event set once the download in progress is finished
+        self.downloads = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                repositories = json.load(f)
+        except (IOError, OSError) as exc:
+            self.log.debug("No saved SDR in {}: {}".format(self.path, exc))
+            return {}
+        except ValueError as exc:
+            self.log.warning("Ignore broken SDR cache {}: {}".format(
+                self.path, exc))
+            return {}
+        if not isinstance(repositories, dict):
+            return {}
+        return repositories
+
+    def load(self):
+        self.repositories = self._read()
+
+    def get(self, addr, stamp):
+        """
+        Sensors of the BMC if its SDR did not change, otherwise None
+        """
+        with self.lock:
+            repository = self.repositories.get(addr)
+        if repository is None or repository.get('stamp') != stamp:
+            return None
+        return repository['sensors']
+
+    def put(self, addr, stamp, sensors):
+        with self.lock:
+            self.repositories[addr] = {'stamp': stamp, 'sensors': sensors}
+            self.changed.add(addr)
+
+    def sensors(self, addr, request):
+        """
+        Threshold sensors of the BMC, request(netfn, cmd, data) returns
+        lanplus.Response. The repository is downloaded only if it changed
+        since it was cached, concurrent callers for one BMC wait for
+        the first. Returns None on failure
+        """
+        response = request(NETFN_STORAGE, GET_SDR_REPOSITORY_INFO, '')
+        if response.error is not None or response.code or \
+                len(response.data) < 13:
+            return None
+        stamp = repository_stamp(response.data)
+        sensors = self.get(addr, stamp)
+        if sensors is not None:
+            return sensors
+        with self.lock:
+            waiting = addr in self.downloads
+            if not waiting:
+                self.downloads[addr] = threading.Event()
+            done = self.downloads[addr]
+        if waiting:
+            done.wait()
+            return self.get(addr, stamp)
+
+        self.log.debug("Download SDR repository of {}".format(addr))
+        try:
+            sensors = download(request)
+            if sensors is not None:
+                self.put(addr, stamp, sensors)
+        finally:
+            with self.lock:
+                del self.downloads[addr]
+            done.set()
+        return sensors
+
+    def save(self):
+        """
+        Only repositories read by this process are replaced in the file
+        """
+        with self.lock:
+            if not self.changed:
+                return
+            changed = {
+                addr: self.repositories[addr] for addr in self.changed}
+            self.changed = set()
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                repositories = self._read()
+                repositories.update(changed)
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix='.sdr')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(repositories, f, sort_keys=True)
+                os.rename(tmp, self.path)
+        except (IOError, OSError) as exc:
+            self.log.warning("Unable to save SDR to {}: {}".format(
+                self.path, exc))
+
+
+def enabled():
+    return utils.get_config('ipmi', {'sensors': False})['sensors']
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            conf = utils.get_config('ipmi', {
+                'sdr_file': '/var/cache/trix-status/sdr.json',
+            })
+            _cache = SDRCache(conf['sdr_file'])
+            _cache.load()
+        return _cache
+
+
+def save():
+    cache = _cache
+    if cache is not None:
+        cache.save()
+
+
+def reset():
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,399 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+System Event Log of BMCs read incrementally for 'ipmi: sel'.
+The last record ID and its timestamp are kept per BMC, a run reads
+only the entries added after them. Warning and critical events are
+shown for 'sel_hold' seconds after they were found:
+
+    ipmi:
+      sel: false
+      sel_file: /var/cache/trix-status/sel.json
+      sel_hold: 86400
+'''
+
+
+import fcntl
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from trix_status import utils
+
+log = logging.getLogger(__name__)
+
+NETFN_STORAGE = 0x0a
+GET_SEL_INFO = 0x40
+GET_SEL_ENTRY = 0x43
+
+FIRST_RECORD = 0x0000
+LAST_RECORD = 0xffff
+# Get SEL Entry answer if the record does not exist
+NOT_PRESENT = 0xcb
+SYSTEM_EVENT = 0x02
+SEL_ENTRY = 16
+# event/reading type codes
+THRESHOLD = 0x01
+SENSOR_SPECIFIC = 0x6f
+# events of one BMC shown in details, the latest ones
+MAX_EVENTS = 5
+
+# offset of threshold event: (critical, text)
+THRESHOLD_EVENTS = {
+    0x00: (False, 'lower non-critical going low'),
+    0x02: (True, 'lower critical going low'),
+    0x04: (True, 'lower non-recoverable going low'),
+    0x07: (False, 'upper non-critical going high'),
+    0x09: (True, 'upper critical going high'),
+    0x0b: (True, 'upper non-recoverable going high'),
+}
+
+# (sensor type, offset) of sensor-specific event: (critical, text),
+# other events are informational
+SENSOR_EVENTS = {
+    (0x05, 0x00): (False, 'chassis intrusion'),
+    (0x07, 0x00): (True, 'IERR'),
+    (0x07, 0x01): (True, 'thermal trip'),
+    (0x07, 0x08): (False, 'disabled'),
+    (0x08, 0x01): (True, 'failure'),
+    (0x08, 0x02): (False, 'predictive failure'),
+    (0x08, 0x03): (True, 'input lost'),
+    (0x0c, 0x00): (False, 'correctable ECC'),
+    (0x0c, 0x01): (True, 'uncorrectable ECC'),
+    (0x0c, 0x03): (True, 'memory scrub failed'),
+    (0x0c, 0x05): (False, 'correctable ECC logging limit reached'),
+    (0x0d, 0x01): (True, 'drive fault'),
+    (0x0d, 0x02): (False, 'predictive failure'),
+    (0x0f, 0x00): (True, 'firmware error'),
+    (0x10, 0x04): (False, 'SEL full'),
+    (0x13, 0x04): (True, 'PCI PERR'),
+    (0x13, 0x05): (True, 'PCI SERR'),
+    (0x13, 0x07): (False, 'bus correctable error'),
+    (0x13, 0x08): (True, 'bus uncorrectable error'),
+    (0x13, 0x0a): (True, 'bus fatal error'),
+    (0x20, 0x01): (True, 'run-time critical stop'),
+    (0x23, 0x01): (False, 'watchdog hard reset'),
+}
+
+SENSOR_TYPES = {
+    0x01: 'Temperature',
+    0x02: 'Voltage',
+    0x04: 'Fan',
+    0x05: 'Chassis',
+    0x07: 'Processor',
+    0x08: 'Power Supply',
+    0x0c: 'Memory',
+    0x0d: 'Drive',
+    0x0f: 'System Firmware',
+    0x10: 'Event Logging',
+    0x13: 'Critical Interrupt',
+    0x20: 'OS Stop',
+    0x23: 'Watchdog',
+}
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def sel_info(data):
+    """
+    (entries, addition, erase) from Get SEL Info answer
+    """
+    entries, free, addition, erase = struct.unpack('<HHII', data[1:13])
+    return entries, addition, erase
+
+
+def read_entry(request, record_id):
+    """
+    Returns (completion code, next record ID, entry),
+    completion code is None if BMC did not answer
+    """
+    response = request(
+        NETFN_STORAGE, GET_SEL_ENTRY,
+        struct.pack('<HHBB', 0, record_id, 0, 0xff))
+    if response.error is not None:
+        return None, None, None
+    if response.code:
+        return response.code, None, None
+    if len(response.data) < 2 + SEL_ENTRY:
+        return None, None, None
+    next_id, = struct.unpack('<H', response.data[:2])
+    return 0, next_id, response.data[2:2 + SEL_ENTRY]
+
+
+def parse_entry(entry):
+    """
+    Returns (record ID, timestamp)
+    """
+    record_id, record_type, timestamp = struct.unpack('<HBI', entry[:7])
+    return record_id, timestamp
+
+
+def classify(entry):
+    """
+    Returns (critical, text) for warning and critical
+    system events, otherwise None
+    """
+    if ord(entry[2]) != SYSTEM_EVENT:
+        return None
+    sensor_type, number, direction, data1 = struct.unpack(
+        'BBBB', entry[10:14])
+    # deassertion
+    if direction & 0x80:
+        return None
+    event_type = direction & 0x7f
+    offset = data1 & 0x0f
+    if event_type == THRESHOLD:
+        event = THRESHOLD_EVENTS.get(offset)
+    elif event_type == SENSOR_SPECIFIC:
+        event = SENSOR_EVENTS.get((sensor_type, offset))
+    else:
+        event = None
+    if event is None:
+        return None
+    critical, text = event
+    sensor = SENSOR_TYPES.get(
+        sensor_type, 'Sensor type 0x{:02x}'.format(sensor_type))
+    return critical, "{} 0x{:02x} {}".format(sensor, number, text)
+
+
+def walk(request, record_id, entries, after=None):
+    """
+    Entries from record_id to the end of the log, at most 'entries'.
+    Only entries later than timestamp 'after' are returned if given.
+    Returns None on failure
+    """
+    found = []
+    seen = set()
+    while record_id != LAST_RECORD and len(seen) <= entries:
+        code, next_id, entry = read_entry(request, record_id)
+        if code == NOT_PRESENT and not seen:
+            # empty log
+            return found
+        if code != 0:
+            return None
+        seen.add(record_id)
+        if after is None or parse_entry(entry)[1] > after:
+            found.append(entry)
+        if next_id in seen:
+            break
+        record_id = next_id
+    return found
+
+
+class SELLog(object):
+
+    def __init__(self, path, hold=86400):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.path = path
+        self.hold = hold
+        self.lock = threading.Lock()
+        # BMC address: {'addition', 'erase', 'last_id', 'timestamp',
+        #               'events': [[found, critical, text], ...]}
+        self.watermarks = {}
+        self.changed = set()
+        # BMC address: event set once the collection in progress is finished
+        self.collections = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                watermarks = json.load(f)
+        except (IOError, OSError) as exc:
+            self.log.debug("No SEL watermarks in {}: {}".format(
+                self.path, exc))
+            return {}
+        except ValueError as exc:
+            self.log.warning("Ignore broken SEL watermarks {}: {}".format(
+                self.path, exc))
+            return {}
+        if not isinstance(watermarks, dict):
+            return {}
+        return watermarks
+
+    def load(self):
+        self.watermarks = self._read()
+
+    def get(self, addr):
+        with self.lock:
+            return self.watermarks.get(addr)
+
+    def put(self, addr, watermark):
+        with self.lock:
+            self.watermarks[addr] = watermark
+            self.changed.add(addr)
+
+    def held(self, watermark, now=None):
+        """
+        (critical, text) of the events found less than 'hold' ago
+        """
+        if watermark is None:
+            return []
+        now = time.time() if now is None else now
+        return [
+            (critical, text)
+            for found, critical, text in watermark.get('events', [])
+            if now - found < self.hold
+        ]
+
+    def collect(self, request, watermark, entries, addition, erase):
+        """
+        New watermark after reading the entries added since 'watermark'.
+        Returns None on failure
+        """
+        if watermark is None:
+            # the first time only the last entry is read, the events
+            # logged before are not reported
+            code, next_id, last = read_entry(request, LAST_RECORD)
+            if code not in (0, NOT_PRESENT):
+                return None
+            new, events = [], []
+            last_id, timestamp = None, None
+        else:
+            events = list(watermark.get('events', []))
+            last_id = watermark.get('last_id')
+            timestamp = watermark.get('timestamp')
+            if watermark.get('erase') != erase or last_id is None:
+                # the log was cleared, all its entries are new
+                new = walk(request, FIRST_RECORD, entries)
+                last_id, timestamp = None, None
+            else:
+                code, next_id, entry = read_entry(request, last_id)
+                if code == 0 and parse_entry(entry)[1] == timestamp:
+                    new = walk(request, next_id, entries)
+                elif code in (0, NOT_PRESENT):
+                    # the entry was overwritten, the log wrapped
+                    new = walk(request, FIRST_RECORD, entries, after=timestamp)
+                else:
+                    return None
+            if new is None:
+                return None
+            last = new[-1] if new else None
+        if last is not None:
+            last_id, timestamp = parse_entry(last)
+        now = time.time()
+        for entry in new:
+            event = classify(entry)
+            if event is not None:
+                events.append([now, event[0], event[1]])
+        return {
+            'addition': addition,
+            'erase': erase,
+            'last_id': last_id,
+            'timestamp': timestamp,
+            'events': [
+                e for e in events if now - e[0] < self.hold][-MAX_EVENTS:],
+        }
+
+    def events(self, addr, request):
+        """
+        (critical, text) of the warning and critical events of the BMC,
+        request(netfn, cmd, data) returns lanplus.Response. Entries are
+        read only if the log changed since the last run, concurrent
+        callers for one BMC wait for the first. Returns None on failure
+        """
+        response = request(NETFN_STORAGE, GET_SEL_INFO, '')
+        if response.error is not None or response.code or \
+                len(response.data) < 13:
+            return None
+        entries, addition, erase = sel_info(response.data)
+        watermark = self.get(addr)
+        if watermark is not None and watermark.get('addition') == addition \
+                and watermark.get('erase') == erase:
+            return self.held(watermark)
+        with self.lock:
+            waiting = addr in self.collections
+            if not waiting:
+                self.collections[addr] = threading.Event()
+            done = self.collections[addr]
+        if waiting:
+            done.wait()
+            return self.held(self.get(addr))
+
+        self.log.debug("Read new SEL entries of {}".format(addr))
+        try:
+            watermark = self.collect(
+                request, watermark, entries, addition, erase)
+            if watermark is not None:
+                self.put(addr, watermark)
+        finally:
+            with self.lock:
+                del self.collections[addr]
+            done.set()
+        if watermark is None:
+            return None
+        return self.held(watermark)
+
+    def save(self):
+        """
+        Only watermarks of BMCs read by this process are replaced in the file
+        """
+        with self.lock:
+            if not self.changed:
+                return
+            changed = {
+                addr: self.watermarks[addr] for addr in self.changed}
+            self.changed = set()
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                watermarks = self._read()
+                watermarks.update(changed)
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix='.sel')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(watermarks, f, sort_keys=True)
+                os.rename(tmp, self.path)
+        except (IOError, OSError) as exc:
+            self.log.warning("Unable to save SEL watermarks to {}: {}".format(
+                self.path, exc))
+
+
+def enabled():
+    return utils.get_config('ipmi', {'sel': False})['sel']
+
+
+def get_log():
+    global _log
+    with _log_lock:
+        if _log is None:
+            conf = utils.get_config('ipmi', {
+                'sel_file': '/var/cache/trix-status/sel.json',
+                'sel_hold': 86400,
+            })
+            _log = SELLog(conf['sel_file'], conf['sel_hold'])
+            _log.load()
+        return _log
+
+
+def save():
+    sel_log = _log
+    if sel_log is not None:
+        sel_log.save()
+
+
+def reset():
+    global _log
+    with _log_lock:
+        _log = None
@@ -0,0 +1,225 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Pool of ssh ControlMaster connections, one per host, so remote
+commands skip TCP and key exchange:
+
+    ssh:
+      multiplex: true
+      max_masters: 256
+      persist: 0    # seconds masters live after the run, 0 - closed at exit
+
+Master is started with the first command for the host and the command
+itself does not wait for it: until the control socket appears ssh
+connects directly. Masters have no pipes to the tool, otherwise
+reading output of the first command would wait for the master to exit.
+'''
+
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import socket
+import stat
+import subprocess as sp
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+# unix socket path is limited to 108 bytes, ssh adds a random
+# suffix of 17 characters to the path for the master socket
+MAX_SOCKET_PATH = 80
+
+_pool = None
+_disabled = False
+_pool_lock = threading.Lock()
+
+
+def _socket_alive(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def _private_dir(path):
+    """
+    Creates directory 'path' if it does not exist. Returns True if it
+    is a directory (not a symlink) owned by us and closed for others,
+    so sockets in it can be trusted
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            log.debug("Unable to create {}: {}".format(path, exc))
+            return False
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(st.st_mode) and st.st_uid == os.geteuid()
+        and not st.st_mode & 0o077
+    )
+
+
+class SSHPool(object):
+
+    def __init__(self, max_masters=256, persist=0, control_dir=None):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.max_masters = int(max_masters)
+        self.persist = int(persist or 0)
+        self.lock = threading.Lock()
+        self.masters = {}
+        self.closed = False
+        if self.persist:
+            # sockets have to be found by the next run
+            self.control_dir = control_dir or os.path.join(
+                tempfile.gettempdir(),
+                "trix-status-ssh-{}".format(os.geteuid())
+            )
+            if not _private_dir(self.control_dir):
+                # other users could plant sockets there
+                self.log.warning(
+                    "{} is not a private directory, ssh masters are not "
+                    "kept between runs".format(self.control_dir))
+                self.control_dir = tempfile.mkdtemp(prefix="trix-ssh-")
+        else:
+            self.control_dir = tempfile.mkdtemp(prefix="trix-ssh-")
+
+    def control_path(self, host):
+        path = os.path.join(self.control_dir, host)
+        if len(path) > MAX_SOCKET_PATH:
+            path = os.path.join(
+                self.control_dir, hashlib.md5(host).hexdigest()[:16])
+        return path
+
+    def options(self, host, timeout):
+        """
+        ssh options to use the master for the host.
+        Empty if the host is over max_masters
+        """
+        with self.lock:
+            if self.closed:
+                return []
+            if host not in self.masters:
+                if len(self.masters) >= self.max_masters:
+                    return []
+                self.masters[host] = self._start_master(host, timeout)
+        return [
+            '-o', 'ControlMaster=no',
+            '-o', 'ControlPath={}'.format(self.control_path(host)),
+        ]
+
+    def _start_master(self, host, timeout):
+        # should be called with self.lock acquired
+        from trix_status.utils import resolved_host_options
+        path = self.control_path(host)
+        if self.persist and os.path.exists(path):
+            # left by the previous run
+            if _socket_alive(path):
+                return None
+            os.unlink(path)
+        cmd = [
+            'ssh', '-M', '-N',
+            '-o', 'ControlPath={}'.format(path),
+            '-o', 'ConnectTimeout={}'.format(timeout),
+            '-o', 'StrictHostKeyChecking=no',
+            '-o', 'BatchMode=yes',
+            # do not multiplex commands over a dead connection for long
+            '-o', 'ServerAliveInterval=5',
+            '-o', 'ServerAliveCountMax=2',
+        ]
+        cmd += resolved_host_options(host)
+        if self.persist:
+            cmd += ['-f', '-o', 'ControlPersist={}'.format(self.persist)]
+        cmd.append(host)
+        self.log.debug("Start ssh master: '{}'".format(cmd))
+        try:
+            with open(os.devnull, 'r+') as devnull:
+                return sp.Popen(
+                    cmd, stdin=devnull, stdout=devnull, stderr=devnull,
+                    close_fds=True
+                )
+        except OSError as exc:
+            self.log.debug("Unable to start ssh master for {}: {}".format(
+                host, exc))
+            return None
+
+    def close(self):
+        """
+        Stop masters, unless they should persist
+        """
+        with self.lock:
+            self.closed = True
+            masters, self.masters = self.masters, {}
+        for host, proc in masters.items():
+            if proc is None:
+                continue
+            if self.persist:
+                # with -f it exits once connected, reap it
+                proc.poll()
+                continue
+            if proc.poll() is None:
+                proc.terminate()
+        for host, proc in masters.items():
+            if proc is not None and not self.persist:
+                proc.wait()
+        if not self.persist:
+            shutil.rmtree(self.control_dir, ignore_errors=True)
+        self.log.debug("Closed {} ssh masters".format(len(masters)))
+
+
+def get_pool():
+    """
+    Returns process-wide pool or None if multiplexing is disabled
+    """
+    global _pool, _disabled
+    # utils imports this module
+    from trix_status.utils import get_config
+    with _pool_lock:
+        if _pool is None and not _disabled:
+            conf = get_config('ssh', {
+                'multiplex': True,
+                'max_masters': 256,
+                'persist': 0,
+                'control_dir': None,
+            })
+            if not conf['multiplex']:
+                _disabled = True
+                return None
+            _pool = SSHPool(
+                conf['max_masters'], conf['persist'], conf['control_dir'])
+        return _pool
+
+
+def shutdown():
+    global _pool, _disabled
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+        _disabled = False
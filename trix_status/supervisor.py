@@ -0,0 +1,140 @@
+'''
+Created by ClusterVision <infonl@clustervision.com>
+This file is part of trix-status tool
+https://github.com/clustervision/trix-status
+trix-status is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+trix-status is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import logging
+import threading
+
+from reactor import Reactor, Future
+from forkserver import ForkServer
+import hedging
+
+_supervisor = None
+_forkserver = None
+_supervisor_lock = threading.Lock()
+
+
+class Supervisor(object):
+    """
+    Runs every subprocess of the blocking code paths.
+    One 'reaper' thread owns a reactor which reads the pipes,
+    collects exit codes and kills expired commands from a single
+    timer heap, so no thread or timer per command is needed.
+    With 'forkserver' commands are spawned by the helper process
+    """
+
+    def __init__(self, forkserver=None):
+        module_name = self.__module__ + "." + type(self).__name__
+        self.log = logging.getLogger(module_name)
+        self.reactor = Reactor()
+        self.spawn = self.reactor.run_process
+        if forkserver is not None:
+            forkserver.attach(self.reactor)
+            self.spawn = forkserver.run_process
+        self.thread = threading.Thread(
+            target=self.reactor.run_forever, name="trix-status-reaper"
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, cmd, timeout=30, input=None, callback=None,
+               probe=None):
+        """
+        Returns future for reactor.CommandResult.
+        Future is resolved and should be cancelled in the reaper thread,
+        'callback' is called there as well.
+        Commands with 'probe' type are hedged
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        def start():
+            if future.done:
+                return
+            if probe is not None:
+                process = hedging.hedge(
+                    self.reactor, lambda t: self.spawn(cmd, t, input),
+                    timeout, probe
+                )
+            else:
+                process = self.spawn(cmd, timeout, input)
+            future.add_cancel_callback(process.cancel)
+            process.add_done_callback(
+                lambda p: future.set_result(p.result))
+
+        self.reactor.call_soon_threadsafe(start)
+        return future
+
+    def cancel(self, future):
+        self.reactor.call_soon_threadsafe(future.cancel)
+
+    def run(self, cmd, timeout=30, input=None, probe=None):
+        """
+        Blocks until cmd is finished or killed by timeout.
+        Returns reactor.CommandResult
+        """
+        finished = threading.Event()
+        future = self.submit(
+            cmd, timeout, input, callback=lambda f: finished.set(),
+            probe=probe
+        )
+        if threading.current_thread().name != 'MainThread':
+            # timed wait of python 2 is polling, avoid it in workers
+            finished.wait()
+            return future.result
+        # wait with timeout, otherwise KeyboardInterrupt is not delivered
+        while not finished.wait(1):
+            pass
+        return future.result
+
+    def close(self):
+        self.reactor.stop()
+        self.thread.join(1)
+
+
+def start_forkserver():
+    """
+    Should be called before any thread is started
+    """
+    global _forkserver
+    with _supervisor_lock:
+        if _forkserver is None and _supervisor is None:
+            _forkserver = ForkServer()
+            _forkserver.start()
+
+
+def forkserver_started():
+    return _forkserver is not None
+
+
+def get_supervisor():
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = Supervisor(forkserver=_forkserver)
+        return _supervisor
+
+
+def shutdown():
+    global _supervisor, _forkserver
+    with _supervisor_lock:
+        if _supervisor is not None:
+            _supervisor.close()
+        if _forkserver is not None:
+            _forkserver.close()
+        _supervisor = None
+        _forkserver = None
@@ -17,43 +17,63 @@ along with slurm_health_checker.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
 import logging
-import subprocess as sp
+import pipes
 import config
 import yaml
 import os
-from threading import Timer
+import deadline
+import sshpool
+import resolver
+from supervisor import get_supervisor
 
 log = logging.getLogger("trix-status")
 
 
-def run_cmd(cmd, timeout=30):
+def run_cmd(cmd, timeout=30, input=None, probe=None):
     """
     Returns 'rc', 'stdout', 'stderr', 'exception'
-    Where 'exception' is a content of Python exception if any
+    Where 'exception' is a content of Python exception if any.
+    'cmd' should be a list of arguments, it is executed without shell.
+    Returned tuple has 'wall_time' and 'timed_out' attributes.
+    With 'probe' the command can be hedged (see trix_status.hedging)
     """
-    rc = 255
-    stdout, stderr, exception = "", "", ""
-    try:
-        proc = sp.Popen(
-            cmd, shell=True,
-            stdout=sp.PIPE, stderr=sp.PIPE
-        )
-        timer = Timer(
-            timeout, lambda p: p.kill(), [proc]
-        )
-        try:
-            timer.start()
-            stdout, stderr = proc.communicate()
-        except:
-            log.debug("Timeout executing '{}'".format(cmd))
-        finally:
-            timer.cancel()
+    timeout = deadline.clamp(timeout)
+    result = get_supervisor().run(
+        cmd, timeout=timeout, input=input, probe=probe)
+    if result.timed_out:
+        log.debug("Timeout executing '{}'".format(cmd))
+    return result
+
 
-        proc.wait()
-        rc = proc.returncode
-    except Exception as e:
-        exception = e
-    return rc, stdout, stderr, exception
+def resolved_host_options(host):
+    """
+    ssh options to connect to the cached address of the host,
+    known_hosts entries are still looked up by the name
+    """
+    addr = resolver.cached(host)
+    if addr is None or addr == host:
+        return []
+    return [
+        '-o', 'HostName={}'.format(addr),
+        '-o', 'HostKeyAlias={}'.format(host),
+    ]
+
+
+def ssh_cmd(host, argv, timeout=10):
+    """
+    Returns arguments to run 'argv' on the remote host.
+    Remote side passes command to the shell, so every argument is quoted.
+    Connection is shared with other commands if possible (see sshpool),
+    address resolved before is used instead of the name
+    """
+    pool = sshpool.get_pool()
+    options = pool.options(host, timeout) if pool is not None else []
+    return [
+        'ssh', '-o', 'ConnectTimeout={}'.format(timeout),
+        '-o', 'StrictHostKeyChecking=no'
+    ] + options + resolved_host_options(host) + [
+        host, ' '.join([pipes.quote(arg) for arg in argv])
+    ]
 
 
 def parse_arguments():
@@ -94,6 +114,15 @@ def parse_arguments():
         'no_table': False,
         'no_statusbar': False,
         'verbose': False,
+        'engine': 'threads',
+        'forkserver': False,
+        'deadline': 0,
+        'adaptive_fanout': False,
+        'hedge': False,
+        'adaptive_timeout': False,
+        'delegate': False,
+        'processes': 1,
+        'pipeline': False,
     }
 
     defaults = get_config('cli', defaults)
@@ -157,12 +186,75 @@ def parse_arguments():
         help="Number of checks running simultaneously"
     )
 
+    parser.add_argument(
+        "--adaptive-fanout", action="store_true",
+        default=defaults['adaptive_fanout'],
+        help=(
+            "Start with '--fanout' checks and tune the number from "
+            + "observed latency and errors"
+        )
+    )
+
+    parser.add_argument(
+        "--engine", choices=config.available_engines,
+        default=defaults['engine'],
+        help=(
+            "How checks are executed: 'threads' - one worker thread per "
+            + "running check, 'events' - all checks in one event loop"
+        )
+    )
+
+    parser.add_argument(
+        "--forkserver", action="store_true",
+        default=defaults['forkserver'],
+        help=(
+            "Spawn commands from a small helper process started "
+            + "before any threads. Keeps spawning cheap at high fanout"
+        )
+    )
+
+    parser.add_argument(
+        "--hedge", action="store_true",
+        default=defaults['hedge'],
+        help=(
+            "Start a second ssh or ping probe if the first did not "
+            + "answer after p95 latency of the probes. First answer wins"
+        )
+    )
+
+    parser.add_argument(
+        "--pipeline", action="store_true",
+        default=defaults['pipeline'],
+        help=(
+            "Run health check stage by stage for all nodes at once: "
+            + "resolve, ping, ssh port, ssh, mounts"
+        )
+    )
+
     parser.add_argument(
         "--timeout", "-t", type=int,
         default=defaults['timeout'],
         help="Timeout for running checks"
     )
 
+    parser.add_argument(
+        "--adaptive-timeout", action="store_true",
+        default=defaults['adaptive_timeout'],
+        help=(
+            "Use p99 of the latency of previous runs times factor as "
+            + "timeout of node probes. '--timeout' is the upper limit"
+        )
+    )
+
+    parser.add_argument(
+        "--deadline", type=int,
+        default=defaults['deadline'],
+        help=(
+            "Wall-clock budget for the whole run in seconds. Checks "
+            + "unfinished by then are killed and shown as TIMEOUT"
+        )
+    )
+
     parser.add_argument(
         "--show-only-green", "-G", action="store_true",
         default=defaults['show_only_green'],
@@ -204,6 +296,53 @@ def parse_arguments():
         help="Disable ASCII graphics"
     )
 
+    parser.add_argument(
+        "--json", action="store_true",
+        default=False,
+        help=(
+            "Machine-readable output: one JSON object with answers "
+            + "of the checks per line"
+        )
+    )
+
+    parser.add_argument(
+        "--node-list", type=str, metavar="FILE",
+        help=(
+            "Read nodes as JSON list from FILE ('-' for stdin) "
+            + "instead of Luna. Used by delegates"
+        )
+    )
+
+    parser.add_argument(
+        "--processes", "-P", type=int,
+        default=defaults['processes'],
+        help=(
+            "Split nodes between this number of worker processes, "
+            + "each with its own '--fanout'"
+        )
+    )
+
+    parser.add_argument(
+        "--delegate", action="store_true",
+        default=defaults['delegate'],
+        help=(
+            "Check nodes of the groups listed in 'delegation' section "
+            + "of the config by running trix-status on their delegates"
+        )
+    )
+
+    parser.add_argument(
+        "--no-delegate", action="store_false", dest="delegate",
+        help="Check all nodes here even if 'cli: delegate' is set"
+    )
+
+    # worker process started for '--processes', it never starts
+    # shards or delegates of its own
+    parser.add_argument(
+        "--shard", action="store_true", default=False,
+        help=argparse.SUPPRESS
+    )
+
     parser.add_argument(
         "--no-statusbar", action="store_true",
         default=defaults['no_statusbar'],